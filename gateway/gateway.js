@@ -144,9 +144,14 @@ async function getLeastConnectionsService(serviceKey) {
     let leastConnectionsService = null;
     let leastConnectionsCount = Infinity;
 
+    // in-flight requests reported in the heartbeats of the replicas, which also count
+    // the requests that did not come through this gateway
+    const reportedLoads = await redisClient.hGetAll(`${serviceKey}:load`);
+
     for (const service of services) {
         const connectionCountKey = `${serviceKey}:${service}:connections`;
-        const connectionCount = Number(await redisClient.get(connectionCountKey)) || 0;
+        const reportedInFlight = reportedLoads[service] ? Number(JSON.parse(reportedLoads[service]).inFlight) || 0 : 0;
+        const connectionCount = Math.max(Number(await redisClient.get(connectionCountKey)) || 0, reportedInFlight);
 
         if (connectionCount < leastConnectionsCount) {
             leastConnectionsCount = connectionCount;
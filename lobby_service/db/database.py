@@ -1,6 +1,8 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
 from sqlalchemy.orm import sessionmaker, declarative_base
+from utils.metrics import db_query_duration
 
+import time
 import os
 
 DATABASE_URL = os.getenv("DATABASE_URL")
@@ -8,12 +10,34 @@ DATABASE_URL = os.getenv("DATABASE_URL")
 if DATABASE_URL is None:
     DATABASE_URL = "postgresql://test:1234"
 
-engine = create_engine(DATABASE_URL, echo=True)
+DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', 5))
+DB_MAX_OVERFLOW = int(os.getenv('DB_MAX_OVERFLOW', 10))
+
+engine = create_engine(DATABASE_URL, echo=True, pool_size=DB_POOL_SIZE, max_overflow=DB_MAX_OVERFLOW)
+
+
+# the lobby service only talks to a single master
+@event.listens_for(engine, "before_cursor_execute")
+def before_cursor_execute(connection, cursor, statement, parameters, context, executemany):
+    connection.info['query_started_at'] = time.perf_counter()
+
+
+@event.listens_for(engine, "after_cursor_execute")
+def after_cursor_execute(connection, cursor, statement, parameters, context, executemany):
+    started_at = connection.info.pop('query_started_at', None)
+
+    if started_at is not None:
+        db_query_duration.observe(time.perf_counter() - started_at, 'master')
+
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 Base = declarative_base()
 
+def pool_saturation():
+    return engine.pool.checkedout() / (DB_POOL_SIZE + DB_MAX_OVERFLOW)
+
+
 def get_db():
     db = SessionLocal()
     try:
@@ -4,6 +4,6 @@ sleep 4
 
 python -m db.init_db
 
-python ./grpc/register_service.py
+export UVICORN_HOST=0.0.0.0 UVICORN_PORT=8000 UVICORN_RELOAD=false
 
-exec uvicorn main:app --host 0.0.0.0 --port 8000
\ No newline at end of file
+exec python server.py
\ No newline at end of file
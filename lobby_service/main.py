@@ -1,12 +1,38 @@
 from fastapi import FastAPI
+from contextlib import asynccontextmanager
 from routes import router
+from utils.redis_cache import cache_invalidation_listener, connect_redis_client, close_redis_client
+from utils.rabbitmq import rabbitmq
+from utils.chat_backbone import chat_backbone
+from utils.http_client import http_client
+from utils.service_discovery import bookings_discovery
+from utils.service_registry import load_tracker, service_registry
 from middleware.timeout_middleware import TimeoutMiddleware
+from middleware.load_middleware import LoadMiddleware
 from middleware.logging_middleware import LoggingMiddleware
 from utils.logging_config import setup_logging
 
-import uvicorn
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    connect_redis_client()
+    cache_invalidation_listener.start()
+    await rabbitmq.start()
+    await chat_backbone.start()
+    await http_client.start()
+    await bookings_discovery.start()
+    await service_registry.start()
+    yield
+    await service_registry.stop()
+    await bookings_discovery.stop()
+    await http_client.stop()
+    await chat_backbone.stop()
+    await rabbitmq.stop()
+    cache_invalidation_listener.stop()
+    close_redis_client()
+
+
+app = FastAPI(lifespan=lifespan)
 
 logger = setup_logging()
 
@@ -14,7 +40,6 @@ app.include_router(router)
 
 app.middleware("http")(TimeoutMiddleware(app, 5))
 
-app.add_middleware(LoggingMiddleware, logger=logger)
+app.middleware("http")(LoadMiddleware(load_tracker))
 
-if __name__ == "__main__":
-    uvicorn.run("main:app", host="127.0.0.1", port=9000, reload=True)
+app.add_middleware(LoggingMiddleware, logger=logger)
@@ -3,10 +3,10 @@ from db.models import Lobby
 from db.schemas import LobbyBaseDto, LobbyInfoDto
 from db.database import get_db
 from sqlalchemy.orm import Session
-from utils.redis_cache import get_redis_client
+from utils.redis_cache import CacheBatch, get_redis_client, get_cached_list, get_cached_entity, cache_entity, \
+    cache_missing_entity, MISSING_ENTITY
 
 import redis
-import json
 
 
 class LobbyManager:
@@ -29,29 +29,38 @@ class LobbyManager:
         self.db.commit()
         self.db.refresh(db_lobby)
 
-        self.redis_cache.delete('lobbies')
+        with CacheBatch(self.redis_cache) as cache_batch:
+            cache_batch.invalidate_list_cache('lobbies')
+            cache_batch.cache_entity(f"lobby:{db_lobby.id}", LobbyInfoDto.model_validate(db_lobby).model_dump())
 
         return db_lobby.id
 
     def get_all(self):
-        cached_lobbies = self.redis_cache.get("lobbies")
-
-        if cached_lobbies:
-            return json.loads(cached_lobbies)
-        else:
-            lobbies = self.db.query(Lobby).all()
-            lobby_dtos = [LobbyInfoDto.model_validate(
-                lobby) for lobby in lobbies]
-            self.redis_cache.setex(name="lobbies", time=120, value=json.dumps(
-                [lobby.model_dump() for lobby in lobby_dtos]))
-            return lobby_dtos
+        return get_cached_list(self.redis_cache, 'lobbies', {}, self.query_all)
+
+    def query_all(self):
+        lobbies = self.db.query(Lobby).all()
+        return {
+            "items": [LobbyInfoDto.model_validate(lobby).model_dump() for lobby in lobbies],
+            "next_cursor": None
+        }
 
     def get_by_id(self, lobby_id: int):
+        cached_lobby = get_cached_entity(self.redis_cache, f"lobby:{lobby_id}")
+
+        if cached_lobby == MISSING_ENTITY:
+            raise HTTPException(status_code=404, detail="Lobby not found")
+        if cached_lobby is not None:
+            return cached_lobby
+
         db_lobby = self.db.query(Lobby).filter(Lobby.id == lobby_id).first()
 
         if db_lobby is None:
+            cache_missing_entity(self.redis_cache, f"lobby:{lobby_id}")
             raise HTTPException(status_code=404, detail="Lobby not found")
 
+        cache_entity(self.redis_cache, f"lobby:{lobby_id}", LobbyInfoDto.model_validate(db_lobby).model_dump())
+
         return db_lobby
 
     def delete(self, lobby_id: int):
@@ -64,7 +73,9 @@ class LobbyManager:
         self.db.delete(db_lobby)
         self.db.commit()
 
-        self.redis_cache.delete('lobbies')
+        with CacheBatch(self.redis_cache) as cache_batch:
+            cache_batch.invalidate_list_cache('lobbies')
+            cache_batch.evict_entities(f"lobby:{lobby_id}")
 
         return db_lobby.id
 
@@ -0,0 +1,28 @@
+from fastapi import Request
+from utils.metrics import http_request_duration
+from utils.service_registry import LoadTracker
+import time
+
+
+class LoadMiddleware:
+
+    def __init__(self, load: LoadTracker):
+        self.load = load
+
+    async def __call__(self, request: Request, call_next):
+        started_at = time.perf_counter()
+        self.load.request_started()
+        status_code = 500
+
+        try:
+            response = await call_next(request)
+            status_code = response.status_code
+            return response
+        finally:
+            latency = time.perf_counter() - started_at
+            self.load.request_finished(latency)
+
+            # the route template keeps the label set bounded, ids in the path would not
+            route = request.scope.get("route")
+            http_request_duration.observe(latency, request.method, route.path if route is not None else "<unmatched>",
+                                          str(status_code))
@@ -1,21 +1,30 @@
-from fastapi import APIRouter, Depends, HTTPException, WebSocket, WebSocketDisconnect
-from fastapi.responses import JSONResponse
-from typing import List
+from fastapi import APIRouter, Depends, Header, HTTPException, WebSocket, WebSocketDisconnect
+from fastapi.responses import JSONResponse, Response
+from typing import List, Optional
 from db.models import Lobby
 from db.schemas import LobbyBaseDto, LobbyInfoDto, BookingDto
 from db.database import get_db
 from sqlalchemy.orm import Session
-from utils.rabbitmq import RabbitMQ, get_rabbitmq
+from utils.rabbitmq import rabbitmq
+from utils.chat_backbone import chat_backbone
+from utils.lobby_connection import (LobbyConnection, LOBBY_BATCH_SUBPROTOCOL, WS_BATCH_MAX_MESSAGES, broadcast_stats,
+                                    get_frame_stats, lobby_frame_stats)
 from management.lobby_manager import LobbyManager, get_lobby_manager
+from utils.local_cache import local_cache
+from utils.redis_cache import redis_tier_stats, page_response
+from utils.http_client import http_client
+from utils.service_discovery import bookings_discovery
+from utils.booking_intake import BOOKING_INTAKE_MODE, enqueue_booking, get_ticket
+from utils.metrics import metrics
 
 import asyncio
-import threading
-import requests
+import httpx
 import os
 
 router = APIRouter()
 
-BOOKINGS_SERVICE_URL = os.getenv("BOOKINGS_SERVICE_URL")
+# optional second upstream the booking is hedged to
+BOOKINGS_HEDGE_URL = os.getenv("BOOKINGS_HEDGE_URL")
 
 
 @router.get("/status")
@@ -23,14 +32,41 @@ def status():
     return JSONResponse(content={"status": "OK", "message": "Lobby service is running"})
 
 
+@router.get("/cache/stats")
+def cache_stats():
+    return {"local": local_cache.snapshot(), "redis": redis_tier_stats.snapshot()}
+
+
+@router.get("/metrics")
+async def prometheus_metrics():
+    # async, so the threadpool gauges are read from the event loop
+    return Response(content=metrics.render(), media_type="text/plain; version=0.0.4")
+
+
+@router.get("/events/stats")
+def event_stats():
+    return rabbitmq.snapshot()
+
+
+@router.get("/chat/stats")
+def chat_stats():
+    return {**chat_backbone.snapshot(), "sockets": broadcast_stats.snapshot(),
+            "lobbies": {lobby_id: stats.snapshot() for lobby_id, stats in list(lobby_frame_stats.items())}}
+
+
+@router.get("/http/stats")
+def http_stats():
+    return {**http_client.snapshot(), "discovery": bookings_discovery.snapshot()}
+
+
 @router.post("/lobbies")
 def create_lobby(lobby: LobbyBaseDto, lobby_manager: LobbyManager = Depends(get_lobby_manager)):
     return lobby_manager.create(lobby)
 
 
 @router.get("/lobbies", response_model=List[LobbyInfoDto])
-def get_all_lobbies(lobby_manager: LobbyManager = Depends(get_lobby_manager)):
-    return lobby_manager.get_all()
+def get_all_lobbies(if_none_match: Optional[str] = Header(None), lobby_manager: LobbyManager = Depends(get_lobby_manager)):
+    return page_response(lobby_manager.get_all(), if_none_match)
 
 
 @router.get("/lobbies/{lobby_id}", response_model=LobbyInfoDto)
@@ -43,12 +79,8 @@ def delete_lobby_by_id(lobby_id: int, lobby_manager: LobbyManager = Depends(get_
     return lobby_manager.delete(lobby_id)
 
 
-active_connections = {}
-
-
 @router.websocket("/lobbies/ws/{lobby_id}")
-async def websocket_lobby(websocket: WebSocket, lobby_id: int, db: Session = Depends(get_db),
-                          rabbitmq: RabbitMQ = Depends(get_rabbitmq)):
+async def websocket_lobby(websocket: WebSocket, lobby_id: int, db: Session = Depends(get_db)):
     lobby = db.query(Lobby).filter(Lobby.train_id == lobby_id).first()
 
     if lobby is None:
@@ -56,55 +88,61 @@ async def websocket_lobby(websocket: WebSocket, lobby_id: int, db: Session = Dep
         raise HTTPException(
             status_code=404, detail="Lobby for this train not found")
 
-    await websocket.accept()
-
-    welcome_message = f"Welcome to the train lobby {lobby_id}!"
-    await websocket.send_text(welcome_message)
+    # batching is opt-in, only clients that offer the subprotocol can read a frame of several messages
+    batched = LOBBY_BATCH_SUBPROTOCOL in websocket.scope.get('subprotocols', [])
+    await websocket.accept(subprotocol=LOBBY_BATCH_SUBPROTOCOL if batched else None)
 
-    if lobby_id not in active_connections:
-        active_connections[lobby_id] = []
-    active_connections[lobby_id].append(websocket)
+    def unsubscribe():
+        chat_backbone.unsubscribe(lobby_id, connection.send)
+        rabbitmq.unsubscribe(str(lobby_id), connection.send)
 
-    loop = asyncio.get_event_loop()
+    connection = LobbyConnection(websocket, on_close=unsubscribe, frame_stats=get_frame_stats(lobby_id),
+                                 batch_size=WS_BATCH_MAX_MESSAGES if batched else 1)
+    connection.start()
 
-    async def broadcast_message_to_lobby(message: str):
-        for connection in active_connections[lobby_id]:
-            await connection.send_text(message)
-
-    def rabbitmq_callback(message: str):
-        asyncio.run_coroutine_threadsafe(
-            broadcast_message_to_lobby(message), loop)
+    welcome_message = f"Welcome to the train lobby {lobby_id}!"
+    await connection.send(welcome_message)
 
-    thread = threading.Thread(target=rabbitmq.consume_messages, args=(
-        str(lobby_id), rabbitmq_callback), daemon=True)
-    thread.start()
+    # train events reach this socket through the consumer shared by the whole process,
+    # chat messages through the backbone shared by all lobby service instances
+    rabbitmq.subscribe(str(lobby_id), connection.send)
+    chat_backbone.subscribe(lobby_id, connection.send)
 
     try:
         while True:
             data = await websocket.receive_text()
-
-            for connection in active_connections[lobby_id]:
-                if connection != websocket:
-                    await connection.send_text(data)
+            await chat_backbone.publish(lobby_id, data, sender=connection.send)
 
     except WebSocketDisconnect:
-        active_connections[lobby_id].remove(websocket)
+        pass
 
-        if len(active_connections[lobby_id]) == 0:
-            del active_connections[lobby_id]
+    finally:
+        await connection.close()
 
 
 @router.post("/start-booking")
-def start_booking_registration(booking: BookingDto):
+async def start_booking_registration(booking: BookingDto):
+    if BOOKING_INTAKE_MODE == 'queue':
+        return await enqueue_booking(booking)
+
     try:
-        response = requests.post(BOOKINGS_SERVICE_URL,
-                                 json=booking.model_dump())
-        response.raise_for_status()
+        # straight to a booking replica, through the gateway only when none is known
+        async with bookings_discovery.endpoint() as bookings_url:
+            response = await http_client.post(bookings_url, json=booking.model_dump(), hedge_url=BOOKINGS_HEDGE_URL)
+            response.raise_for_status()
 
         return {"message": "Booking registered successfully", "booking_id": response.content}
 
-    except requests.exceptions.HTTPError:
+    except httpx.HTTPStatusError:
         raise HTTPException(
             status_code=response.status_code, detail=response.text)
+    except (asyncio.TimeoutError, httpx.TimeoutException):
+        raise HTTPException(
+            status_code=504, detail="Booking service did not answer in time")
     except Exception as err:
         raise HTTPException(status_code=500, detail=str(err))
+
+
+@router.get("/start-booking/{ticket_id}")
+def get_booking_ticket(ticket_id: str):
+    return get_ticket(ticket_id)
@@ -0,0 +1,12 @@
+from utils.ws_protocol import LobbyWebSocketProtocol, WS_PER_MESSAGE_DEFLATE
+
+import uvicorn
+import os
+
+
+# started as its own module, running main.py as a script would import the app a second time as main
+if __name__ == "__main__":
+    # the uvicorn CLI only takes the names of the built in protocols, so the tuned one is passed here
+    uvicorn.run("main:app", host=os.getenv('UVICORN_HOST', '127.0.0.1'), port=int(os.getenv('UVICORN_PORT', 9000)),
+                reload=os.getenv('UVICORN_RELOAD', 'true').lower() == 'true',
+                ws=LobbyWebSocketProtocol, ws_per_message_deflate=WS_PER_MESSAGE_DEFLATE)
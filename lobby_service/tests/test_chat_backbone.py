@@ -0,0 +1,55 @@
+import unittest
+from unittest.mock import AsyncMock, MagicMock, patch
+from utils.chat_backbone import RedisChatBackbone
+from utils.redis_cache import INSTANCE_ID
+
+import asyncio
+
+
+class TestRedisChatBackbone(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self.backbone = RedisChatBackbone()
+        self.backbone._loop = asyncio.get_running_loop()
+        self.backbone._dispatcher = asyncio.create_task(self.backbone._dispatch())
+
+        self.sender, self.receiver = AsyncMock(), AsyncMock()
+        self.backbone.subscribe(1, self.sender)
+        self.backbone.subscribe(1, self.receiver)
+
+    async def asyncTearDown(self):
+        await self.backbone.stop()
+
+    async def test_message_is_delivered_locally_and_published_once(self):
+        mock_redis_client = MagicMock()
+
+        with patch('utils.chat_backbone.get_redis_client', return_value=mock_redis_client):
+            await self.backbone.publish(1, "Hello", sender=self.sender)
+
+        self.sender.assert_not_awaited()
+        self.receiver.assert_awaited_once_with("Hello")
+        mock_redis_client.spublish.assert_called_once_with("lobby_chat:{1}", f"{INSTANCE_ID} 1 Hello")
+
+    async def test_remote_message_is_delivered_once_per_origin_sequence(self):
+        self.backbone.handle_message("lobby_chat:{1}", "other-instance 1 Hello there")
+        self.backbone.handle_message("lobby_chat:{1}", "other-instance 1 Hello there")
+        self.backbone.handle_message("lobby_chat:{1}", f"{INSTANCE_ID} 1 Hello")
+        await asyncio.sleep(0.01)
+
+        self.sender.assert_awaited_once_with("Hello there")
+        self.receiver.assert_awaited_once_with("Hello there")
+        self.assertEqual(self.backbone.snapshot()["duplicates"], 1)
+
+    def test_channel_is_subscribed_for_first_and_unsubscribed_after_last_socket(self):
+        self.backbone.unsubscribe(1, self.sender)
+        self.backbone.unsubscribe(1, self.receiver)
+
+        commands = []
+        while not self.backbone._commands.empty():
+            commands.append(self.backbone._commands.get())
+
+        self.assertEqual(commands, [('ssubscribe', "lobby_chat:{1}"), ('sunsubscribe', "lobby_chat:{1}")])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,79 @@
+import unittest
+from websockets.asyncio.client import connect
+
+import asyncio
+import statistics
+import time
+import os
+
+# WebSocket base URLs of the running lobby service instances, e.g.
+# ws://localhost:9000,ws://localhost:9001,ws://localhost:9002 - the lobby must already exist.
+CHAT_BENCHMARK_URLS = os.getenv("CHAT_BENCHMARK_URLS")
+CHAT_BENCHMARK_LOBBY_ID = int(os.getenv("CHAT_BENCHMARK_LOBBY_ID", 1))
+CHAT_BENCHMARK_CLIENTS = int(os.getenv("CHAT_BENCHMARK_CLIENTS", 10))
+CHAT_BENCHMARK_MESSAGES = int(os.getenv("CHAT_BENCHMARK_MESSAGES", 500))
+
+
+@unittest.skipUnless(CHAT_BENCHMARK_URLS, "CHAT_BENCHMARK_URLS is not set")
+class TestChatBenchmark(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self.urls = CHAT_BENCHMARK_URLS.split(",")
+        self.clients = []
+
+        # every instance gets the same number of clients, the first one of each sends
+        for url in self.urls:
+            for _ in range(CHAT_BENCHMARK_CLIENTS):
+                client = await connect(f"{url}/lobbies/ws/{CHAT_BENCHMARK_LOBBY_ID}")
+                await client.recv()
+                self.clients.append((url, client))
+
+        # gives the instances time to subscribe to the lobby channel
+        await asyncio.sleep(1)
+
+    async def asyncTearDown(self):
+        for _, client in self.clients:
+            await client.close()
+
+    async def receive(self, client, expected_messages: int, latencies: list):
+        received = 0
+
+        while received < expected_messages:
+            message = await asyncio.wait_for(client.recv(), timeout=10)
+
+            if message.startswith("benchmark "):
+                _, sent_at = message.split(" ")[:2]
+                latencies.append(time.perf_counter() - float(sent_at))
+                received += 1
+
+        return received
+
+    async def send(self, client, messages: int):
+        for i in range(messages):
+            await client.send(f"benchmark {time.perf_counter()} {i}")
+
+    async def test_messages_reach_every_instance(self):
+        senders = [client for i, (_, client) in enumerate(self.clients) if i % CHAT_BENCHMARK_CLIENTS == 0]
+        latencies = []
+
+        # a sender gets the messages of the other senders, every other client gets all of them
+        total_messages = CHAT_BENCHMARK_MESSAGES * len(senders)
+        receivers = [self.receive(client, total_messages - (CHAT_BENCHMARK_MESSAGES if client in senders else 0),
+                                  latencies) for _, client in self.clients]
+
+        started_at = time.perf_counter()
+        results = await asyncio.gather(*receivers, *[self.send(client, CHAT_BENCHMARK_MESSAGES)
+                                                     for client in senders])
+        elapsed = time.perf_counter() - started_at
+
+        latencies.sort()
+        print(f"\n{total_messages} messages from {len(senders)} instances to {len(self.clients)} clients "
+              f"in {elapsed:.2f}s ({len(latencies) / elapsed:.0f} deliveries/sec, "
+              f"p50 {statistics.median(latencies) * 1000:.1f}ms, "
+              f"p99 {latencies[int(len(latencies) * 0.99) - 1] * 1000:.1f}ms)")
+
+        self.assertEqual(sum(results[:len(self.clients)]), len(latencies))
+
+
+if __name__ == '__main__':
+    unittest.main()
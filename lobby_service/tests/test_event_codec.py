@@ -0,0 +1,46 @@
+import unittest
+from utils.event_codec import EventSequence, decode_event, encode_event, render_event
+from utils.train_events_pb2 import EventType, TrainChange, TrainEvent
+
+
+class TestEventCodec(unittest.TestCase):
+
+    def test_event_survives_encoding(self):
+        event = TrainEvent(type=EventType.BOOKING_CANCELLED, train_id=1, sequence=5,
+                           user_credentials="Tom Ford", available_seats=3)
+
+        decoded_event = decode_event(encode_event(event))
+
+        self.assertEqual(decoded_event.version, 1)
+        self.assertEqual(decoded_event.sequence, 5)
+        self.assertEqual(render_event(decoded_event), "A booking was cancelled by Tom Ford.\nAvailable seats: 3\n")
+
+    def test_train_update_is_rendered_per_change(self):
+        event = TrainEvent(type=EventType.TRAIN_UPDATED, train_id=1, changes=[
+            TrainChange(field="route", old_value="Chisinau-Iasi", new_value="Chisinau-Bucharest"),
+            TrainChange(field="available_seats", old_value="10", new_value="20")])
+
+        self.assertEqual(render_event(event), "Train details were updated:\nChisinau-Iasi -> Chisinau-Bucharest\n"
+                                              "Available seats: 10 -> 20\n")
+
+    def test_booking_outcome_names_the_ticket(self):
+        confirmed = TrainEvent(type=EventType.BOOKING_PROCESSED, train_id=1, ticket_id="abc",
+                               user_credentials="Tom Ford", booking_id=7)
+        rejected = TrainEvent(type=EventType.BOOKING_PROCESSED, train_id=1, ticket_id="def",
+                              user_credentials="Jo Malone", error="There are no more seats left for this train")
+
+        self.assertEqual(render_event(confirmed), "Booking request abc of Tom Ford was confirmed.\n")
+        self.assertEqual(render_event(rejected), "Booking request def of Jo Malone was rejected: "
+                                                 "There are no more seats left for this train\n")
+
+    def test_redelivered_and_older_events_are_stale(self):
+        event_sequence = EventSequence()
+
+        self.assertFalse(event_sequence.is_stale(TrainEvent(train_id=1, sequence=2)))
+        self.assertTrue(event_sequence.is_stale(TrainEvent(train_id=1, sequence=2)))
+        self.assertTrue(event_sequence.is_stale(TrainEvent(train_id=1, sequence=1)))
+        self.assertFalse(event_sequence.is_stale(TrainEvent(train_id=2, sequence=1)))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -3,6 +3,14 @@ from unittest.mock import MagicMock
 from db.models import Lobby
 from management.lobby_manager import LobbyManager
 
+import json
+import time
+
+
+def cache_entry(version: int, body: bytes):
+    header = {"version": version, "expires_at": time.time() + 120, "delta": 0, "etag": '"etag"', "next_cursor": None}
+    return json.dumps(header).encode() + b"\n" + body
+
 
 class TestGetAllLobbies(unittest.TestCase):
 
@@ -12,18 +20,18 @@ class TestGetAllLobbies(unittest.TestCase):
         self.manager = LobbyManager(self.mock_db, self.mock_redis_cache)
 
     def test_get_all_returns_cached_lobbies(self):
-        cached_lobbies = '[{"id": 1, "train_id": "1"}, {"id": 2, "train_id": "2"}]'
-        self.mock_redis_cache.get.return_value = cached_lobbies
+        cached_lobbies = cache_entry(0, b'[{"id":1,"train_id":1},{"id":2,"train_id":2}]')
+        self.mock_redis_cache.pipeline.return_value.execute.return_value = [None, cached_lobbies]
 
         result = self.manager.get_all()
 
-        self.assertEqual(len(result), 2)
-        self.assertEqual(result[0]['id'], 1)
+        self.assertEqual(result.body, b'[{"id":1,"train_id":1},{"id":2,"train_id":2}]')
+        self.assertEqual(result.etag, '"etag"')
 
         self.mock_db.query.assert_not_called()
 
     def test_get_all_returns_from_db_if_no_cache(self):
-        self.mock_redis_cache.get.return_value = None
+        self.mock_redis_cache.pipeline.return_value.execute.return_value = [None, None]
 
         mock_lobbies = [
             Lobby(id=1, train_id=1),
@@ -33,11 +41,22 @@ class TestGetAllLobbies(unittest.TestCase):
 
         result = self.manager.get_all()
 
-        self.assertEqual(len(result), 2)
-        self.assertEqual(result[0].id, 1)
+        self.assertEqual(json.loads(result.body), [{"id": 1, "train_id": 1}, {"id": 2, "train_id": 2}])
+        self.assertIsNone(result.next_cursor)
 
         self.mock_redis_cache.setex.assert_called_once()
 
+    def test_get_all_returns_stale_lobbies_while_another_worker_refreshes(self):
+        stale_lobbies = cache_entry(1, b'[{"id":1,"train_id":1}]')
+        self.mock_redis_cache.pipeline.return_value.execute.return_value = [b"2", stale_lobbies]
+        self.mock_redis_cache.lock.return_value.acquire.return_value = False
+
+        result = self.manager.get_all()
+
+        self.assertEqual(result.body, b'[{"id":1,"train_id":1}]')
+        self.mock_db.query.assert_not_called()
+        self.mock_redis_cache.setex.assert_not_called()
+
 
 if __name__ == '__main__':
     unittest.main()
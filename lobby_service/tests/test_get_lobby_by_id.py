@@ -11,6 +11,7 @@ class TestGetLobbyById(unittest.TestCase):
         self.mock_db = MagicMock()
         self.mock_redis_cache = MagicMock()
         self.manager = LobbyManager(self.mock_db, self.mock_redis_cache)
+        self.mock_redis_cache.get.return_value = None
 
     def test_get_by_id_returns_http_exception(self):
         lobby_id = 1
@@ -25,6 +26,21 @@ class TestGetLobbyById(unittest.TestCase):
 
         self.assertEqual(result.id, 1)
         self.mock_db.query.return_value.filter.return_value.first.assert_called_once()
+        self.mock_redis_cache.setex.assert_called_once()
+
+    def test_get_by_id_returns_lobby_from_cache(self):
+        self.mock_redis_cache.get.return_value = b'{"id": 1, "train_id": 1}'
+
+        result = self.manager.get_by_id(1)
+
+        self.assertEqual(result, {"id": 1, "train_id": 1})
+        self.mock_db.query.assert_not_called()
+
+    def test_get_by_id_returns_http_exception_for_cached_missing_lobby(self):
+        self.mock_redis_cache.get.return_value = b"null"
+
+        self.assertRaises(HTTPException, self.manager.get_by_id, 1)
+        self.mock_db.query.assert_not_called()
 
 
 if __name__ == '__main__':
@@ -0,0 +1,115 @@
+import unittest
+from unittest.mock import patch
+from utils.http_client import HttpClient
+
+import asyncio
+import httpx
+
+
+class TestHttpClient(unittest.IsolatedAsyncioTestCase):
+
+    async def client(self, handler):
+        client = HttpClient(transport=httpx.MockTransport(handler))
+        await client.start()
+        self.addAsyncCleanup(client.stop)
+        return client
+
+    async def test_connection_failure_is_retried(self):
+        attempts = []
+
+        def handler(request):
+            attempts.append(request)
+            if len(attempts) == 1:
+                raise httpx.ConnectError("connection refused")
+            return httpx.Response(200, content=b"1")
+
+        client = await self.client(handler)
+
+        with patch('utils.http_client.asyncio.sleep'):
+            response = await client.post("http://gateway/ts/bookings", json={"train_id": 1})
+
+        self.assertEqual(response.content, b"1")
+        self.assertEqual(len(attempts), 2)
+        self.assertEqual(client.snapshot()["retries"], 1)
+
+    async def test_read_timeout_is_not_retried(self):
+        attempts = []
+
+        def handler(request):
+            attempts.append(request)
+            raise httpx.ReadTimeout("no answer")
+
+        client = await self.client(handler)
+
+        with self.assertRaises(httpx.ReadTimeout):
+            await client.post("http://gateway/ts/bookings", json={"train_id": 1})
+
+        self.assertEqual(len(attempts), 1)
+        self.assertEqual(client.snapshot()["failures"], 1)
+
+    async def test_slow_request_is_hedged_to_second_upstream(self):
+        async def handler(request):
+            if request.url.host == "gateway":
+                await asyncio.sleep(1)
+            return httpx.Response(200, content=request.url.host.encode())
+
+        client = await self.client(handler)
+
+        with patch('utils.http_client.HTTP_HEDGE_DELAY', 0.01):
+            response = await client.post("http://gateway/ts/bookings", json={"train_id": 1},
+                                         hedge_url="http://train_booking_service/bookings")
+
+        self.assertEqual(response.content, b"train_booking_service")
+        stats = client.snapshot()
+        self.assertEqual((stats["hedged"], stats["hedge_wins"]), (1, 1))
+
+    async def test_failed_hedge_does_not_win(self):
+        async def handler(request):
+            if request.url.host == "gateway":
+                await asyncio.sleep(0.05)
+                return httpx.Response(200, content=b"1")
+            return httpx.Response(503)
+
+        client = await self.client(handler)
+
+        with patch('utils.http_client.HTTP_HEDGE_DELAY', 0.01):
+            response = await client.post("http://gateway/ts/bookings", json={"train_id": 1},
+                                         hedge_url="http://train_booking_service/bookings")
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(client.snapshot()["hedge_wins"], 0)
+
+    async def test_duplicate_of_the_hedge_waits_for_the_primary(self):
+        async def handler(request):
+            if request.url.host == "gateway":
+                await asyncio.sleep(0.05)
+                return httpx.Response(200, content=b"1")
+            return httpx.Response(400, json={"detail": "Booking already exists for this train and user"})
+
+        client = await self.client(handler)
+
+        with patch('utils.http_client.HTTP_HEDGE_DELAY', 0.01):
+            response = await client.post("http://gateway/ts/bookings", json={"train_id": 1},
+                                         hedge_url="http://train_booking_service/bookings")
+
+        self.assertEqual(response.content, b"1")
+
+    async def test_hedge_answers_when_the_primary_fails(self):
+        async def handler(request):
+            if request.url.host == "gateway":
+                await asyncio.sleep(0.05)
+                raise httpx.ReadTimeout("no answer")
+            return httpx.Response(400, json={"detail": "There are no more seats left for this train"})
+
+        client = await self.client(handler)
+
+        with patch('utils.http_client.HTTP_HEDGE_DELAY', 0.01):
+            response = await client.post("http://gateway/ts/bookings", json={"train_id": 1},
+                                         hedge_url="http://train_booking_service/bookings")
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(client.snapshot()["hedge_wins"], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
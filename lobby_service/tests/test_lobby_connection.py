@@ -0,0 +1,100 @@
+import unittest
+from unittest.mock import AsyncMock, MagicMock
+from utils.lobby_connection import FrameStats, LobbyConnection, SLOW_CONSUMER_CLOSE_CODE
+
+import asyncio
+import orjson
+
+
+class TestLobbyConnection(unittest.IsolatedAsyncioTestCase):
+
+    def connection(self, overflow_policy: str, batch_size: int = 1, queue_size: int = 2):
+        self.websocket = MagicMock(send_text=AsyncMock(), close=AsyncMock())
+        self.on_close = MagicMock()
+        self.frame_stats = FrameStats()
+        return LobbyConnection(self.websocket, self.on_close, self.frame_stats, batch_size=batch_size,
+                               queue_size=queue_size, overflow_policy=overflow_policy)
+
+    def queued(self, connection: LobbyConnection):
+        return [message for message, _, _ in connection._messages]
+
+    async def wait_until(self, condition, timeout: float = 1):
+        # the writer task needs a different number of loop iterations per Python version
+        deadline = asyncio.get_running_loop().time() + timeout
+        while not condition():
+            if asyncio.get_running_loop().time() > deadline:
+                self.fail("condition was not met in time")
+            await asyncio.sleep(0.001)
+
+    async def test_oldest_message_is_dropped_on_overflow(self):
+        connection = self.connection('drop_oldest')
+
+        for i in range(3):
+            await connection.send(f"message {i}")
+
+        self.assertEqual(self.queued(connection), ["message 1", "message 2"])
+
+    async def test_queued_seat_count_is_replaced_by_newer_one(self):
+        connection = self.connection('coalesce')
+
+        await connection.send("2 seats left", "seats:1")
+        await connection.send("Hello")
+        await connection.send("1 seat left", "seats:1")
+
+        self.assertEqual(self.queued(connection), ["Hello", "1 seat left"])
+
+    async def test_slow_socket_is_disconnected_on_overflow(self):
+        connection = self.connection('disconnect')
+
+        for i in range(3):
+            await connection.send(f"message {i}")
+
+        self.assertTrue(connection.closed)
+        self.on_close.assert_called_once()
+        self.websocket.close.assert_awaited_once_with(code=SLOW_CONSUMER_CLOSE_CODE)
+
+    async def test_failed_send_removes_the_socket(self):
+        connection = self.connection('drop_oldest')
+        self.websocket.send_text.side_effect = RuntimeError("connection reset")
+        connection.start()
+
+        await connection.send("message")
+        await self.wait_until(lambda: connection.closed)
+
+        self.on_close.assert_called_once()
+
+    async def test_writer_sends_messages_in_order(self):
+        connection = self.connection('drop_oldest')
+        connection.start()
+
+        await connection.send("message 0")
+        await connection.send("message 1")
+        await self.wait_until(lambda: self.websocket.send_text.await_count == 2)
+
+        self.assertEqual([call.args[0] for call in self.websocket.send_text.await_args_list],
+                         ["message 0", "message 1"])
+        await connection.close()
+
+    async def test_full_batch_is_sent_as_one_frame(self):
+        connection = self.connection('drop_oldest', batch_size=3, queue_size=10)
+        connection.start()
+
+        for i in range(4):
+            await connection.send(f"message {i}")
+        await self.wait_until(lambda: self.websocket.send_text.await_count >= 1)
+
+        self.websocket.send_text.assert_awaited_once_with(
+            orjson.dumps(["message 0", "message 1", "message 2"]).decode())
+
+        # the rest goes out once the flush interval passed
+        await self.wait_until(lambda: self.websocket.send_text.await_count == 2)
+
+        self.assertEqual(self.websocket.send_text.await_args_list[1].args[0], '["message 3"]')
+        stats = self.frame_stats.snapshot()
+        self.assertEqual((stats["frames"], stats["messages"]), (2, 4))
+        self.assertEqual(stats["bytes_saved"], (3 * 11 - 39) + (11 - 15))
+        await connection.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
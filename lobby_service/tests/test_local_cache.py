@@ -0,0 +1,55 @@
+import unittest
+from utils.local_cache import LocalCache
+
+
+class TestLocalCache(unittest.TestCase):
+
+    def setUp(self):
+        self.cache = LocalCache()
+        self.cache.enabled = True
+
+    def test_get_returns_value_set_for_current_generation(self):
+        self.cache.set("lobby:1", {"id": 1}, 10, self.cache.generation)
+
+        self.assertEqual(self.cache.get("lobby:1"), {"id": 1})
+        self.assertEqual(self.cache.stats.snapshot()["hits"], 1)
+
+    def test_set_skips_value_read_before_invalidation(self):
+        generation = self.cache.generation
+        self.cache.invalidate("lobby:1")
+        self.cache.set("lobby:1", {"id": 1}, 10, generation)
+
+        self.assertIsNone(self.cache.get("lobby:1"))
+        self.assertEqual(self.cache.stats.snapshot()["misses"], 1)
+
+    def test_invalidate_drops_keys_with_prefix(self):
+        self.cache.set("lobbies:list:a", [], 10, self.cache.generation)
+        self.cache.set("lobbies:list:b", [], 10, self.cache.generation)
+        self.cache.set("lobby:1", {"id": 1}, 10, self.cache.generation)
+
+        self.cache.invalidate("lobbies:list:*")
+
+        self.assertIsNone(self.cache.get("lobbies:list:a"))
+        self.assertIsNone(self.cache.get("lobbies:list:b"))
+        self.assertEqual(self.cache.get("lobby:1"), {"id": 1})
+
+    def test_set_evicts_least_recently_used_entries_over_memory_cap(self):
+        self.cache.max_bytes = 25
+        self.cache.set("lobby:1", {"id": 1}, 10, self.cache.generation)
+        self.cache.set("lobby:2", {"id": 2}, 10, self.cache.generation)
+        self.cache.get("lobby:1")
+        self.cache.set("lobby:3", {"id": 3}, 10, self.cache.generation)
+
+        self.assertIsNone(self.cache.get("lobby:2"))
+        self.assertEqual(self.cache.get("lobby:1"), {"id": 1})
+        self.assertEqual(self.cache.snapshot()["bytes"], 20)
+
+    def test_get_returns_nothing_while_disabled(self):
+        self.cache.set("lobby:1", {"id": 1}, 10, self.cache.generation)
+        self.cache.enabled = False
+
+        self.assertIsNone(self.cache.get("lobby:1"))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,55 @@
+import unittest
+from unittest.mock import MagicMock
+from middleware.load_middleware import LoadMiddleware
+from utils.metrics import MetricsRegistry, http_request_duration
+from utils.service_registry import LoadTracker
+
+
+class TestMetrics(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.metrics = MetricsRegistry()
+
+    def test_histogram_buckets_are_cumulative(self):
+        histogram = self.metrics.histogram('query_seconds', "Query time", ('role',), buckets=(0.1, 1.0))
+
+        for latency in (0.05, 0.1, 0.5, 2.0):
+            histogram.observe(latency, 'master')
+
+        lines = self.metrics.render().splitlines()
+
+        self.assertEqual(lines[:2], ["# HELP query_seconds Query time", "# TYPE query_seconds histogram"])
+        self.assertIn('query_seconds_bucket{role="master",le="0.1"} 2', lines)
+        self.assertIn('query_seconds_bucket{role="master",le="1.0"} 3', lines)
+        self.assertIn('query_seconds_bucket{role="master",le="+Inf"} 4', lines)
+        self.assertIn('query_seconds_sum{role="master"} 2.65', lines)
+        self.assertIn('query_seconds_count{role="master"} 4', lines)
+
+    def test_label_values_are_escaped(self):
+        counter = self.metrics.counter('cache_requests_total', "Cache lookups", ('family',))
+        counter.inc('say "hi"\n')
+
+        self.assertIn('cache_requests_total{family="say \\"hi\\"\\n"} 1', self.metrics.render())
+
+    def test_failing_gauge_does_not_break_the_scrape(self):
+        self.metrics.gauge('broken', "Always fails", lambda: 1 / 0)
+        self.metrics.gauge('lobby_frames_sent_total', "Frames", lambda: {(7,): 3}, ('lobby',), 'counter')
+
+        rendered = self.metrics.render()
+
+        self.assertNotIn('broken', rendered)
+        self.assertIn('# TYPE lobby_frames_sent_total counter\nlobby_frames_sent_total{lobby="7"} 3', rendered)
+
+    async def test_requests_are_labelled_with_the_route_template(self):
+        request = MagicMock(method="GET", scope={"route": MagicMock(path="/lobbies/{lobby_id}")})
+
+        async def call_next(request):
+            return MagicMock(status_code=404)
+
+        await LoadMiddleware(LoadTracker())(request, call_next)
+
+        self.assertIn(('GET', '/lobbies/{lobby_id}', '404'), http_request_duration._series)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,98 @@
+import unittest
+from unittest.mock import AsyncMock, MagicMock
+from utils.event_codec import EVENT_CONTENT_TYPE, encode_event
+from utils.rabbitmq import RabbitMQ
+from utils.train_events_pb2 import EventType, TrainEvent
+
+import asyncio
+import pika
+
+
+class TestRabbitMQConsumer(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self.consumer = RabbitMQ()
+        self.consumer._channel = MagicMock()
+        self.consumer._queue_name = "amq.gen-lobby"
+        self.consumer._dispatcher = asyncio.create_task(self.consumer._dispatch())
+
+    async def asyncTearDown(self):
+        self.consumer._dispatcher.cancel()
+
+    def deliver(self, routing_key: str, sequence: int):
+        body = encode_event(TrainEvent(type=EventType.BOOKING_CANCELLED, train_id=int(routing_key),
+                                       sequence=sequence, user_credentials="Tom Ford", available_seats=3))
+        self.consumer._on_message(self.consumer._channel, MagicMock(routing_key=routing_key),
+                                  MagicMock(content_type=EVENT_CONTENT_TYPE), body)
+
+    def test_routing_key_is_bound_for_first_and_unbound_after_last_subscriber(self):
+        first_subscriber, second_subscriber = AsyncMock(), AsyncMock()
+
+        self.consumer.subscribe("1", first_subscriber)
+        self.consumer.subscribe("1", second_subscriber)
+        self.consumer.unsubscribe("1", first_subscriber)
+
+        self.consumer._channel.queue_bind.assert_called_once_with(
+            queue="amq.gen-lobby", exchange='train_events', routing_key="1")
+        self.consumer._channel.queue_unbind.assert_not_called()
+
+        self.consumer.unsubscribe("1", second_subscriber)
+
+        self.consumer._channel.queue_unbind.assert_called_once_with(
+            queue="amq.gen-lobby", exchange='train_events', routing_key="1")
+        self.assertEqual(self.consumer.snapshot()["routing_keys"], 0)
+
+    async def test_event_is_rendered_once_for_every_local_subscriber(self):
+        subscribers = [AsyncMock(), AsyncMock()]
+        for subscriber in subscribers:
+            self.consumer.subscribe("1", subscriber)
+        other_lobby_subscriber = AsyncMock()
+        self.consumer.subscribe("2", other_lobby_subscriber)
+
+        self.deliver("1", sequence=1)
+        self.deliver("1", sequence=1)
+        await asyncio.sleep(0)
+
+        for subscriber in subscribers:
+            subscriber.assert_awaited_once_with("A booking was cancelled by Tom Ford.\nAvailable seats: 3\n", None)
+        other_lobby_subscriber.assert_not_awaited()
+        self.assertEqual(self.consumer.snapshot()["stale"], 1)
+
+    async def test_failing_subscriber_does_not_stop_delivery(self):
+        failing_subscriber = AsyncMock(side_effect=RuntimeError("socket closed"))
+        subscriber = AsyncMock()
+        self.consumer.subscribe("1", failing_subscriber)
+        self.consumer.subscribe("1", subscriber)
+
+        self.deliver("1", sequence=1)
+        await asyncio.sleep(0)
+
+        subscriber.assert_awaited_once()
+
+    async def test_booking_request_is_published_once_confirmed(self):
+        self.consumer._confirming = True
+
+        publish = asyncio.create_task(self.consumer.publish_booking_request(b'{"ticket_id": "abc"}'))
+        await asyncio.sleep(0)
+        self.assertFalse(publish.done())
+
+        self.consumer._on_delivery_confirmation(MagicMock(method=pika.spec.Basic.Ack(delivery_tag=1)))
+        await publish
+
+        self.consumer._channel.basic_publish.assert_called_once()
+        self.assertEqual(self.consumer._channel.basic_publish.call_args.kwargs["routing_key"], "booking_requests")
+        self.assertEqual(self.consumer.snapshot()["published"], 1)
+
+    async def test_booking_request_fails_when_connection_closes(self):
+        self.consumer._confirming = True
+
+        publish = asyncio.create_task(self.consumer.publish_booking_request(b'{"ticket_id": "abc"}'))
+        await asyncio.sleep(0)
+        self.consumer._on_channel_closed(self.consumer._channel, "connection reset")
+
+        with self.assertRaises(RuntimeError):
+            await publish
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,58 @@
+import unittest
+from unittest.mock import AsyncMock, MagicMock, patch
+from utils.service_discovery import ServiceDiscovery
+
+import httpx
+
+
+class TestServiceDiscovery(unittest.IsolatedAsyncioTestCase):
+
+    async def asyncSetUp(self):
+        self.discovery = ServiceDiscovery("train_booking_service", "/bookings", "http://gateway:7070/ts/bookings")
+        self.discovery._redis_client = MagicMock(lrange=AsyncMock(return_value=[b"10.0.0.1:8000", b"10.0.0.2:8000"]))
+        await self.discovery.refresh()
+
+    async def test_replica_with_fewest_outstanding_requests_is_picked(self):
+        async with self.discovery.endpoint() as first_url:
+            async with self.discovery.endpoint() as second_url:
+                self.assertNotEqual(first_url, second_url)
+                self.assertTrue(second_url.endswith(":8000/bookings"))
+
+    async def test_failing_replica_is_ejected(self):
+        failing_url = None
+
+        with patch('utils.service_discovery.random.choice', side_effect=lambda replicas: replicas[0]):
+            for _ in range(3):
+                with self.assertRaises(httpx.ConnectError):
+                    async with self.discovery.endpoint() as url:
+                        failing_url = url
+                        raise httpx.ConnectError("connection refused")
+
+            async with self.discovery.endpoint() as url:
+                self.assertNotEqual(url, failing_url)
+
+        self.assertEqual(self.discovery.snapshot()["ejections"], 1)
+
+    async def test_gateway_is_used_when_registry_is_unavailable(self):
+        discovery = ServiceDiscovery("train_booking_service", "/bookings", "http://gateway:7070/ts/bookings")
+        discovery._redis_client = MagicMock(lrange=AsyncMock(side_effect=ConnectionError("no route to host")))
+        await discovery.refresh()
+
+        async with discovery.endpoint() as url:
+            self.assertEqual(url, "http://gateway:7070/ts/bookings")
+
+        self.assertEqual((discovery.snapshot()["failed_refreshes"], discovery.snapshot()["fallbacks"]), (1, 1))
+
+    async def test_client_errors_do_not_count_as_failures(self):
+        response = httpx.Response(400, request=httpx.Request("POST", "http://10.0.0.1:8000/bookings"))
+
+        for _ in range(3):
+            with self.assertRaises(httpx.HTTPStatusError):
+                async with self.discovery.endpoint():
+                    response.raise_for_status()
+
+        self.assertEqual(self.discovery.snapshot()["ejections"], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
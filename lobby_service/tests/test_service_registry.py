@@ -0,0 +1,54 @@
+import unittest
+from unittest.mock import AsyncMock, MagicMock
+from middleware.load_middleware import LoadMiddleware
+from utils.service_registry import LoadTracker, ServiceRegistry
+
+
+class TestServiceRegistry(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.load = LoadTracker()
+        self.registry = ServiceRegistry(self.load, lambda: 0.25)
+        self.registry.name, self.registry.address = "lobby_service", "10.0.0.1"
+
+    async def test_requests_are_counted_while_in_flight(self):
+        middleware = LoadMiddleware(self.load)
+
+        async def call_next(request):
+            self.assertEqual(self.load.in_flight, 1)
+            raise RuntimeError("handler failed")
+
+        with self.assertRaises(RuntimeError):
+            await middleware(MagicMock(), call_next)
+
+        self.assertEqual(self.load.in_flight, 0)
+        self.assertEqual(len(self.load._latencies), 1)
+
+    def test_heartbeat_reports_load(self):
+        for latency in range(1, 101):
+            self.load.request_started()
+            self.load.request_finished(latency / 1000)
+        self.load.request_started()
+
+        request = self.registry.heartbeat_request()
+
+        self.assertEqual((request.name, request.address, request.port), ("lobby_service", "10.0.0.1", 8000))
+        self.assertEqual(request.load.in_flight, 1)
+        self.assertAlmostEqual(request.load.latency_p50_ms, 50)
+        self.assertAlmostEqual(request.load.latency_p99_ms, 99)
+        self.assertEqual(request.load.db_pool_saturation, 0.25)
+
+    async def test_replica_deregisters_on_stop(self):
+        self.registry._stub = MagicMock(Deregister=AsyncMock())
+        self.registry._channel = MagicMock(close=AsyncMock())
+        self.registry._heartbeats, self.registry._lag_probe = MagicMock(), MagicMock()
+
+        await self.registry.stop()
+
+        self.registry._stub.Deregister.assert_awaited_once()
+        self.assertEqual(self.registry._stub.Deregister.call_args.args[0].address, "10.0.0.1")
+        self.registry._channel.close.assert_awaited_once()
+
+
+if __name__ == '__main__':
+    unittest.main()
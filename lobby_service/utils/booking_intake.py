@@ -0,0 +1,52 @@
+from db.schemas import BookingDto
+from fastapi import HTTPException
+from fastapi.responses import JSONResponse
+from starlette.concurrency import run_in_threadpool
+from utils.rabbitmq import rabbitmq
+from utils.redis_cache import get_redis_client
+
+import uuid
+import json
+import os
+
+# sync forwards every booking to the gateway, queue hands it to the booking intake workers
+# and answers with a ticket right away
+BOOKING_INTAKE_MODE = os.getenv('BOOKING_INTAKE_MODE', 'sync')
+BOOKING_TICKET_TTL = int(os.getenv('BOOKING_TICKET_TTL', 3600))
+
+
+def ticket_key(ticket_id: str):
+    return f"booking_ticket:{ticket_id}"
+
+
+def store_ticket(ticket: dict):
+    get_redis_client().setex(name=ticket_key(ticket["ticket_id"]), time=BOOKING_TICKET_TTL, value=json.dumps(ticket))
+
+
+def get_ticket(ticket_id: str):
+    ticket = get_redis_client().get(ticket_key(ticket_id))
+
+    if ticket is None:
+        raise HTTPException(status_code=404, detail="Booking ticket not found")
+
+    return json.loads(ticket)
+
+
+async def enqueue_booking(booking: BookingDto):
+    ticket_id = uuid.uuid4().hex
+    ticket = {"ticket_id": ticket_id, **booking.model_dump(), "status": "pending", "booking_id": None, "error": None}
+
+    # written before the request is queued, so it never overwrites the outcome stored by the worker
+    try:
+        await run_in_threadpool(store_ticket, ticket)
+    except Exception as err:
+        print(f"Could not store pending booking ticket {ticket_id}: {err}")
+
+    try:
+        await rabbitmq.publish_booking_request(json.dumps(
+            {"ticket_id": ticket_id, **booking.model_dump()}).encode())
+    except Exception as err:
+        print(f"Could not queue booking request {ticket_id}: {err!r}")
+        raise HTTPException(status_code=503, detail="Booking queue is unavailable")
+
+    return JSONResponse(status_code=202, content={"message": "Booking request accepted", "ticket_id": ticket_id})
@@ -0,0 +1,230 @@
+from fastapi import HTTPException
+from redis.exceptions import RedisClusterException, RedisError
+from concurrent.futures import ThreadPoolExecutor
+from typing import Awaitable, Callable, Optional
+from utils.redis_cache import INSTANCE_ID, get_redis_client
+from utils.lobby_connection import lobby_fanout
+
+import asyncio
+import itertools
+import threading
+import queue
+import os
+
+CHAT_BACKBONE = os.getenv('CHAT_BACKBONE', 'redis')
+CHAT_CHANNEL_PREFIX = os.getenv('CHAT_CHANNEL_PREFIX', 'lobby_chat')
+
+
+class LocalChatBackbone:
+
+    # delivers chat messages to the sockets of a lobby connected to this process only
+    def __init__(self):
+        self._subscribers = {}
+        self.published = 0
+        self.delivered = 0
+
+    async def start(self):
+        pass
+
+    async def stop(self):
+        pass
+
+    def subscribe(self, lobby_id: int, subscriber: Callable[[str], Awaitable[None]]):
+        subscribers = self._subscribers.setdefault(lobby_id, set())
+        subscribers.add(subscriber)
+        return len(subscribers) == 1
+
+    def unsubscribe(self, lobby_id: int, subscriber: Callable[[str], Awaitable[None]]):
+        subscribers = self._subscribers.get(lobby_id)
+
+        if subscribers is None:
+            return False
+
+        subscribers.discard(subscriber)
+
+        if subscribers:
+            return False
+
+        del self._subscribers[lobby_id]
+        return True
+
+    async def publish(self, lobby_id: int, message: str, sender: Optional[Callable[[str], Awaitable[None]]] = None):
+        self.published += 1
+        await self.deliver(lobby_id, message, sender)
+
+    async def deliver(self, lobby_id: int, message: str, sender: Optional[Callable[[str], Awaitable[None]]] = None):
+        recipients = [subscriber for subscriber in list(self._subscribers.get(lobby_id, ())) if subscriber != sender]
+        lobby_fanout.observe(len(recipients), 'chat')
+
+        for subscriber in recipients:
+            try:
+                await subscriber(message)
+                self.delivered += 1
+            except Exception as err:
+                print(f"Could not deliver chat message of lobby {lobby_id}: {err}")
+
+    def snapshot(self):
+        return {"backbone": "local", "lobbies": len(self._subscribers),
+                "subscribers": sum(len(subscribers) for subscribers in self._subscribers.values()),
+                "published": self.published, "delivered": self.delivered}
+
+
+class RedisChatBackbone(LocalChatBackbone):
+
+    poll_interval = float(os.getenv('CHAT_POLL_INTERVAL', 0.005))
+
+    # every lobby has its own sharded pub/sub channel, so chat traffic is spread over the
+    # cluster nodes and an instance only receives the lobbies its sockets are connected to
+    def __init__(self):
+        super().__init__()
+        self._sequence = itertools.count(1)
+        # a single publishing thread keeps the messages of this instance in sequence order
+        self._publisher = ThreadPoolExecutor(max_workers=1)
+        self._last_sequence = {}
+        self._channels = set()
+        self._channels_lock = threading.Lock()
+        self._commands = queue.SimpleQueue()
+        self._incoming = asyncio.Queue()
+        self._stop_listening = threading.Event()
+        self._listener = None
+        self._dispatcher = None
+        self._loop = None
+
+        self.received = 0
+        self.duplicates = 0
+        self.failed_publishes = 0
+
+    async def start(self):
+        if self._listener is not None:
+            return
+
+        self._loop = asyncio.get_running_loop()
+        self._dispatcher = asyncio.create_task(self._dispatch())
+        self._stop_listening.clear()
+        self._listener = threading.Thread(target=self._listen, daemon=True)
+        self._listener.start()
+
+    async def stop(self):
+        self._stop_listening.set()
+        self._listener = None
+
+        if self._dispatcher is not None:
+            self._dispatcher.cancel()
+            self._dispatcher = None
+
+    def subscribe(self, lobby_id: int, subscriber: Callable[[str], Awaitable[None]]):
+        first_subscriber = super().subscribe(lobby_id, subscriber)
+
+        if first_subscriber:
+            self._update_channels('ssubscribe', self.channel(lobby_id))
+
+        return first_subscriber
+
+    def unsubscribe(self, lobby_id: int, subscriber: Callable[[str], Awaitable[None]]):
+        last_subscriber = super().unsubscribe(lobby_id, subscriber)
+
+        if last_subscriber:
+            self._update_channels('sunsubscribe', self.channel(lobby_id))
+
+        return last_subscriber
+
+    async def publish(self, lobby_id: int, message: str, sender: Optional[Callable[[str], Awaitable[None]]] = None):
+        # local sockets get the message right away, the other instances through the channel
+        await super().publish(lobby_id, message, sender)
+
+        try:
+            await asyncio.get_running_loop().run_in_executor(
+                self._publisher, self._spublish, self.channel(lobby_id),
+                f"{INSTANCE_ID} {next(self._sequence)} {message}")
+        except (HTTPException, RedisError, RedisClusterException) as err:
+            self.failed_publishes += 1
+            print(f"Could not publish chat message of lobby {lobby_id}: {err}")
+
+    def channel(self, lobby_id: int):
+        return f"{CHAT_CHANNEL_PREFIX}:{{{lobby_id}}}"
+
+    def handle_message(self, channel: str, data: str):
+        origin, sequence, message = data.split(" ", 2)
+
+        # this instance already delivered its own messages locally
+        if origin == INSTANCE_ID:
+            return
+
+        lobby_id = int(channel.split('{')[1].split('}')[0])
+
+        if int(sequence) <= self._last_sequence.get((origin, lobby_id), 0):
+            self.duplicates += 1
+            return
+
+        self._last_sequence[(origin, lobby_id)] = int(sequence)
+        self.received += 1
+        self._loop.call_soon_threadsafe(self._incoming.put_nowait, (lobby_id, message))
+
+    def snapshot(self):
+        return {**super().snapshot(), "backbone": "redis", "received": self.received,
+                "duplicates": self.duplicates, "failed_publishes": self.failed_publishes}
+
+    async def _dispatch(self):
+        while True:
+            lobby_id, message = await self._incoming.get()
+            await self.deliver(lobby_id, message)
+
+    def _spublish(self, channel: str, payload: str):
+        get_redis_client().spublish(channel, payload)
+
+    def _update_channels(self, command: str, channel: str):
+        with self._channels_lock:
+            if command == 'ssubscribe':
+                self._channels.add(channel)
+            else:
+                self._channels.discard(channel)
+
+        # the pub/sub connections are only used by the listener thread
+        self._commands.put((command, channel))
+
+    def _listen(self):
+        while not self._stop_listening.is_set():
+            pubsub = None
+
+            try:
+                pubsub = get_redis_client().pubsub()
+
+                with self._channels_lock:
+                    channels = list(self._channels)
+                if channels:
+                    pubsub.ssubscribe(*channels)
+
+                while not self._stop_listening.is_set():
+                    while not self._commands.empty():
+                        command, channel = self._commands.get()
+                        getattr(pubsub, command)(channel)
+
+                    message = pubsub.get_sharded_message(ignore_subscribe_messages=True)
+
+                    if message is None:
+                        self._stop_listening.wait(self.poll_interval)
+                    elif message["type"] == "smessage":
+                        channel = message["channel"]
+                        self.handle_message(channel.decode() if isinstance(channel, bytes) else channel,
+                                            message["data"].decode())
+
+            except Exception as err:
+                print(f"Chat backbone listener failed: {err}")
+
+            finally:
+                if pubsub is not None:
+                    try:
+                        pubsub.close()
+                    except Exception:
+                        pass
+
+            self._stop_listening.wait(1)
+
+
+def create_chat_backbone():
+    if CHAT_BACKBONE == 'redis':
+        return RedisChatBackbone()
+    return LocalChatBackbone()
+
+
+chat_backbone = create_chat_backbone()
@@ -0,0 +1,152 @@
+from collections import deque
+from typing import Optional
+
+import asyncio
+import statistics
+import random
+import httpx
+import time
+import os
+
+HTTP_MAX_CONNECTIONS = int(os.getenv('HTTP_MAX_CONNECTIONS', 100))
+HTTP_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv('HTTP_MAX_KEEPALIVE_CONNECTIONS', 20))
+HTTP_KEEPALIVE_EXPIRY = float(os.getenv('HTTP_KEEPALIVE_EXPIRY', 30))
+HTTP_CONNECT_TIMEOUT = float(os.getenv('HTTP_CONNECT_TIMEOUT', 1))
+# stays below the 5 seconds of the timeout middleware, so the caller gets the upstream error
+HTTP_DEADLINE = float(os.getenv('HTTP_DEADLINE', 4))
+HTTP_MAX_RETRIES = int(os.getenv('HTTP_MAX_RETRIES', 2))
+HTTP_RETRY_BASE_DELAY = float(os.getenv('HTTP_RETRY_BASE_DELAY', 0.05))
+# used until enough latencies were observed to take their p95
+HTTP_HEDGE_DELAY = float(os.getenv('HTTP_HEDGE_DELAY', 0.2))
+HTTP_HEDGE_MIN_SAMPLES = int(os.getenv('HTTP_HEDGE_MIN_SAMPLES', 20))
+HTTP_LATENCY_WINDOW = int(os.getenv('HTTP_LATENCY_WINDOW', 200))
+
+# the request never reached the upstream, so sending it again cannot register anything twice
+RETRYABLE_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)
+
+
+class HttpClient:
+
+    def __init__(self, transport: Optional[httpx.AsyncBaseTransport] = None):
+        self._transport = transport
+        self._client = None
+        self._latencies = deque(maxlen=HTTP_LATENCY_WINDOW)
+
+        self.in_flight = 0
+        self.requests = 0
+        self.retries = 0
+        self.hedged = 0
+        self.hedge_wins = 0
+        self.failures = 0
+
+    async def start(self):
+        if self._client is not None:
+            return
+
+        if self._transport is None:
+            self._transport = httpx.AsyncHTTPTransport(limits=httpx.Limits(
+                max_connections=HTTP_MAX_CONNECTIONS, max_keepalive_connections=HTTP_MAX_KEEPALIVE_CONNECTIONS,
+                keepalive_expiry=HTTP_KEEPALIVE_EXPIRY))
+
+        self._client = httpx.AsyncClient(transport=self._transport,
+                                         timeout=httpx.Timeout(HTTP_DEADLINE, connect=HTTP_CONNECT_TIMEOUT))
+
+    async def stop(self):
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    async def post(self, url: str, json: dict, hedge_url: Optional[str] = None,
+                   deadline: float = HTTP_DEADLINE) -> httpx.Response:
+        self.requests += 1
+        started = time.perf_counter()
+
+        try:
+            response = await asyncio.wait_for(self._hedged_post(url, json, hedge_url), timeout=deadline)
+        except Exception:
+            self.failures += 1
+            raise
+
+        self._latencies.append(time.perf_counter() - started)
+        return response
+
+    def hedge_delay(self):
+        if len(self._latencies) < HTTP_HEDGE_MIN_SAMPLES:
+            return HTTP_HEDGE_DELAY
+
+        return statistics.quantiles(self._latencies, n=20)[-1]
+
+    def snapshot(self):
+        pool = getattr(self._transport, '_pool', None)
+        connections = pool.connections if pool is not None else []
+
+        return {"in_flight": self.in_flight, "max_connections": HTTP_MAX_CONNECTIONS,
+                "pool_connections": len(connections),
+                "pool_idle_connections": sum(1 for connection in connections if connection.is_idle()),
+                "requests": self.requests, "retries": self.retries, "hedged": self.hedged,
+                "hedge_wins": self.hedge_wins, "failures": self.failures,
+                "hedge_delay_seconds": round(self.hedge_delay(), 6)}
+
+    async def _hedged_post(self, url: str, json: dict, hedge_url: Optional[str]):
+        if not hedge_url:
+            return await self._post_with_retries(url, json)
+
+        # a copy goes to the second upstream once the first one is slower than its usual p95,
+        # the first answer that is not an error wins and the other request is cancelled
+        primary = asyncio.create_task(self._post_with_retries(url, json))
+        tasks = [primary]
+
+        try:
+            done, _ = await asyncio.wait(tasks, timeout=self.hedge_delay())
+            if done:
+                return primary.result()
+
+            self.hedged += 1
+            hedge = asyncio.create_task(self._post_with_retries(hedge_url, json))
+            tasks.append(hedge)
+
+            pending = set(tasks)
+            while pending:
+                _, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+
+                # a 4xx may be the duplicate of a booking the other request just registered,
+                # so it only wins once the other request has nothing better
+                answers = [task for task in tasks if task.done() and self._answered(task)]
+                winner = next((task for task in answers if task.result().status_code < 400), None)
+                if winner is None and answers and not pending:
+                    winner = answers[0]
+
+                if winner is not None:
+                    if winner is hedge:
+                        self.hedge_wins += 1
+                    return winner.result()
+
+            return primary.result()
+
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    def _answered(self, task: asyncio.Task):
+        return task.exception() is None and task.result().status_code < 500
+
+    async def _post_with_retries(self, url: str, json: dict):
+        for attempt in range(HTTP_MAX_RETRIES + 1):
+            self.in_flight += 1
+
+            try:
+                return await self._client.post(url, json=json)
+            except RETRYABLE_ERRORS as err:
+                if attempt == HTTP_MAX_RETRIES:
+                    raise
+
+                print(f"Could not reach {url}, retrying: {err!r}")
+                self.retries += 1
+            finally:
+                self.in_flight -= 1
+
+            # full jitter keeps the retries of many lobbies from hitting the upstream together
+            await asyncio.sleep(random.uniform(0, HTTP_RETRY_BASE_DELAY * 2 ** attempt))
+
+
+http_client = HttpClient()
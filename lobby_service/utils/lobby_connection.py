@@ -0,0 +1,226 @@
+from collections import deque
+from fastapi import WebSocket
+from typing import Callable, Optional
+from utils.metrics import metrics
+
+import asyncio
+import orjson
+import threading
+import time
+import os
+
+WS_SEND_QUEUE_SIZE = int(os.getenv('WS_SEND_QUEUE_SIZE', 256))
+WS_SEND_TIMEOUT = float(os.getenv('WS_SEND_TIMEOUT', 5))
+# drop_oldest, coalesce or disconnect
+WS_OVERFLOW_POLICY = os.getenv('WS_OVERFLOW_POLICY', 'coalesce')
+
+SLOW_CONSUMER_CLOSE_CODE = 1013
+
+# clients that offer this subprotocol get every frame as a JSON array of messages
+LOBBY_BATCH_SUBPROTOCOL = 'lobby.batch'
+WS_BATCH_FLUSH_INTERVAL = float(os.getenv('WS_BATCH_FLUSH_INTERVAL', 0.03))
+WS_BATCH_MAX_MESSAGES = int(os.getenv('WS_BATCH_MAX_MESSAGES', 50))
+
+FANOUT_BUCKETS = (0, 1, 2, 5, 10, 25, 50, 100, 250, 500, 1000)
+
+
+class BroadcastStats:
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.sent = 0
+        self.dropped = 0
+        self.coalesced = 0
+        self.slow_disconnects = 0
+        self.failed_sends = 0
+        self.opened = 0
+        self.closed = 0
+
+    def record(self, counter: str):
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def snapshot(self):
+        with self._lock:
+            return {"sent": self.sent, "dropped": self.dropped, "coalesced": self.coalesced,
+                    "slow_disconnects": self.slow_disconnects, "failed_sends": self.failed_sends,
+                    "connections": self.opened - self.closed}
+
+
+broadcast_stats = BroadcastStats()
+
+# how many local sockets a single event or chat message is handed to
+lobby_fanout = metrics.histogram(
+    'lobby_fanout_subscribers', "Local sockets a lobby event or chat message is delivered to", ('source',),
+    FANOUT_BUCKETS)
+
+metrics.gauge('websocket_connections', "Open lobby sockets",
+              lambda: broadcast_stats.opened - broadcast_stats.closed)
+
+
+class FrameStats:
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.frames = 0
+        self.messages = 0
+        self.bytes_sent = 0
+        self.bytes_saved = 0
+        self.flush_latency_total = 0.0
+        self.flush_latency_max = 0.0
+
+    def record(self, messages: list, frame: str, flush_latency: float):
+        # compared with sending every message in a frame of its own
+        unbatched_bytes = sum(frame_size(len(message.encode())) for message in messages)
+        frame_bytes = frame_size(len(frame.encode()))
+
+        with self._lock:
+            self.frames += 1
+            self.messages += len(messages)
+            self.bytes_sent += frame_bytes
+            self.bytes_saved += unbatched_bytes - frame_bytes
+            self.flush_latency_total += flush_latency
+            self.flush_latency_max = max(self.flush_latency_max, flush_latency)
+
+    def snapshot(self):
+        with self._lock:
+            return {"frames": self.frames, "messages": self.messages, "bytes_sent": self.bytes_sent,
+                    "bytes_saved": self.bytes_saved, "flush_latency_max_seconds": round(self.flush_latency_max, 6),
+                    "flush_latency_avg_seconds": round(self.flush_latency_total / self.frames, 6)
+                    if self.frames else None}
+
+
+lobby_frame_stats = {}
+
+
+def get_frame_stats(lobby_id: int):
+    return lobby_frame_stats.setdefault(lobby_id, FrameStats())
+
+
+metrics.gauge('lobby_messages_sent_total', "Messages written to the sockets of a lobby",
+              lambda: {(lobby_id,): stats.messages for lobby_id, stats in list(lobby_frame_stats.items())},
+              ('lobby',), 'counter')
+metrics.gauge('lobby_frames_sent_total', "Frames written to the sockets of a lobby",
+              lambda: {(lobby_id,): stats.frames for lobby_id, stats in list(lobby_frame_stats.items())},
+              ('lobby',), 'counter')
+
+
+def frame_size(payload_size: int):
+    # payload plus the header of an unmasked server frame, before compression
+    if payload_size < 126:
+        return payload_size + 2
+    if payload_size < 65536:
+        return payload_size + 4
+    return payload_size + 10
+
+
+class LobbyConnection:
+
+    # messages are queued per socket and written by its own task, so a slow or dead client
+    # only ever delays itself
+    def __init__(self, websocket: WebSocket, on_close: Callable[[], None], frame_stats: FrameStats,
+                 batch_size: int = 1, queue_size: int = WS_SEND_QUEUE_SIZE, overflow_policy: str = WS_OVERFLOW_POLICY):
+        self.websocket = websocket
+        self.on_close = on_close
+        self.frame_stats = frame_stats
+        self.batch_size = batch_size
+        self.queue_size = queue_size
+        self.overflow_policy = overflow_policy
+        self.closed = False
+
+        self._messages = deque()
+        self._has_messages = asyncio.Event()
+        self._batch_full = asyncio.Event()
+        self._writer = None
+
+    def start(self):
+        self._writer = asyncio.create_task(self._write())
+        broadcast_stats.record('opened')
+
+    async def send(self, message: str, coalesce_key: Optional[str] = None):
+        if self.closed:
+            return
+
+        if self.overflow_policy == 'coalesce' and coalesce_key is not None:
+            # a newer state of the same kind makes the queued one obsolete, it is dropped and the
+            # new one goes to the end, so it stays behind everything that was queued in between
+            for queued_message in self._messages:
+                if queued_message[1] == coalesce_key:
+                    self._messages.remove(queued_message)
+                    broadcast_stats.record('coalesced')
+                    break
+
+        if len(self._messages) >= self.queue_size:
+            if self.overflow_policy == 'disconnect':
+                broadcast_stats.record('slow_disconnects')
+                await self.close(SLOW_CONSUMER_CLOSE_CODE)
+                return
+
+            self._messages.popleft()
+            broadcast_stats.record('dropped')
+
+        self._messages.append((message, coalesce_key, time.perf_counter()))
+        self._has_messages.set()
+
+        if len(self._messages) >= self.batch_size:
+            self._batch_full.set()
+
+    async def close(self, code: Optional[int] = None):
+        if self.closed:
+            return
+
+        self.closed = True
+        self.on_close()
+
+        if self._writer is not None:
+            broadcast_stats.record('closed')
+
+        if self._writer is not None and self._writer is not asyncio.current_task():
+            self._writer.cancel()
+
+        if code is not None:
+            try:
+                await self.websocket.close(code=code)
+            except Exception:
+                pass
+
+    def pending(self):
+        return len(self._messages)
+
+    async def _write(self):
+        while not self.closed:
+            await self._has_messages.wait()
+
+            while self._messages and not self.closed:
+                if self.batch_size > 1:
+                    await self._wait_for_batch()
+
+                batch = [self._messages.popleft() for _ in range(min(self.batch_size, len(self._messages)))]
+                if len(self._messages) < self.batch_size:
+                    self._batch_full.clear()
+
+                messages = [message for message, _, _ in batch]
+                frame = orjson.dumps(messages).decode() if self.batch_size > 1 else messages[0]
+
+                try:
+                    await asyncio.wait_for(self.websocket.send_text(frame), timeout=WS_SEND_TIMEOUT)
+                    broadcast_stats.record('sent')
+                    self.frame_stats.record(messages, frame, time.perf_counter() - batch[0][2])
+                except Exception as err:
+                    # the socket is dropped right away instead of waiting for the receive loop to notice
+                    print(f"Could not send to lobby socket, closing it: {err!r}")
+                    broadcast_stats.record('failed_sends')
+                    await self.close(SLOW_CONSUMER_CLOSE_CODE)
+                    return
+
+            self._has_messages.clear()
+
+    async def _wait_for_batch(self):
+        # the frame goes out once it is full or the oldest message waited for the flush interval
+        remaining = WS_BATCH_FLUSH_INTERVAL - (time.perf_counter() - self._messages[0][2])
+
+        if remaining > 0 and len(self._messages) < self.batch_size:
+            try:
+                await asyncio.wait_for(self._batch_full.wait(), timeout=remaining)
+            except asyncio.TimeoutError:
+                pass
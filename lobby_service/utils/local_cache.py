@@ -0,0 +1,107 @@
+from collections import OrderedDict
+import threading
+import time
+import os
+
+
+class CacheStats:
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def record(self, hit: bool):
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def snapshot(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {"hits": self.hits, "misses": self.misses,
+                    "hit_ratio": round(self.hits / lookups, 4) if lookups else None}
+
+
+class LocalCache:
+
+    max_entries = int(os.getenv('LOCAL_CACHE_MAX_ENTRIES', 10000))
+    max_bytes = int(os.getenv('LOCAL_CACHE_MAX_BYTES', 64 * 1024 * 1024))
+    ttl = float(os.getenv('LOCAL_CACHE_TTL', 30))
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._size = 0
+        self.generation = 0
+        self.stats = CacheStats()
+        # entries are only kept while invalidations from other replicas are being received
+        self.enabled = False
+
+    def get(self, key: str):
+        if not self.enabled:
+            return None
+
+        with self._lock:
+            entry = self._entries.get(key)
+
+            if entry is not None and entry[0] < time.monotonic():
+                self._drop(key)
+                entry = None
+
+            if entry is not None:
+                self._entries.move_to_end(key)
+
+        self.stats.record(entry is not None)
+
+        return entry[2] if entry is not None else None
+
+    def set(self, key: str, value, size: int, generation: int):
+        if not self.enabled or size > self.max_bytes:
+            return
+
+        with self._lock:
+            # an invalidation arrived while the value was being read from Redis, so it may be stale
+            if generation != self.generation:
+                return
+
+            if key in self._entries:
+                self._drop(key)
+
+            self._entries[key] = (time.monotonic() + self.ttl, size, value)
+            self._size += size
+
+            while len(self._entries) > self.max_entries or self._size > self.max_bytes:
+                self._drop(next(iter(self._entries)))
+
+    def invalidate(self, pattern: str):
+        # a trailing * drops every key with that prefix
+        with self._lock:
+            self.generation += 1
+
+            if pattern.endswith('*'):
+                for key in [key for key in self._entries if key.startswith(pattern[:-1])]:
+                    self._drop(key)
+            elif pattern in self._entries:
+                self._drop(pattern)
+
+    def clear(self):
+        with self._lock:
+            self.generation += 1
+            self._entries.clear()
+            self._size = 0
+
+    def snapshot(self):
+        with self._lock:
+            entries, size = len(self._entries), self._size
+
+        return {**self.stats.snapshot(), "enabled": self.enabled, "entries": entries, "bytes": size,
+                "max_entries": self.max_entries, "max_bytes": self.max_bytes}
+
+    def _drop(self, key: str):
+        self._size -= self._entries.pop(key)[1]
+
+
+local_cache = LocalCache()
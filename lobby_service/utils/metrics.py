@@ -0,0 +1,165 @@
+from bisect import bisect_left
+from typing import Callable, Tuple
+
+import anyio.to_thread
+import threading
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def format_labels(names: Tuple[str, ...], values: tuple, extra: str = ""):
+    pairs = [f'{name}="{escape_label(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class Counter:
+
+    def __init__(self, name: str, description: str, labels: Tuple[str, ...] = ()):
+        self.name = name
+        self.description = description
+        self.labels = labels
+        self.kind = 'counter'
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def inc(self, *label_values, amount: float = 1):
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            values = list(self._values.items())
+
+        return [f"{self.name}{format_labels(self.labels, label_values)} {value}" for label_values, value in values]
+
+
+class Histogram:
+
+    # one list of bucket counts per label set, a sample costs a bisect and a short critical section
+    def __init__(self, name: str, description: str, labels: Tuple[str, ...] = (), buckets: tuple = LATENCY_BUCKETS):
+        self.name = name
+        self.description = description
+        self.labels = labels
+        self.buckets = buckets
+        self.kind = 'histogram'
+        self._lock = threading.Lock()
+        self._series = {}
+
+    def observe(self, value: float, *label_values):
+        bucket = bisect_left(self.buckets, value)
+
+        with self._lock:
+            series = self._series.get(label_values)
+            if series is None:
+                series = self._series[label_values] = [0] * (len(self.buckets) + 1) + [0.0]
+
+            series[bucket] += 1
+            series[-1] += value
+
+    def samples(self):
+        with self._lock:
+            all_series = [(label_values, list(series)) for label_values, series in self._series.items()]
+
+        samples = []
+        for label_values, series in all_series:
+            cumulative = 0
+            for upper_bound, count in zip(self.buckets + ('+Inf',), series):
+                cumulative += count
+                bucket_labels = format_labels(self.labels, label_values, 'le="%s"' % upper_bound)
+                samples.append(f"{self.name}_bucket{bucket_labels} {cumulative}")
+
+            labels = format_labels(self.labels, label_values)
+            samples.append(f"{self.name}_sum{labels} {series[-1]}")
+            samples.append(f"{self.name}_count{labels} {cumulative}")
+
+        return samples
+
+
+class Gauge:
+
+    # read when the metrics are scraped, so nothing is paid on the hot path
+    def __init__(self, name: str, description: str, read: Callable[[], object], labels: Tuple[str, ...] = (),
+                 kind: str = 'gauge'):
+        self.name = name
+        self.description = description
+        self.read = read
+        self.labels = labels
+        self.kind = kind
+
+    def samples(self):
+        value = self.read()
+
+        if not self.labels:
+            return [f"{self.name} {value}"]
+
+        # labelled gauges read a dict of label value tuples to value
+        return [f"{self.name}{format_labels(self.labels, label_values)} {label_value}"
+                for label_values, label_value in value.items()]
+
+
+class MetricsRegistry:
+
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def counter(self, name: str, description: str, labels: Tuple[str, ...] = ()):
+        return self.register(Counter(name, description, labels))
+
+    def histogram(self, name: str, description: str, labels: Tuple[str, ...] = (), buckets: tuple = LATENCY_BUCKETS):
+        return self.register(Histogram(name, description, labels, buckets))
+
+    def gauge(self, name: str, description: str, read: Callable[[], object], labels: Tuple[str, ...] = (),
+              kind: str = 'gauge'):
+        return self.register(Gauge(name, description, read, labels, kind))
+
+    def render(self):
+        lines = []
+
+        for metric in self._metrics:
+            try:
+                samples = metric.samples()
+            except Exception as err:
+                print(f"Could not collect metric {metric.name}: {err}")
+                continue
+
+            lines.append(f"# HELP {metric.name} {metric.description}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(samples)
+
+        return "\n".join(lines) + "\n"
+
+
+metrics = MetricsRegistry()
+
+http_request_duration = metrics.histogram(
+    'http_request_duration_seconds', "HTTP request latency by route and status", ('method', 'route', 'status'))
+db_query_duration = metrics.histogram(
+    'db_query_duration_seconds', "Database query time by server role", ('role',))
+cache_requests = metrics.counter(
+    'cache_requests_total', "Cache lookups by tier, key family and result", ('tier', 'family', 'result'))
+rabbitmq_publish_duration = metrics.histogram(
+    'rabbitmq_publish_duration_seconds', "Time from publishing a message to its broker confirm")
+
+
+def threadpool_statistics():
+    # the pool sync endpoints run in, only readable from the event loop
+    return anyio.to_thread.current_default_thread_limiter().statistics()
+
+
+metrics.gauge('threadpool_threads_busy', "Worker threads running sync endpoints",
+              lambda: threadpool_statistics().borrowed_tokens)
+metrics.gauge('threadpool_threads_max', "Size of the worker thread pool",
+              lambda: threadpool_statistics().total_tokens)
+metrics.gauge('threadpool_queue_depth', "Calls waiting for a free worker thread",
+              lambda: threadpool_statistics().tasks_waiting)
@@ -1,39 +1,237 @@
+from pika.adapters.asyncio_connection import AsyncioConnection
+from typing import Awaitable, Callable, Optional
+from utils.event_codec import EVENT_CONTENT_TYPE, EventSequence, decode_event, render_event
+from utils.lobby_connection import lobby_fanout
+from utils.metrics import rabbitmq_publish_duration
+from utils.train_events_pb2 import EventType
+
+import asyncio
+import time
 import pika
-from typing import Callable
 import os
 
+# durable work queue drained by the booking intake workers of the train booking service
+BOOKING_QUEUE = os.getenv('BOOKING_QUEUE', 'booking_requests')
+BOOKING_PROPERTIES = pika.BasicProperties(content_type='application/json', delivery_mode=2)
+
+
 class RabbitMQ:
 
     rabbit_host = os.getenv('RABBITMQ_HOST')
     rabbit_user = os.getenv('RABBITMQ_USER')
     rabbit_password = os.getenv('RABBITMQ_PASS')
 
+    reconnect_delay = float(os.getenv('RABBITMQ_RECONNECT_DELAY', 2))
+    confirm_timeout = float(os.getenv('RABBITMQ_CONFIRM_TIMEOUT', 2))
+
     def __init__(self):
-        self.connection = pika.BlockingConnection(
-            pika.ConnectionParameters(host=self.rabbit_host, credentials=pika.PlainCredentials(self.rabbit_user, self.rabbit_password)))
-        
-        self.channel = self.connection.channel()
-        self.channel.exchange_declare(exchange='train_events', exchange_type='direct')
-
-    def consume_messages(self, routing_key: str, callback: Callable[[str], None]):
-        result = self.channel.queue_declare(queue='', exclusive=True)
-        queue_name = result.method.queue
-
-        self.channel.queue_bind(exchange='train_events', queue=queue_name, routing_key=routing_key)
-
-        def on_message(ch, method, properties, body):
-            callback(body.decode())
-
-        self.channel.basic_consume(queue=queue_name, on_message_callback=on_message, auto_ack=True)
-        self.channel.start_consuming()
-    
-    def close(self):
-        self.connection.close()
-
-
-def get_rabbitmq():
-    rabbitmq = RabbitMQ()
-    try:
-        yield rabbitmq
-    finally:
-        rabbitmq.close() 
+        # one exclusive queue per process, bound to the routing keys of the lobbies that have
+        # at least one local subscriber
+        self._subscribers = {}
+        self._events = asyncio.Queue()
+        self._event_sequence = EventSequence()
+
+        self._connection = None
+        self._channel = None
+        self._queue_name = None
+        self._dispatcher = None
+        self._stopping = False
+
+        self._confirming = False
+        self._confirmations = {}
+        self._delivery_tag = 0
+
+        self.consumed = 0
+        self.stale = 0
+        self.published = 0
+
+    async def start(self):
+        if self._dispatcher is not None:
+            return
+
+        self._stopping = False
+        self._dispatcher = asyncio.create_task(self._dispatch())
+        self._connect()
+
+    async def stop(self):
+        self._stopping = True
+
+        if self._connection is not None and not self._connection.is_closed:
+            self._connection.close()
+
+        if self._dispatcher is not None:
+            self._dispatcher.cancel()
+            self._dispatcher = None
+
+    def subscribe(self, routing_key: str, subscriber: Callable[[str, Optional[str]], Awaitable[None]]):
+        subscribers = self._subscribers.setdefault(routing_key, set())
+        subscribers.add(subscriber)
+
+        if len(subscribers) == 1:
+            self._bind(routing_key)
+
+    def unsubscribe(self, routing_key: str, subscriber: Callable[[str, Optional[str]], Awaitable[None]]):
+        subscribers = self._subscribers.get(routing_key)
+
+        if subscribers is None:
+            return
+
+        subscribers.discard(subscriber)
+
+        if not subscribers:
+            del self._subscribers[routing_key]
+            self._unbind(routing_key)
+
+    async def publish_booking_request(self, body: bytes):
+        # resolves once the broker has written the request to the durable queue
+        if not self._confirming:
+            raise RuntimeError("RabbitMQ is not connected")
+
+        confirmation = asyncio.get_running_loop().create_future()
+        started_at = time.perf_counter()
+        self._channel.basic_publish(exchange='', routing_key=BOOKING_QUEUE, body=body, properties=BOOKING_PROPERTIES)
+        self._delivery_tag += 1
+        self._confirmations[self._delivery_tag] = confirmation
+
+        await asyncio.wait_for(confirmation, timeout=self.confirm_timeout)
+        rabbitmq_publish_duration.observe(time.perf_counter() - started_at)
+        self.published += 1
+
+    def snapshot(self):
+        return {"connected": self._queue_name is not None, "routing_keys": len(self._subscribers),
+                "subscribers": sum(len(subscribers) for subscribers in self._subscribers.values()),
+                "consumed": self.consumed, "stale": self.stale, "pending": self._events.qsize(),
+                "published": self.published, "unconfirmed": len(self._confirmations)}
+
+    def _bind(self, routing_key: str):
+        if self._queue_name is not None:
+            self._channel.queue_bind(queue=self._queue_name, exchange='train_events', routing_key=routing_key)
+
+    def _unbind(self, routing_key: str):
+        if self._queue_name is not None:
+            self._channel.queue_unbind(queue=self._queue_name, exchange='train_events', routing_key=routing_key)
+
+    async def _dispatch(self):
+        # every event is rendered once and handed to the local subscribers of its lobby
+        while True:
+            routing_key, message, coalesce_key = await self._events.get()
+
+            subscribers = list(self._subscribers.get(routing_key, ()))
+            lobby_fanout.observe(len(subscribers), 'events')
+
+            for subscriber in subscribers:
+                try:
+                    await subscriber(message, coalesce_key)
+                except Exception as err:
+                    print(f"Could not deliver event of train {routing_key}: {err}")
+
+    def _connect(self):
+        parameters = pika.ConnectionParameters(
+            host=self.rabbit_host, credentials=pika.PlainCredentials(self.rabbit_user, self.rabbit_password))
+
+        self._connection = AsyncioConnection(
+            parameters, on_open_callback=self._on_connection_open,
+            on_open_error_callback=self._on_connection_open_error,
+            on_close_callback=self._on_connection_closed)
+
+    def _reconnect(self):
+        if not self._stopping:
+            asyncio.get_running_loop().call_later(self.reconnect_delay, self._connect)
+
+    def _on_connection_open(self, connection):
+        connection.channel(on_open_callback=self._on_channel_open)
+
+    def _on_connection_open_error(self, connection, err):
+        print(f"Could not connect to RabbitMQ: {err!r}")
+        self._reconnect()
+
+    def _on_connection_closed(self, connection, reason):
+        # the exclusive queue is deleted by the broker together with the connection
+        self._channel = None
+        self._queue_name = None
+        self._fail_confirmations()
+
+        if not self._stopping:
+            print(f"RabbitMQ consumer connection closed: {reason}")
+            self._reconnect()
+
+    def _on_channel_open(self, channel):
+        self._channel = channel
+        channel.add_on_close_callback(self._on_channel_closed)
+        channel.exchange_declare(exchange='train_events', exchange_type='direct',
+                                 callback=self._on_exchange_declared)
+
+    def _on_channel_closed(self, channel, reason):
+        self._queue_name = None
+        self._fail_confirmations()
+        if self._connection is not None and self._connection.is_open:
+            self._connection.close()
+
+    def _on_exchange_declared(self, frame):
+        self._channel.queue_declare(queue=BOOKING_QUEUE, durable=True, callback=self._on_booking_queue_declared)
+
+    def _on_booking_queue_declared(self, frame):
+        self._channel.confirm_delivery(ack_nack_callback=self._on_delivery_confirmation,
+                                       callback=self._on_confirm_selected)
+
+    def _on_confirm_selected(self, frame):
+        self._delivery_tag = 0
+        self._confirming = True
+        self._channel.queue_declare(queue='', exclusive=True, callback=self._on_queue_declared)
+
+    def _on_delivery_confirmation(self, frame):
+        method = frame.method
+
+        # the broker confirms many messages at once with the multiple flag
+        if method.multiple:
+            delivery_tags = [tag for tag in self._confirmations if tag <= method.delivery_tag]
+        else:
+            delivery_tags = [method.delivery_tag]
+
+        for delivery_tag in delivery_tags:
+            confirmation = self._confirmations.pop(delivery_tag, None)
+
+            if confirmation is None or confirmation.done():
+                continue
+
+            if isinstance(method, pika.spec.Basic.Ack):
+                confirmation.set_result(None)
+            else:
+                confirmation.set_exception(RuntimeError("RabbitMQ rejected the message"))
+
+    def _fail_confirmations(self):
+        self._confirming = False
+
+        for confirmation in self._confirmations.values():
+            if not confirmation.done():
+                confirmation.set_exception(RuntimeError("RabbitMQ connection was closed"))
+        self._confirmations.clear()
+
+    def _on_queue_declared(self, frame):
+        self._queue_name = frame.method.queue
+
+        for routing_key in self._subscribers:
+            self._bind(routing_key)
+
+        self._channel.basic_consume(queue=self._queue_name, on_message_callback=self._on_message, auto_ack=True)
+        print("RabbitMQ consumer is ready")
+
+    def _on_message(self, channel, method, properties, body):
+        self.consumed += 1
+
+        # plain text events are still accepted from publishers that predate the event schema
+        if properties.content_type != EVENT_CONTENT_TYPE:
+            self._events.put_nowait((method.routing_key, body.decode(), None))
+            return
+
+        event = decode_event(body)
+        if self._event_sequence.is_stale(event):
+            self.stale += 1
+            return
+
+        # only the latest seat count matters to a socket that fell behind
+        coalesce_key = f"seats:{event.train_id}" if event.type == EventType.BOOKINGS_REGISTERED else None
+        self._events.put_nowait((method.routing_key, render_event(event), coalesce_key))
+
+
+rabbitmq = RabbitMQ()
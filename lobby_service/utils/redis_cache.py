@@ -1,15 +1,358 @@
-from redis import RedisCluster, ConnectionError
+from fastapi import HTTPException, Response
+from redis import RedisCluster
+from redis.exceptions import LockError, RedisClusterException, RedisError
+from utils.local_cache import CacheStats, local_cache
+from utils.metrics import cache_requests
+from typing import NamedTuple, Optional
+import hashlib
+import json
+import orjson
+import math
+import random
+import threading
+import time
+import uuid
 import os
 
+REDIS_MAX_CONNECTIONS = int(os.getenv('REDIS_MAX_CONNECTIONS', 50))
+REDIS_SOCKET_TIMEOUT = float(os.getenv('REDIS_SOCKET_TIMEOUT', 1))
+REDIS_REINITIALIZE_STEPS = int(os.getenv('REDIS_REINITIALIZE_STEPS', 5))
+REDIS_RECONNECT_INTERVAL = float(os.getenv('REDIS_RECONNECT_INTERVAL', 5))
+REDIS_REQUIRED = os.getenv('REDIS_REQUIRED', 'false').lower() == 'true'
+
+ENTITY_CACHE_TTL = int(os.getenv('ENTITY_CACHE_TTL', 300))
+MISSING_ENTITY_CACHE_TTL = int(os.getenv('MISSING_ENTITY_CACHE_TTL', 30))
+
+# cached for ids that do not exist, so repeated lookups of missing entities skip the database as well
+MISSING_ENTITY = b"null"
+
+LIST_CACHE_TTL = int(os.getenv('LIST_CACHE_TTL', 120))
+LIST_CACHE_STALE_TTL = int(os.getenv('LIST_CACHE_STALE_TTL', 600))
+CACHE_LEASE_TIMEOUT = float(os.getenv('CACHE_LEASE_TIMEOUT', 10))
+CACHE_LEASE_WAIT = float(os.getenv('CACHE_LEASE_WAIT', 1))
+CACHE_EARLY_REFRESH_BETA = float(os.getenv('CACHE_EARLY_REFRESH_BETA', 1))
+
+CACHE_INVALIDATION_CHANNEL = os.getenv('CACHE_INVALIDATION_CHANNEL', 'cache_invalidation')
+
+# lets a replica skip the invalidations it published itself
+INSTANCE_ID = uuid.uuid4().hex
+
+redis_tier_stats = CacheStats()
+
+
+class CachedPage(NamedTuple):
+    body: bytes
+    etag: str
+    next_cursor: Optional[int]
+
+
+_redis_client = None
+_redis_client_lock = threading.Lock()
+_last_connect_attempt = 0.0
+
 
 def get_redis_client():
-    redis_client = RedisCluster(
-        host=os.getenv("REDIS_HOST"), port=os.getenv('REDIS_PORT'))
+    global _redis_client, _last_connect_attempt
+
+    if _redis_client is not None:
+        return _redis_client
+
+    with _redis_client_lock:
+        if _redis_client is not None:
+            return _redis_client
 
+        # while the cluster is down only one attempt is made per interval, other requests fail right away
+        if time.monotonic() - _last_connect_attempt < REDIS_RECONNECT_INTERVAL:
+            raise HTTPException(status_code=503, detail="Redis Cluster is unavailable")
+
+        _last_connect_attempt = time.monotonic()
+
+        try:
+            # the slot map is loaded once here and refreshed by the client itself on MOVED and ASK replies
+            _redis_client = RedisCluster(
+                host=os.getenv("REDIS_HOST"), port=os.getenv('REDIS_PORT'), max_connections=REDIS_MAX_CONNECTIONS,
+                socket_timeout=REDIS_SOCKET_TIMEOUT, socket_connect_timeout=REDIS_SOCKET_TIMEOUT,
+                reinitialize_steps=REDIS_REINITIALIZE_STEPS)
+            print("Connected to Redis Cluster")
+        except (RedisError, RedisClusterException) as err:
+            print(f"Could not connect to Redis Cluster: {err}")
+            raise HTTPException(status_code=503, detail="Redis Cluster is unavailable")
+
+    return _redis_client
+
+
+def connect_redis_client():
     try:
-        redis_client.ping()
-        print("Connected to Redis Cluster")
-    except ConnectionError:
-        print("Could not connect to Redis Cluster")
+        get_redis_client()
+    except HTTPException:
+        if REDIS_REQUIRED:
+            raise RuntimeError("Redis Cluster is required but could not be reached")
+
+
+def close_redis_client():
+    global _redis_client
+
+    with _redis_client_lock:
+        if _redis_client is not None:
+            _redis_client.close()
+            _redis_client = None
+
+
+class CacheBatch:
+
+    # key writes of one operation go out in a single pipeline and their invalidations in a single
+    # publish, since PUBLISH can not be pipelined on a cluster
+    def __init__(self, redis_client: RedisCluster):
+        self.redis_client = redis_client
+        self.pipeline = redis_client.pipeline()
+        self.patterns = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.execute()
+
+    def cache_entity(self, key: str, value: dict):
+        self.pipeline.setex(name=key, time=ENTITY_CACHE_TTL, value=json.dumps(value))
+        self.patterns.append(key)
+
+    def evict_entities(self, *keys: str):
+        for key in keys:
+            self.pipeline.delete(key)
+        self.patterns.extend(keys)
+
+    def invalidate_list_cache(self, name: str):
+        self.pipeline.incr(f"{name}:version")
+        self.patterns.append(f"{name}:list:*")
+
+    def execute(self):
+        if self.patterns:
+            self.pipeline.execute()
+            publish_invalidation(self.redis_client, *self.patterns)
+            self.patterns = []
+
+
+def get_cached_entity(redis_client: RedisCluster, key: str):
+    family = key.split(':')[0]
+    value = local_cache.get(key)
+
+    if value is not None:
+        cache_requests.inc('local', family, 'hit')
+        return value
+
+    cache_requests.inc('local', family, 'miss')
+    generation = local_cache.generation
+    cached_value = redis_client.get(key)
+    redis_tier_stats.record(cached_value is not None)
+
+    if cached_value is None:
+        cache_requests.inc('redis', family, 'miss')
+        return None
+
+    cache_requests.inc('redis', family, 'hit')
+
+    value = MISSING_ENTITY if cached_value == MISSING_ENTITY else json.loads(cached_value)
+    local_cache.set(key, value, len(cached_value), generation)
+
+    return value
+
+
+def cache_entity(redis_client: RedisCluster, key: str, value: dict):
+    # read-through fill, nothing cached elsewhere can be newer so no invalidation is published
+    redis_client.setex(name=key, time=ENTITY_CACHE_TTL, value=json.dumps(value))
+
+
+def cache_missing_entity(redis_client: RedisCluster, key: str):
+    redis_client.setex(name=key, time=MISSING_ENTITY_CACHE_TTL, value=MISSING_ENTITY)
+
+
+def evict_entities(redis_client: RedisCluster, *keys: str):
+    with CacheBatch(redis_client) as batch:
+        batch.evict_entities(*keys)
+
+
+def get_cached_list(redis_client: RedisCluster, name: str, filters: dict, compute):
+    digest = hashlib.sha1(json.dumps(filters, sort_keys=True).encode()).hexdigest()
+    cache_key = f"{name}:list:{digest}"
+
+    family = f"{name}:list"
+    page = local_cache.get(cache_key)
+
+    if page is not None:
+        cache_requests.inc('local', family, 'hit')
+        return page
+
+    cache_requests.inc('local', family, 'miss')
+
+    # every write bumps the version, entries computed for an older one are served stale
+    # only while a single worker holding the lease recomputes them
+    generation = local_cache.generation
+    pipeline = redis_client.pipeline()
+    pipeline.get(f"{name}:version")
+    pipeline.get(cache_key)
+    version, cached_value = pipeline.execute()
+
+    version = int(version or 0)
+    entry, page = load_cache_entry(cached_value)
+
+    is_fresh = entry is not None and entry["version"] >= version
+    redis_tier_stats.record(is_fresh)
+    cache_requests.inc('redis', family, 'hit' if is_fresh else 'miss')
+
+    if is_fresh and not needs_early_refresh(entry):
+        local_cache.set(cache_key, page, len(page.body), generation)
+        return page
+
+    lease = redis_client.lock(f"{cache_key}:lease", timeout=CACHE_LEASE_TIMEOUT)
+
+    if not lease.acquire(blocking=False):
+        if page is None:
+            page = wait_for_cache_entry(redis_client, cache_key)
+
+        if page is not None:
+            return page
+
+        # the lease holder is too slow or died, so this worker computes the value itself
+        lease = None
+
+    try:
+        started_at = time.perf_counter()
+        page = encode_page(compute())
+        entry = {"version": version, "expires_at": time.time() + LIST_CACHE_TTL,
+                 "delta": time.perf_counter() - started_at, "etag": page.etag, "next_cursor": page.next_cursor}
+        redis_client.setex(name=cache_key, time=LIST_CACHE_TTL + LIST_CACHE_STALE_TTL,
+                           value=orjson.dumps(entry) + b"\n" + page.body)
+        local_cache.set(cache_key, page, len(page.body), generation)
+    finally:
+        if lease is not None:
+            try:
+                lease.release()
+            except LockError:
+                pass
+
+    return page
+
+
+def encode_page(page: dict):
+    # the items are already validated, so the response body is encoded once when the cache is filled
+    body = orjson.dumps(page["items"])
+    return CachedPage(body, f'"{hashlib.sha1(body).hexdigest()}"', page["next_cursor"])
+
+
+def load_cache_entry(cached_value):
+    if not cached_value:
+        return None, None
+
+    header, body = cached_value.split(b"\n", 1)
+    entry = orjson.loads(header)
+
+    return entry, CachedPage(body, entry["etag"], entry["next_cursor"])
+
+
+def page_response(page: CachedPage, if_none_match: Optional[str]):
+    headers = {"ETag": page.etag}
+
+    if page.next_cursor is not None:
+        headers["X-Next-Cursor"] = str(page.next_cursor)
+
+    if if_none_match is not None and page.etag in [etag.strip() for etag in if_none_match.split(",")]:
+        return Response(status_code=304, headers=headers)
+
+    return Response(content=page.body, media_type="application/json", headers=headers)
+
+
+def needs_early_refresh(entry: dict):
+    # probabilistic early expiration: the closer the entry is to its TTL and the longer it took
+    # to compute, the likelier a single reader refreshes it before everyone misses at once
+    jitter = entry["delta"] * CACHE_EARLY_REFRESH_BETA * -math.log(1 - random.random())
+    return time.time() + jitter >= entry["expires_at"]
+
+
+def wait_for_cache_entry(redis_client: RedisCluster, cache_key: str):
+    deadline = time.monotonic() + CACHE_LEASE_WAIT
+
+    while time.monotonic() < deadline:
+        time.sleep(0.05)
+        _, page = load_cache_entry(redis_client.get(cache_key))
+
+        if page is not None:
+            return page
+
+    return None
+
+
+def invalidate_list_cache(redis_client: RedisCluster, name: str):
+    with CacheBatch(redis_client) as batch:
+        batch.invalidate_list_cache(name)
+
+
+def publish_invalidation(redis_client: RedisCluster, *patterns: str):
+    for pattern in patterns:
+        local_cache.invalidate(pattern)
+
+    redis_client.publish(CACHE_INVALIDATION_CHANNEL, " ".join([INSTANCE_ID, *patterns]))
+
+
+class CacheInvalidationListener:
+
+    def __init__(self):
+        self._stop_listening = threading.Event()
+        self._listener = None
+
+    def start(self):
+        if self._listener is not None:
+            return
+
+        self._stop_listening.clear()
+        self._listener = threading.Thread(target=self._listen, daemon=True)
+        self._listener.start()
+
+    def stop(self):
+        self._stop_listening.set()
+        self._listener = None
+
+    def handle_message(self, message: str):
+        instance_id, *patterns = message.split(" ")
+
+        if instance_id != INSTANCE_ID:
+            for pattern in patterns:
+                local_cache.invalidate(pattern)
+
+    def _listen(self):
+        while not self._stop_listening.is_set():
+            pubsub = None
+
+            try:
+                pubsub = get_redis_client().pubsub()
+                pubsub.subscribe(CACHE_INVALIDATION_CHANNEL)
+
+                # invalidations published while this replica was not subscribed are lost,
+                # so it starts over with an empty local cache
+                local_cache.clear()
+                local_cache.enabled = True
+
+                while not self._stop_listening.is_set():
+                    message = pubsub.get_message(ignore_subscribe_messages=True, timeout=1.0)
+
+                    if message is not None and message["type"] == "message":
+                        self.handle_message(message["data"].decode())
+
+            except Exception as err:
+                print(f"Cache invalidation listener failed: {err}")
+
+            finally:
+                local_cache.enabled = False
+                local_cache.clear()
+
+                if pubsub is not None:
+                    try:
+                        pubsub.close()
+                    except Exception:
+                        pass
+
+            self._stop_listening.wait(1)
+
 
-    return redis_client
+cache_invalidation_listener = CacheInvalidationListener()
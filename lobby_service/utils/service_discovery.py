@@ -0,0 +1,147 @@
+from contextlib import asynccontextmanager
+from redis.asyncio import Redis
+from typing import Optional
+
+import asyncio
+import random
+import httpx
+import time
+import os
+
+# the registry of the discovery service, the same one the gateway balances over
+DISCOVERY_REDIS_HOST = os.getenv('DISCOVERY_REDIS_HOST')
+DISCOVERY_REDIS_PORT = int(os.getenv('DISCOVERY_REDIS_PORT', 6379))
+DISCOVERY_REFRESH_INTERVAL = float(os.getenv('DISCOVERY_REFRESH_INTERVAL', 5))
+DISCOVERY_TIMEOUT = float(os.getenv('DISCOVERY_TIMEOUT', 1))
+# a replica that failed this many calls in a row is left out for a while, longer every time
+DISCOVERY_EJECTION_FAILURES = int(os.getenv('DISCOVERY_EJECTION_FAILURES', 3))
+DISCOVERY_EJECTION_TIME = float(os.getenv('DISCOVERY_EJECTION_TIME', 10))
+DISCOVERY_MAX_EJECTION_TIME = float(os.getenv('DISCOVERY_MAX_EJECTION_TIME', 120))
+
+
+class Replica:
+
+    def __init__(self, address: str):
+        self.address = address
+        self.outstanding = 0
+        self.failures = 0
+        self.ejections = 0
+        self.ejected_until = 0.0
+
+    def available(self, now: float):
+        return self.ejected_until <= now
+
+
+class ServiceDiscovery:
+
+    def __init__(self, service_name: str, path: str, fallback_url: str):
+        self.service_name = service_name
+        self.path = path
+        self.fallback_url = fallback_url
+
+        self._replicas = {}
+        self._redis_client = None
+        self._refresher = None
+
+        self.refreshed_at = None
+        self.failed_refreshes = 0
+        self.fallbacks = 0
+        self.ejections = 0
+
+    async def start(self):
+        if DISCOVERY_REDIS_HOST is None or self._refresher is not None:
+            return
+
+        self._redis_client = Redis(host=DISCOVERY_REDIS_HOST, port=DISCOVERY_REDIS_PORT,
+                                   socket_timeout=DISCOVERY_TIMEOUT, socket_connect_timeout=DISCOVERY_TIMEOUT)
+        await self.refresh()
+        self._refresher = asyncio.create_task(self._refresh_periodically())
+
+    async def stop(self):
+        if self._refresher is not None:
+            self._refresher.cancel()
+            self._refresher = None
+
+        if self._redis_client is not None:
+            await self._redis_client.aclose()
+            self._redis_client = None
+
+    async def refresh(self):
+        try:
+            addresses = await self._redis_client.lrange(self.service_name, 0, -1)
+        except Exception as err:
+            # the last known replicas stay in use, ejection takes care of the ones that went away
+            print(f"Could not refresh {self.service_name} replicas: {err}")
+            self.failed_refreshes += 1
+            return
+
+        addresses = [address.decode() for address in addresses]
+        self._replicas = {address: self._replicas.get(address) or Replica(address) for address in addresses}
+        self.refreshed_at = time.time()
+
+    def pick(self) -> Optional[Replica]:
+        now = time.monotonic()
+        replicas = [replica for replica in self._replicas.values() if replica.available(now)]
+
+        if not replicas:
+            return None
+
+        # least outstanding requests, ties are broken at random so the replicas share an idle period
+        fewest = min(replica.outstanding for replica in replicas)
+        return random.choice([replica for replica in replicas if replica.outstanding == fewest])
+
+    @asynccontextmanager
+    async def endpoint(self):
+        replica = self.pick()
+
+        if replica is None:
+            self.fallbacks += 1
+            yield self.fallback_url
+            return
+
+        replica.outstanding += 1
+        try:
+            yield f"http://{replica.address}{self.path}"
+        except (httpx.TransportError, asyncio.TimeoutError):
+            self.record(replica, succeeded=False)
+            raise
+        except httpx.HTTPStatusError as err:
+            self.record(replica, succeeded=err.response.status_code < 500)
+            raise
+        else:
+            self.record(replica, succeeded=True)
+        finally:
+            replica.outstanding -= 1
+
+    def record(self, replica: Replica, succeeded: bool):
+        if succeeded:
+            replica.failures = 0
+            replica.ejections = 0
+            return
+
+        replica.failures += 1
+        if replica.failures >= DISCOVERY_EJECTION_FAILURES:
+            replica.failures = 0
+            replica.ejections += 1
+            replica.ejected_until = time.monotonic() + min(
+                DISCOVERY_EJECTION_TIME * replica.ejections, DISCOVERY_MAX_EJECTION_TIME)
+            self.ejections += 1
+            print(f"Ejected {self.service_name} replica {replica.address} after consecutive failures")
+
+    def snapshot(self):
+        now = time.monotonic()
+        return {"enabled": DISCOVERY_REDIS_HOST is not None, "refreshed_at": self.refreshed_at,
+                "failed_refreshes": self.failed_refreshes, "fallbacks": self.fallbacks, "ejections": self.ejections,
+                "replicas": {replica.address: {"outstanding": replica.outstanding,
+                                               "ejected": not replica.available(now)}
+                             for replica in self._replicas.values()}}
+
+    async def _refresh_periodically(self):
+        while True:
+            await asyncio.sleep(DISCOVERY_REFRESH_INTERVAL)
+            await self.refresh()
+
+
+bookings_discovery = ServiceDiscovery(os.getenv('BOOKINGS_SERVICE_NAME', 'train_booking_service'),
+                                      os.getenv('BOOKINGS_SERVICE_PATH', '/bookings'),
+                                      os.getenv("BOOKINGS_SERVICE_URL"))
@@ -0,0 +1,24 @@
+from uvicorn.protocols.websockets.websockets_impl import WebSocketProtocol
+from websockets.extensions.permessage_deflate import ServerPerMessageDeflateFactory
+
+import os
+
+WS_PER_MESSAGE_DEFLATE = os.getenv('WS_PER_MESSAGE_DEFLATE', 'true').lower() == 'true'
+WS_DEFLATE_LEVEL = int(os.getenv('WS_DEFLATE_LEVEL', 6))
+WS_DEFLATE_MEM_LEVEL = int(os.getenv('WS_DEFLATE_MEM_LEVEL', 8))
+WS_DEFLATE_MAX_WINDOW_BITS = int(os.getenv('WS_DEFLATE_MAX_WINDOW_BITS', 15))
+# trades compression ratio for the memory a compression context keeps per socket
+WS_DEFLATE_NO_CONTEXT_TAKEOVER = os.getenv('WS_DEFLATE_NO_CONTEXT_TAKEOVER', 'false').lower() == 'true'
+
+
+class LobbyWebSocketProtocol(WebSocketProtocol):
+
+    # uvicorn can only switch permessage-deflate on or off, the compression itself is tuned here
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+
+        if self.config.ws_per_message_deflate:
+            self.available_extensions = [ServerPerMessageDeflateFactory(
+                server_no_context_takeover=WS_DEFLATE_NO_CONTEXT_TAKEOVER,
+                server_max_window_bits=WS_DEFLATE_MAX_WINDOW_BITS,
+                compress_settings={"level": WS_DEFLATE_LEVEL, "memLevel": WS_DEFLATE_MEM_LEVEL})]
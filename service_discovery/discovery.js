@@ -27,11 +27,33 @@ const redisClient = redis.createClient({
 });
 redisClient.connect();
 
+// a replica whose last heartbeat is older than this is removed from the registry
+const HEARTBEAT_TTL = Number(process.env.HEARTBEAT_TTL) || 15000;
+const HEARTBEAT_SWEEP_INTERVAL = Number(process.env.HEARTBEAT_SWEEP_INTERVAL) || 5000;
+
+async function recordHeartbeat(serviceKey, serviceInfo, load) {
+    await redisClient.multi()
+        .sAdd('services', serviceKey)
+        .zAdd(`${serviceKey}:heartbeats`, { score: Date.now(), value: serviceInfo })
+        .hSet(`${serviceKey}:load`, serviceInfo, JSON.stringify(load || {}))
+        .exec();
+}
+
+async function removeService(serviceKey, serviceInfo) {
+    await redisClient.multi()
+        .lRem(serviceKey, 0, serviceInfo)
+        .zRem(`${serviceKey}:heartbeats`, serviceInfo)
+        .hDel(`${serviceKey}:load`, serviceInfo)
+        .exec();
+}
+
 function registerService(call, callback) {
     const serviceInfo = `${call.request.address}:${call.request.port}`;
     const serviceKey = call.request.name
 
-    redisClient.lPush(serviceKey, serviceInfo)   
+    redisClient.lRem(serviceKey, 0, serviceInfo)
+        .then(() => redisClient.lPush(serviceKey, serviceInfo))
+        .then(() => recordHeartbeat(serviceKey, serviceInfo))
         .then(() => {
             logger.info(JSON.stringify({
                 service: 'service_discovery',
@@ -52,8 +74,97 @@ function registerService(call, callback) {
         });
 }
 
+async function heartbeatService(call, callback) {
+    const serviceInfo = `${call.request.address}:${call.request.port}`;
+    const serviceKey = call.request.name
+
+    try {
+        // the first heartbeat of a replica, or one that comes after its entry expired, registers it
+        if (await redisClient.lPos(serviceKey, serviceInfo) === null) {
+            await redisClient.lPush(serviceKey, serviceInfo);
+
+            logger.info(JSON.stringify({
+                service: 'service_discovery',
+                module: 'heartbeat_service',
+                msg: `Service registered by heartbeat: ${serviceKey} ${serviceInfo}`,
+            }));
+        }
+
+        await recordHeartbeat(serviceKey, serviceInfo, call.request.load);
+        callback(null, { success: true, message: 'Heartbeat recorded' });
+
+    } catch (err) {
+        logger.error(JSON.stringify({
+            service: 'service_discovery',
+            module: 'heartbeat_service',
+            msg: `Failed to record heartbeat: ${serviceKey}. Error: ${err.message}`,
+        }));
+
+        callback(null, { success: false, message: 'Failed to record heartbeat' });
+    }
+}
+
+async function deregisterService(call, callback) {
+    const serviceInfo = `${call.request.address}:${call.request.port}`;
+    const serviceKey = call.request.name
+
+    try {
+        await removeService(serviceKey, serviceInfo);
+
+        logger.info(JSON.stringify({
+            service: 'service_discovery',
+            module: 'deregister_service',
+            msg: `Service deregistered successfully: ${serviceKey} ${serviceInfo}`,
+        }));
+
+        callback(null, { success: true, message: 'Service deregistered successfully' });
+
+    } catch (err) {
+        logger.error(JSON.stringify({
+            service: 'service_discovery',
+            module: 'deregister_service',
+            msg: `Failed to deregister service: ${serviceKey}. Error: ${err.message}`,
+        }));
+
+        callback(null, { success: false, message: 'Failed to deregister service' });
+    }
+}
+
+async function expireStaleServices() {
+    const serviceKeys = await redisClient.sMembers('services');
+
+    for (const serviceKey of serviceKeys) {
+        const staleServices = await redisClient.zRangeByScore(
+            `${serviceKey}:heartbeats`, 0, Date.now() - HEARTBEAT_TTL);
+
+        for (const serviceInfo of staleServices) {
+            await removeService(serviceKey, serviceInfo);
+
+            logger.warn(JSON.stringify({
+                service: 'service_discovery',
+                module: 'heartbeat_sweep',
+                msg: `${serviceKey} ${serviceInfo} expired, no heartbeat for ${HEARTBEAT_TTL} ms`,
+            }));
+        }
+    }
+}
+
+setInterval(() => {
+    expireStaleServices().catch(err => {
+        logger.error(JSON.stringify({
+            service: 'service_discovery',
+            module: 'heartbeat_sweep',
+            msg: `Failed to expire stale services. Error: ${err.message}`,
+        }));
+    });
+}, HEARTBEAT_SWEEP_INTERVAL);
+
 const grpcServer = new grpc.Server();
-grpcServer.addService(ServiceDiscovery.service, { Register: registerService });
+grpcServer.addService(ServiceDiscovery.service, {
+    Register: registerService,
+    Heartbeat: heartbeatService,
+    Deregister: deregisterService,
+});
 grpcServer.bindAsync(`0.0.0.0:${process.env.GRPC_PORT}`, grpc.ServerCredentials.createInsecure(), (error, port) => {
     if (error) {
         logger.error(JSON.stringify({
@@ -1,31 +1,100 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
 from sqlalchemy.orm import sessionmaker, declarative_base
-from tinydb import TinyDB, Query
-import random
+from .topology import DbTopology
+import threading
+import time
+import os
 
 Base = declarative_base()
 
+DB_CONNECTIONS_STORAGE = "../db_connections.json"
 
-def get_db():
-    db_connections_storage = TinyDB("../db_connections.json")
-    Record = Query()
 
-    db_connections = db_connections_storage.search(
-        Record.key == 'db_connections')
+class EngineRegistry:
+
+    pool_size = int(os.getenv('DB_POOL_SIZE', 5))
+    max_overflow = int(os.getenv('DB_MAX_OVERFLOW', 10))
+    pool_timeout = int(os.getenv('DB_POOL_TIMEOUT', 5))
+    pool_recycle = int(os.getenv('DB_POOL_RECYCLE', 1800))
+    pool_pre_ping = os.getenv('DB_POOL_PRE_PING', 'true').lower() == 'true'
+    echo = os.getenv('DB_ECHO', 'false').lower() == 'true'
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._engines = {}
+        self._session_factories = {}
+        self.on_query = None
+
+    def configure(self, master: str, slaves: list):
+        with self._lock:
+            engines = {}
+            for dsn in [master, *slaves]:
+                engines[dsn] = self._engines.get(dsn) or self._create_engine(dsn)
+
+            retired_engines = [engine for dsn, engine in self._engines.items()
+                               if dsn not in engines]
+
+            # both dicts are replaced as a whole, so request threads never see a half-updated registry
+            self._session_factories = {dsn: sessionmaker(autocommit=False, autoflush=False, bind=engine)
+                                       for dsn, engine in engines.items()}
+            self._engines = engines
+
+        # checked-out connections are not closed by dispose, they are dropped when returned,
+        # so in-flight requests on the old pools finish normally
+        for engine in retired_engines:
+            engine.dispose()
+
+    def get_engine(self, dsn: str):
+        return self._engines[dsn]
+
+    def get_session(self, dsn: str):
+        return self._session_factories[dsn]()
+
+    def pool_saturation(self):
+        # share of the busiest pool's connections, overflow included, that are checked out
+        return max((engine.pool.checkedout() / (self.pool_size + self.max_overflow)
+                    for engine in list(self._engines.values())), default=0.0)
+
+    def _create_engine(self, dsn: str):
+        engine = create_engine(dsn, echo=self.echo, pool_size=self.pool_size, max_overflow=self.max_overflow,
+                               pool_timeout=self.pool_timeout, pool_recycle=self.pool_recycle,
+                               pool_pre_ping=self.pool_pre_ping)
+
+        @event.listens_for(engine, "before_cursor_execute")
+        def before_cursor_execute(connection, cursor, statement, parameters, context, executemany):
+            connection.info['query_started_at'] = time.perf_counter()
+
+        @event.listens_for(engine, "after_cursor_execute")
+        def after_cursor_execute(connection, cursor, statement, parameters, context, executemany):
+            started_at = connection.info.pop('query_started_at', None)
+
+            if self.on_query is not None and started_at is not None:
+                self.on_query(dsn, time.perf_counter() - started_at)
 
-    master_db = get_connection(db_connections[0]['master'])
-    slave_db = get_connection(random.choice(db_connections[0]['slaves']))
+        return engine
+
+
+engine_registry = EngineRegistry()
+
+db_topology = DbTopology(engine_registry)
+
+
+def get_master_db():
+    if db_topology.master is None:
+        db_topology.load_from_storage(DB_CONNECTIONS_STORAGE)
+
+    return db_topology.get_master_session()
+
+
+def get_db():
+    if db_topology.master is None:
+        db_topology.load_from_storage(DB_CONNECTIONS_STORAGE)
+
+    master_db, slave_db, replica = db_topology.get_sessions()
 
     try:
         yield (master_db, slave_db)
     finally:
         master_db.close()
         slave_db.close()
-
-
-def get_connection(connection_string: str):
-    engine = create_engine(connection_string, echo=True)
-    SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
-    db = SessionLocal()
-
-    return db
+        db_topology.release(replica)
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, CheckConstraint
+from sqlalchemy import Column, Integer, String, DateTime, ForeignKey, CheckConstraint, Index, LargeBinary, func
 from sqlalchemy.orm import Mapped, mapped_column
 from .database import Base
 
@@ -8,7 +8,7 @@ class Train(Base):
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True, index=True)
     route = Column(String(100), nullable=False, index=True)
-    departure_time = Column(DateTime, nullable=False)
+    departure_time = Column(DateTime, nullable=False, index=True)
     arrival_time = Column(DateTime, nullable=False)
     available_seats = Column(Integer, nullable=False, index=True)
 
@@ -24,3 +24,18 @@ class Booking(Base):
     id = Column(Integer, primary_key=True, index=True)
     train_id: Mapped[int] = mapped_column(ForeignKey("trains.id"), nullable=False) 
     user_credentials = Column(String(100), nullable=False, index=True)
+
+    __table_args__ = (
+        Index('uq_bookings_train_user', 'train_id', 'user_credentials', unique=True),
+    )
+
+
+class OutboxEvent(Base):
+    __tablename__ = 'outbox_events'
+
+    # the id is also the order in which the events are relayed to the exchange
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    routing_key = Column(String(100), nullable=False)
+    # an encoded TrainEvent, the sequence number is filled in by the relay
+    payload = Column(LargeBinary, nullable=False)
+    created_at = Column(DateTime, nullable=False, server_default=func.now())
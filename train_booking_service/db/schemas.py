@@ -8,6 +8,23 @@ class DbUpdateDto(BaseModel):
     slave_dbs: List[str] = Field(..., max_items=10)
 
 
+class PageFilterDto(BaseModel):
+    after_id: Optional[int] = None
+    limit: int = Field(100, ge=1, le=1000)
+
+
+class TrainFilterDto(PageFilterDto):
+    route: Optional[str] = Field(None, max_length=100)
+    departure_from: Optional[datetime] = None
+    departure_to: Optional[datetime] = None
+    min_seats: Optional[int] = Field(None, ge=0)
+
+
+class BookingFilterDto(PageFilterDto):
+    train_id: Optional[int] = None
+    user_credentials: Optional[str] = Field(None, max_length=100)
+
+
 class TrainBaseDto(BaseModel):
     route: str = Field(..., max_length=100)
     departure_time: datetime
@@ -37,6 +54,16 @@ class BookingBaseDto(BaseModel):
         from_attributes = True
 
 
+class BookingBatchDto(BaseModel):
+    bookings: List[BookingBaseDto] = Field(..., min_length=1, max_length=500)
+    all_or_nothing: bool = True
+
+
+class BookingBatchResultDto(BookingBaseDto):
+    booking_id: Optional[int] = None
+    error: Optional[str] = None
+
+
 class BookingUpdateDto(BaseModel):
     user_credentials: str = Field(..., max_length=100)
 
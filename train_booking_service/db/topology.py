@@ -0,0 +1,147 @@
+from fastapi import HTTPException
+from sqlalchemy import text
+from tinydb import TinyDB, Query
+from utils.metrics import db_query_duration
+import threading
+import time
+import os
+
+REPLICATION_LAG_QUERY = text("""
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() THEN 0
+        WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+    END
+""")
+
+
+class ReplicaState:
+
+    def __init__(self, dsn: str):
+        self.dsn = dsn
+        self.healthy = True
+        self.lag_seconds = 0.0
+        self.latency_seconds = None
+        self.outstanding = 0
+
+    def record_latency(self, elapsed: float, decay: float):
+        if self.latency_seconds is None:
+            self.latency_seconds = elapsed
+        else:
+            self.latency_seconds += decay * (elapsed - self.latency_seconds)
+
+    def score(self):
+        # least outstanding requests, weighted by how fast the replica has been answering lately
+        return (self.outstanding + 1) * (self.latency_seconds or 0.001)
+
+
+class DbTopology:
+
+    max_replica_lag = float(os.getenv('DB_MAX_REPLICA_LAG', 5))
+    probe_interval = float(os.getenv('DB_PROBE_INTERVAL', 2))
+    latency_decay = float(os.getenv('DB_LATENCY_DECAY', 0.2))
+
+    def __init__(self, engine_registry):
+        self.engine_registry = engine_registry
+        self.engine_registry.on_query = self.record_query_latency
+
+        self._lock = threading.Lock()
+        self._stop_probing = threading.Event()
+        self._prober = None
+
+        self.master = None
+        self.replicas = {}
+
+    def update(self, master: str, slaves: list):
+        with self._lock:
+            self.engine_registry.configure(master, slaves)
+            self.master = master
+            self.replicas = {dsn: self.replicas.get(dsn) or ReplicaState(dsn) for dsn in slaves}
+
+    def load_from_storage(self, db_connections_storage: str):
+        Record = Query()
+        db_connections = TinyDB(db_connections_storage).search(
+            Record.key == 'db_connections')
+
+        if db_connections and self.master is None:
+            self.update(db_connections[0]['master'], db_connections[0]['slaves'])
+
+    def select_replica(self):
+        candidates = [replica for replica in self.replicas.values()
+                      if replica.healthy and replica.lag_seconds <= self.max_replica_lag]
+
+        if not candidates:
+            return None
+
+        return min(candidates, key=ReplicaState.score)
+
+    def get_master_session(self):
+        if self.master is None:
+            raise HTTPException(
+                status_code=503, detail="Database connections are not configured")
+
+        return self.engine_registry.get_session(self.master)
+
+    def get_sessions(self):
+        if self.master is None:
+            raise HTTPException(
+                status_code=503, detail="Database connections are not configured")
+
+        with self._lock:
+            master_db = self.engine_registry.get_session(self.master)
+            replica = self.select_replica()
+
+            if replica is None:
+                # every replica is down or lagging too far behind, the master serves reads meanwhile
+                return master_db, self.engine_registry.get_session(self.master), None
+
+            replica.outstanding += 1
+
+            return master_db, self.engine_registry.get_session(replica.dsn), replica
+
+    def release(self, replica: ReplicaState):
+        if replica is not None:
+            with self._lock:
+                replica.outstanding -= 1
+
+    def record_query_latency(self, dsn: str, elapsed: float):
+        db_query_duration.observe(elapsed, 'master' if dsn == self.master else 'replica')
+        replica = self.replicas.get(dsn)
+
+        if replica is not None:
+            replica.record_latency(elapsed, self.latency_decay)
+
+    def probe(self):
+        for replica in list(self.replicas.values()):
+            try:
+                started_at = time.perf_counter()
+                with self.engine_registry.get_engine(replica.dsn).connect() as connection:
+                    lag_seconds = connection.execute(REPLICATION_LAG_QUERY).scalar()
+
+                replica.record_latency(time.perf_counter() - started_at, self.latency_decay)
+                replica.lag_seconds = float(lag_seconds or 0)
+
+                if not replica.healthy:
+                    print(f"Replica {replica.dsn} is reachable again")
+                replica.healthy = True
+
+            except Exception as err:
+                if replica.healthy:
+                    print(f"Replica {replica.dsn} was ejected: {err}")
+                replica.healthy = False
+
+    def start_prober(self):
+        if self._prober is not None:
+            return
+
+        self._stop_probing.clear()
+        self._prober = threading.Thread(target=self._probe_periodically, daemon=True)
+        self._prober.start()
+
+    def stop_prober(self):
+        self._stop_probing.set()
+        self._prober = None
+
+    def _probe_periodically(self):
+        while not self._stop_probing.wait(self.probe_interval):
+            self.probe()
@@ -2,6 +2,4 @@
 
 sleep 4
 
-python ./grpc/register_service.py
-
 exec uvicorn main:app --host 0.0.0.0 --port 8000
\ No newline at end of file
@@ -1,18 +1,56 @@
 from fastapi import FastAPI
+from contextlib import asynccontextmanager
 from routes import router
+from db.database import db_topology, get_master_db
+from utils.seat_inventory import SEAT_INVENTORY_MODE, seat_inventory_flusher
+from utils.redis_cache import cache_invalidation_listener, connect_redis_client, close_redis_client
+from utils.rabbitmq import rabbitmq
+from utils.outbox import outbox_relay
+from utils.booking_intake import booking_intake
+from utils.service_registry import load_tracker, service_registry
 from middleware.timeout_middleware import TimeoutMiddleware
+from middleware.load_middleware import LoadMiddleware
 from middleware.logging_middleware import LoggingMiddleware
 from utils.logging_config import setup_logging
 
 import uvicorn
+import os
 
-app = FastAPI()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    connect_redis_client()
+    rabbitmq.start()
+    outbox_relay.start(get_master_db)
+    booking_intake.start(get_master_db)
+    db_topology.start_prober()
+    cache_invalidation_listener.start()
+    if SEAT_INVENTORY_MODE == 'redis':
+        seat_inventory_flusher.start(get_master_db)
+    # registered last and deregistered first, so discovery only routes to a replica that is ready
+    await service_registry.start()
+    yield
+    await service_registry.stop()
+    seat_inventory_flusher.stop()
+    cache_invalidation_listener.stop()
+    db_topology.stop_prober()
+    booking_intake.stop()
+    outbox_relay.stop()
+    rabbitmq.stop()
+    close_redis_client()
+
+
+app = FastAPI(lifespan=lifespan)
 
 logger = setup_logging()
 
 app.include_router(router)
 
-app.middleware("http")(TimeoutMiddleware(app, 5))
+app.middleware("http")(TimeoutMiddleware(app, 5, {
+    "/trains/import": int(os.getenv('TRAIN_IMPORT_TIMEOUT', 120))
+}))
+
+app.middleware("http")(LoadMiddleware(load_tracker))
 
 app.add_middleware(LoggingMiddleware, logger=logger)
 
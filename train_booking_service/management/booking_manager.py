@@ -1,134 +1,312 @@
+from contextlib import nullcontext
 from fastapi import Depends, HTTPException
 from db.models import Booking, Train
-from db.schemas import BookingBaseDto, BookingInfoDto, BookingUpdateDto
+from db.schemas import BookingBaseDto, BookingBatchDto, BookingBatchResultDto, BookingFilterDto, BookingInfoDto, \
+    BookingUpdateDto
 from db.database import get_db
+from sqlalchemy import delete, select, update
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
-from utils.redis_cache import get_redis_client
-from utils.rabbitmq import RabbitMQ, get_rabbitmq
+from typing import Optional, Tuple
+from utils.redis_cache import CacheBatch, get_redis_client, get_cached_list, get_cached_entity, cache_entity, \
+    cache_missing_entity, MISSING_ENTITY
+from utils.train_events import add_event, booking_registered, bookings_registered, booking_cancelled
+from utils.seat_inventory import SeatInventory, get_seat_inventory, TRAIN_NOT_LOADED, ALREADY_BOOKED, NO_SEATS_LEFT
 
 import redis
-import json
+
+TRAIN_NOT_FOUND = (404, "Train to book ticket for not found")
+BOOKING_ALREADY_EXISTS = (400, "Booking already exists for this train and user")
+NO_MORE_SEATS = (400, "There are no more seats left for this train")
+
+SEAT_INVENTORY_ERRORS = {
+    TRAIN_NOT_LOADED: TRAIN_NOT_FOUND,
+    ALREADY_BOOKED: BOOKING_ALREADY_EXISTS,
+    NO_SEATS_LEFT: NO_MORE_SEATS
+}
 
 
 class BookingManager:
 
-    def __init__(self, master_db: Session, slave_db: Session, rabbitmq: RabbitMQ, redis_cache: redis.RedisCluster):
+    def __init__(self, master_db: Session, slave_db: Session, redis_cache: redis.RedisCluster,
+                 seat_inventory: Optional[SeatInventory] = None):
         self.master_db = master_db
         self.slave_db = slave_db
-        self.rabbitmq = rabbitmq
         self.redis_cache = redis_cache
+        self.seat_inventory = seat_inventory
 
     def create(self, booking: BookingBaseDto):
-        db_train = self.master_db.query(Train).filter(
-            Train.id == booking.train_id).first()
+        if self.seat_inventory is not None:
+            return self.create_from_seat_inventory(booking)
 
-        if db_train is None:
-            raise HTTPException(
-                status_code=404, detail="Train to book ticket for not found")
+        # the seat is taken by a single conditional UPDATE, so concurrent bookings
+        # can never push available_seats below zero or overwrite each other
+        available_seats = self.master_db.execute(
+            update(Train)
+            .where(Train.id == booking.train_id, Train.available_seats > 0)
+            .values(available_seats=Train.available_seats - 1)
+            .returning(Train.available_seats)
+        ).scalar_one_or_none()
 
-        existing_booking = self.slave_db.query(Booking).filter(
-            Booking.train_id == booking.train_id,
-            Booking.user_credentials == booking.user_credentials
-        ).first()
+        if available_seats is None:
+            self.master_db.rollback()
 
-        if existing_booking:
-            raise HTTPException(
-                status_code=400, detail="Booking already exists for this train and user")
-
-        db_train.available_seats -= 1
-        if db_train.available_seats == 0:
-            message = f"A booking was registered for {
-                booking.user_credentials}.\nThere are no more seats left.\n"
-            self.rabbitmq.send_message_to_exchange(
-                routing_key=str(db_train.id), message=message)
-            self.master_db.delete(db_train)
-        else:
-            self.master_db.commit()
-            self.master_db.refresh(db_train)
+            db_train = self.master_db.query(Train.id).filter(
+                Train.id == booking.train_id).first()
+
+            status_code, detail = NO_MORE_SEATS if db_train else TRAIN_NOT_FOUND
+            raise HTTPException(status_code=status_code, detail=detail)
 
         db_booking = Booking(train_id=booking.train_id,
                              user_credentials=booking.user_credentials)
 
-        self.master_db.add(db_booking)
+        try:
+            self.master_db.add(db_booking)
+            self.master_db.flush()
+            booking_id = db_booking.id
+            add_event(self.master_db, booking_registered(
+                booking.train_id, booking.user_credentials, available_seats))
+            self.master_db.commit()
+        except IntegrityError:
+            self.master_db.rollback()
+            status_code, detail = BOOKING_ALREADY_EXISTS
+            raise HTTPException(status_code=status_code, detail=detail)
+
+        with CacheBatch(self.redis_cache) as cache_batch:
+            cache_batch.invalidate_list_cache('bookings')
+            cache_batch.evict_entities(f"train:{booking.train_id}")
+            cache_batch.cache_entity(f"booking:{booking_id}", BookingInfoDto(
+                id=booking_id, train_id=booking.train_id, user_credentials=booking.user_credentials).model_dump())
+
+        return booking_id
+
+    def create_from_seat_inventory(self, booking: BookingBaseDto):
+        # the booking is decided by one script call on the Redis cluster and persisted
+        # to Postgres later by the seat inventory flusher, so no booking id or event exists yet
+        available_seats = self.seat_inventory.reserve(
+            booking.train_id, booking.user_credentials, self.master_db)
+
+        if available_seats in SEAT_INVENTORY_ERRORS:
+            status_code, detail = SEAT_INVENTORY_ERRORS[available_seats]
+            raise HTTPException(status_code=status_code, detail=detail)
+
+        return None
+
+    def create_batch(self, batch: BookingBatchDto, commit: bool = True):
+        # without commit the bookings are only flushed, for callers that write more in the same
+        # transaction, which then commit it and call evict_batch themselves
+        if self.seat_inventory is not None:
+            return self.create_batch_from_seat_inventory(batch)
+
+        user_credentials_by_train = {}
+        for booking in batch.bookings:
+            user_credentials_by_train.setdefault(booking.train_id, {})[booking.user_credentials] = None
+
+        outcomes = {}
+
+        # trains are locked in id order, so concurrent batches can not deadlock each other
+        for train_id in sorted(user_credentials_by_train):
+            user_credentials = list(user_credentials_by_train[train_id])
+
+            available_seats = self.master_db.execute(
+                select(Train.available_seats).where(Train.id == train_id).with_for_update()
+            ).scalar_one_or_none()
+
+            if available_seats is None:
+                outcomes.update({(train_id, user): TRAIN_NOT_FOUND for user in user_credentials})
+                continue
+
+            booking_ids = dict(self.master_db.execute(
+                insert(Booking)
+                .values([{"train_id": train_id, "user_credentials": user} for user in user_credentials])
+                .on_conflict_do_nothing(index_elements=['train_id', 'user_credentials'])
+                .returning(Booking.user_credentials, Booking.id)
+            ).all())
+
+            # bookings that did not fit into the remaining seats are taken back in request order
+            surplus_users = [user for user in user_credentials if user in booking_ids][available_seats:]
+            if surplus_users:
+                self.master_db.execute(delete(Booking).where(
+                    Booking.id.in_([booking_ids.pop(user) for user in surplus_users])))
+
+            if booking_ids:
+                self.master_db.execute(
+                    update(Train)
+                    .where(Train.id == train_id)
+                    .values(available_seats=Train.available_seats - len(booking_ids))
+                )
+                add_event(self.master_db, bookings_registered(
+                    train_id, len(booking_ids), available_seats - len(booking_ids)))
+
+            for user in user_credentials:
+                outcomes[(train_id, user)] = booking_ids.get(
+                    user, NO_MORE_SEATS if user in surplus_users else BOOKING_ALREADY_EXISTS)
+
+        results = []
+        for booking in batch.bookings:
+            outcome = outcomes.pop((booking.train_id, booking.user_credentials), BOOKING_ALREADY_EXISTS)
+
+            if isinstance(outcome, int):
+                results.append(BookingBatchResultDto(
+                    train_id=booking.train_id, user_credentials=booking.user_credentials, booking_id=outcome))
+            else:
+                results.append(BookingBatchResultDto(
+                    train_id=booking.train_id, user_credentials=booking.user_credentials, error=outcome[1]))
+
+        if batch.all_or_nothing and any(result.error for result in results):
+            self.master_db.rollback()
+            raise HTTPException(status_code=400, detail=[
+                result.model_dump() for result in results if result.error])
+
+        if not commit:
+            self.master_db.flush()
+            return results
+
         self.master_db.commit()
-        self.master_db.refresh(db_booking)
+        self.evict_batch(results)
 
-        message = f"A booking was registered for {
-            booking.user_credentials}.\nAvailable seats: {db_train.available_seats}\n"
-        self.rabbitmq.send_message_to_exchange(
-            routing_key=str(db_train.id), message=message)
-        self.redis_cache.delete('bookings')
+        return results
 
-        return db_booking.id
+    def evict_batch(self, results: list):
+        booked_results = [result for result in results if result.booking_id is not None]
 
-    def get_all(self):
-        bookings = self.redis_cache.get("bookings")
+        with CacheBatch(self.redis_cache) as cache_batch:
+            cache_batch.invalidate_list_cache('bookings')
+            # ids of the new bookings may still be cached as missing
+            cache_batch.evict_entities(*{f"train:{result.train_id}" for result in booked_results})
+            cache_batch.evict_entities(*[f"booking:{result.booking_id}" for result in booked_results])
 
-        if bookings:
-            return json.loads(bookings)
+    def create_batch_from_seat_inventory(self, batch: BookingBatchDto):
+        bookings = [(booking.train_id, booking.user_credentials) for booking in batch.bookings]
+
+        if batch.all_or_nothing:
+            # reserved while the flusher is kept off the trains, so a failed batch leaves nothing in Postgres
+            outcomes = self.seat_inventory.reserve_all(bookings, self.master_db)
         else:
-            bookings = self.slave_db.query(Booking).all()
-            booking_dtos = [BookingInfoDto.model_validate(
-                booking) for booking in bookings]
-            self.redis_cache.setex(name="bookings", time=120, value=json.dumps(
-                [booking.model_dump() for booking in booking_dtos]))
-            return bookings
+            outcomes = [self.seat_inventory.reserve(train_id, user_credentials, self.master_db)
+                        for train_id, user_credentials in bookings]
+
+        results = []
+        for (train_id, user_credentials), available_seats in zip(bookings, outcomes):
+            if available_seats in SEAT_INVENTORY_ERRORS:
+                results.append(BookingBatchResultDto(train_id=train_id, user_credentials=user_credentials,
+                                                     error=SEAT_INVENTORY_ERRORS[available_seats][1]))
+            else:
+                results.append(BookingBatchResultDto(train_id=train_id, user_credentials=user_credentials))
+
+        if batch.all_or_nothing and any(result.error for result in results):
+            raise HTTPException(status_code=400, detail=[
+                result.model_dump() for result in results if result.error])
+
+        return results
+
+    def get_all(self, filters: BookingFilterDto):
+        return get_cached_list(self.redis_cache, 'bookings', filters.model_dump(mode='json'),
+                               lambda: self.query_page(filters))
+
+    def query_page(self, filters: BookingFilterDto):
+        query = self.slave_db.query(Booking)
+
+        if filters.after_id is not None:
+            query = query.filter(Booking.id > filters.after_id)
+        if filters.train_id is not None:
+            query = query.filter(Booking.train_id == filters.train_id)
+        if filters.user_credentials is not None:
+            query = query.filter(Booking.user_credentials == filters.user_credentials)
+
+        bookings = query.order_by(Booking.id).limit(filters.limit).all()
+        return {
+            "items": [BookingInfoDto.model_validate(booking).model_dump() for booking in bookings],
+            "next_cursor": bookings[-1].id if len(bookings) == filters.limit else None
+        }
 
     def get_by_id(self, booking_id: int):
-        db_booking = self.slave_db.query(Booking).filter(
+        cached_booking = get_cached_entity(self.redis_cache, f"booking:{booking_id}")
+
+        if cached_booking == MISSING_ENTITY:
+            raise HTTPException(status_code=404, detail="Booking not found")
+        if cached_booking is not None:
+            return cached_booking
+
+        # a key evicted by a write is never refilled from a replica that has not seen the write yet
+        db_booking = self.master_db.query(Booking).filter(
             Booking.id == booking_id).first()
 
         if db_booking is None:
+            cache_missing_entity(self.redis_cache, f"booking:{booking_id}")
             raise HTTPException(status_code=404, detail="Booking not found")
 
+        cache_entity(self.redis_cache, f"booking:{booking_id}", BookingInfoDto.model_validate(db_booking).model_dump())
+
         return db_booking
 
     def update(self, booking_id: int, updated_booking: BookingUpdateDto):
-        db_booking = self.slave_db.query(Booking).filter(
+        db_booking = self.master_db.query(Booking).filter(
             Booking.id == booking_id).first()
 
         if db_booking is None:
             raise HTTPException(
                 status_code=404, detail="Booking to update not found")
 
-        db_booking.user_credentials = updated_booking.user_credentials
+        # the train's counter and booked users are reloaded only once the new credentials are committed
+        train_lock = nullcontext()
+        if self.seat_inventory is not None:
+            train_lock = self.seat_inventory.evicted(db_booking.train_id, self.master_db)
+
+        with train_lock:
+            db_booking.user_credentials = updated_booking.user_credentials
+
+            try:
+                self.master_db.commit()
+            except IntegrityError:
+                self.master_db.rollback()
+                status_code, detail = BOOKING_ALREADY_EXISTS
+                raise HTTPException(status_code=status_code, detail=detail)
 
-        self.master_db.commit()
         self.master_db.refresh(db_booking)
 
-        self.redis_cache.delete('bookings')
+        with CacheBatch(self.redis_cache) as cache_batch:
+            cache_batch.invalidate_list_cache('bookings')
+            cache_batch.cache_entity(f"booking:{booking_id}", BookingInfoDto.model_validate(db_booking).model_dump())
 
         return db_booking.id
 
     def delete(self, booking_id: int):
-        db_booking = self.slave_db.query(Booking).filter(
+        db_booking = self.master_db.query(Booking).filter(
             Booking.id == booking_id).first()
 
         if db_booking is None:
             raise HTTPException(
                 status_code=404, detail="Booking to delete not found")
 
-        db_train = self.slave_db.query(Train).filter(
-            Train.id == db_booking.train_id).first()
-        db_train.available_seats += 1
+        train_id = db_booking.train_id
+        user_credentials = db_booking.user_credentials
 
-        message = f"A booking was cancelled by {
-            db_booking.user_credentials}.\nAvailable seats: {db_train.available_seats}\n"
-        self.rabbitmq.send_message_to_exchange(
-            routing_key=str(db_train.id), message=message)
+        available_seats = self.master_db.execute(
+            update(Train)
+            .where(Train.id == train_id)
+            .values(available_seats=Train.available_seats + 1)
+            .returning(Train.available_seats)
+        ).scalar_one()
 
         self.master_db.delete(db_booking)
+        add_event(self.master_db, booking_cancelled(train_id, user_credentials, available_seats))
         self.master_db.commit()
 
-        self.redis_cache.delete('bookings')
+        if self.seat_inventory is not None:
+            self.seat_inventory.release(train_id, user_credentials)
 
-        return db_booking.id
+        with CacheBatch(self.redis_cache) as cache_batch:
+            cache_batch.invalidate_list_cache('bookings')
+            cache_batch.evict_entities(f"booking:{booking_id}", f"train:{train_id}")
+
+        return booking_id
 
 
 def get_booking_manager(
-    master_db: Session = Depends(lambda: next(get_db())[0]),
-    slave_db: Session = Depends(lambda: next(get_db())[1]),
-    rabbitmq: RabbitMQ = Depends(get_rabbitmq),
+    db_sessions: Tuple[Session, Session] = Depends(get_db),
     redis_cache: redis.RedisCluster = Depends(get_redis_client)
 ) -> BookingManager:
-    return BookingManager(master_db, slave_db, rabbitmq, redis_cache)
+    master_db, slave_db = db_sessions
+    return BookingManager(master_db, slave_db, redis_cache, get_seat_inventory(redis_cache))
@@ -1,12 +1,13 @@
 from db.schemas import DbUpdateDto
+from db.database import DB_CONNECTIONS_STORAGE, engine_registry, db_topology
 from tinydb import TinyDB, Query
-from sqlalchemy import create_engine
 from db.models import Base
+from sqlalchemy.exc import SQLAlchemyError
 
 
 class DbManager():
 
-    def __init__(self, db_connections_storage="../db_connections.json"):
+    def __init__(self, db_connections_storage=DB_CONNECTIONS_STORAGE):
         self.db_connections_storage = TinyDB(db_connections_storage)
 
     def update_master_slave_db_information(self, db_info: DbUpdateDto):
@@ -28,14 +29,26 @@ class DbManager():
                 'slaves': db_info.slave_dbs
             })
 
+        master_changed = db_topology.master != db_info.master_db
+        db_topology.update(db_info.master_db, db_info.slave_dbs)
+
+        if master_changed:
             self.initialize_db(db_info.master_db)
 
         return {"message": "Master and slave DB information updated successfully"}
 
     def initialize_db(self, master_db_connection_string: str):
-        engine = create_engine(master_db_connection_string, echo=True)
+        engine = engine_registry.get_engine(master_db_connection_string)
         Base.metadata.create_all(bind=engine)
 
+        # create_all skips tables that already exist, so indexes added later are created separately
+        for table in Base.metadata.sorted_tables:
+            for index in table.indexes:
+                try:
+                    index.create(bind=engine, checkfirst=True)
+                except SQLAlchemyError as err:
+                    print(f"Could not create index {index.name}: {err}")
+
 
 def get_db_manager() -> DbManager:
     return DbManager()
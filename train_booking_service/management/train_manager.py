@@ -1,22 +1,35 @@
+from contextlib import nullcontext
 from fastapi import Depends, HTTPException
 from db.models import Train
-from db.schemas import TrainBaseDto, TrainInfoDto, TrainUpdateDto
+from db.schemas import TrainBaseDto, TrainFilterDto, TrainInfoDto, TrainUpdateDto
 from db.database import get_db
+from fastapi.concurrency import run_in_threadpool
+from pydantic import TypeAdapter, ValidationError
+from sqlalchemy import insert
 from sqlalchemy.orm import Session
-from utils.redis_cache import get_redis_client
-from utils.rabbitmq import RabbitMQ, get_rabbitmq
+from typing import AsyncIterator, List, Optional, Tuple
+from utils.redis_cache import CacheBatch, get_redis_client, get_cached_list, invalidate_list_cache, \
+    get_cached_entity, cache_entity, cache_missing_entity, MISSING_ENTITY
+from utils.train_events import add_event, train_removed, train_updated
+from utils.seat_inventory import SeatInventory, get_seat_inventory
 
 import redis
-import json
+import os
+
+
+train_list_adapter = TypeAdapter(List[TrainBaseDto])
 
 
 class TrainManager:
 
-    def __init__(self, master_db: Session, slave_db: Session, rabbitmq: RabbitMQ, redis_cache: redis.RedisCluster):
+    import_chunk_size = int(os.getenv('TRAIN_IMPORT_CHUNK_SIZE', 1000))
+
+    def __init__(self, master_db: Session, slave_db: Session, redis_cache: redis.RedisCluster,
+                 seat_inventory: Optional[SeatInventory] = None):
         self.master_db = master_db
         self.slave_db = slave_db
-        self.rabbitmq = rabbitmq
         self.redis_cache = redis_cache
+        self.seat_inventory = seat_inventory
 
     def create(self, train: TrainBaseDto):
         db_train = Train(route=train.route, departure_time=train.departure_time,
@@ -26,90 +39,179 @@ class TrainManager:
         self.master_db.commit()
         self.master_db.refresh(db_train)
 
-        self.redis_cache.delete('trains')
+        with CacheBatch(self.redis_cache) as cache_batch:
+            cache_batch.invalidate_list_cache('trains')
+            cache_batch.cache_entity(f"train:{db_train.id}", self.to_cache_value(db_train))
 
         return db_train.id
 
-    def get_all(self):
-        trains = self.redis_cache.get("trains")
-
-        if trains:
-            return json.loads(trains)
-        else:
-            trains = self.slave_db.query(Train).all()
-            train_dtos = [TrainInfoDto.model_validate(
-                train) for train in trains]
-            self.redis_cache.setex(name="trains", time=120, value=json.dumps(
-                [train.model_dump(mode='json') for train in train_dtos]))
-            return trains
+    async def bulk_import(self, rows: AsyncIterator[dict]):
+        train_ids = []
+        chunk = []
+
+        try:
+            async for row in rows:
+                chunk.append(row)
+
+                if len(chunk) == self.import_chunk_size:
+                    train_ids += await run_in_threadpool(self.import_chunk, chunk, len(train_ids))
+                    chunk = []
+
+            if chunk:
+                train_ids += await run_in_threadpool(self.import_chunk, chunk, len(train_ids))
+
+            await run_in_threadpool(self.master_db.commit)
+        except Exception:
+            await run_in_threadpool(self.master_db.rollback)
+            raise
+
+        await run_in_threadpool(self.evict_imported, train_ids)
+
+        return train_ids
+
+    def evict_imported(self, train_ids: List[int]):
+        invalidate_list_cache(self.redis_cache, 'trains')
+
+        # ids of the new trains may still be cached as missing, a pipeline and publish per chunk
+        for start in range(0, len(train_ids), self.import_chunk_size):
+            with CacheBatch(self.redis_cache) as cache_batch:
+                cache_batch.evict_entities(*[f"train:{train_id}"
+                                             for train_id in train_ids[start:start + self.import_chunk_size]])
+
+    def import_chunk(self, rows: List[dict], first_row: int):
+        try:
+            # the whole chunk is validated in a single pass of the pydantic core validator
+            trains = train_list_adapter.validate_python(rows)
+        except ValidationError as err:
+            errors = err.errors(include_url=False, include_context=False)
+            for error in errors:
+                error['loc'] = (error['loc'][0] + first_row, *error['loc'][1:])
+
+            raise HTTPException(status_code=422, detail=errors)
+
+        # multi-row INSERT ... RETURNING, sent in batches by the driver
+        return self.master_db.execute(
+            insert(Train).returning(Train.id, sort_by_parameter_order=True),
+            [train.model_dump() for train in trains]
+        ).scalars().all()
+
+    def get_all(self, filters: TrainFilterDto):
+        return get_cached_list(self.redis_cache, 'trains', filters.model_dump(mode='json'),
+                               lambda: self.query_page(filters))
+
+    def query_page(self, filters: TrainFilterDto):
+        query = self.slave_db.query(Train)
+
+        if filters.after_id is not None:
+            query = query.filter(Train.id > filters.after_id)
+        if filters.route is not None:
+            query = query.filter(Train.route == filters.route)
+        if filters.departure_from is not None:
+            query = query.filter(Train.departure_time >= filters.departure_from)
+        if filters.departure_to is not None:
+            query = query.filter(Train.departure_time <= filters.departure_to)
+        if filters.min_seats is not None:
+            query = query.filter(Train.available_seats >= filters.min_seats)
+
+        trains = query.order_by(Train.id).limit(filters.limit).all()
+        return {
+            "items": [TrainInfoDto.model_validate(train).model_dump(mode='json') for train in trains],
+            "next_cursor": trains[-1].id if len(trains) == filters.limit else None
+        }
 
     def get_by_id(self, train_id: int):
-        db_train = self.slave_db.query(Train).filter(
+        cached_train = get_cached_entity(self.redis_cache, f"train:{train_id}")
+
+        if cached_train == MISSING_ENTITY:
+            raise HTTPException(status_code=404, detail="Train not found")
+        if cached_train is not None:
+            return cached_train
+
+        # filled from the master, a lagging replica would keep a value older than the write that
+        # evicted the key cached for the whole ttl
+        db_train = self.master_db.query(Train).filter(
             Train.id == train_id).first()
 
         if db_train is None:
+            cache_missing_entity(self.redis_cache, f"train:{train_id}")
             raise HTTPException(status_code=404, detail="Train not found")
 
+        cache_entity(self.redis_cache, f"train:{train_id}", self.to_cache_value(db_train))
+
         return db_train
 
-    def update(self, train_id: int, updated_train: TrainUpdateDto):
-        db_train = self.slave_db.query(Train).filter(
-            Train.id == train_id).first()
+    def to_cache_value(self, db_train: Train):
+        return TrainInfoDto.model_validate(db_train).model_dump(mode='json')
 
-        if db_train is None:
-            raise HTTPException(
-                status_code=404, detail="Train to update not found")
-
-        message = "Train details were updated:\n"
-
-        if updated_train.route is not None:
-            message += f"{db_train.route} -> {updated_train.route}\n"
-            db_train.route = updated_train.route
-        if updated_train.departure_time is not None:
-            message += f"Departure time: {db_train.departure_time} -> {
-                updated_train.departure_time}\n"
-            db_train.departure_time = updated_train.departure_time
-        if updated_train.arrival_time is not None:
-            message += f"Arrival time: {db_train.arrival_time} -> {
-                updated_train.arrival_time}\n"
-            db_train.arrival_time = updated_train.arrival_time
-        if updated_train.available_seats is not None:
-            message += f"Available seats: {db_train.available_seats} -> {
-                updated_train.available_seats}\n"
-            db_train.available_seats = updated_train.available_seats
+    def update(self, train_id: int, updated_train: TrainUpdateDto):
+        # flushing the pending bookings commits, so it has to happen before the row is locked,
+        # and the seat inventory keeps the train locked until this change is committed
+        train_lock = nullcontext()
+        if updated_train.available_seats is not None and self.seat_inventory is not None:
+            train_lock = self.seat_inventory.evicted(train_id, self.master_db)
+
+        with train_lock:
+            # the event takes its sequence number while the row is locked, so no booking of the train
+            # can commit an event with a higher one before this update
+            db_train = self.master_db.query(Train).filter(
+                Train.id == train_id).with_for_update().first()
+
+            if db_train is None:
+                raise HTTPException(
+                    status_code=404, detail="Train to update not found")
+
+            changes = {}
+
+            if updated_train.route is not None:
+                changes["route"] = (db_train.route, updated_train.route)
+                db_train.route = updated_train.route
+            if updated_train.departure_time is not None:
+                changes["departure_time"] = (db_train.departure_time, updated_train.departure_time)
+                db_train.departure_time = updated_train.departure_time
+            if updated_train.arrival_time is not None:
+                changes["arrival_time"] = (db_train.arrival_time, updated_train.arrival_time)
+                db_train.arrival_time = updated_train.arrival_time
+            if updated_train.available_seats is not None:
+                changes["available_seats"] = (db_train.available_seats, updated_train.available_seats)
+                db_train.available_seats = updated_train.available_seats
+
+            add_event(self.master_db, train_updated(train_id, changes))
+            self.master_db.commit()
 
-        self.master_db.commit()
         self.master_db.refresh(db_train)
 
-        self.redis_cache.delete('trains')
-        self.rabbitmq.send_message_to_exchange(
-            routing_key=str(train_id), message=message)
+        with CacheBatch(self.redis_cache) as cache_batch:
+            cache_batch.invalidate_list_cache('trains')
+            cache_batch.cache_entity(f"train:{train_id}", self.to_cache_value(db_train))
 
         return db_train.id
 
     def delete(self, train_id: int):
-        db_train = self.slave_db.query(Train).filter(
-            Train.id == train_id).first()
+        train_lock = nullcontext()
+        if self.seat_inventory is not None:
+            train_lock = self.seat_inventory.evicted(train_id, self.master_db)
 
-        if db_train is None:
-            raise HTTPException(
-                status_code=404, detail="Train to delete not found")
+        with train_lock:
+            db_train = self.master_db.query(Train).filter(
+                Train.id == train_id).with_for_update().first()
 
-        self.master_db.delete(db_train)
-        self.master_db.commit()
+            if db_train is None:
+                raise HTTPException(
+                    status_code=404, detail="Train to delete not found")
 
-        message = "Train you were tracking was removed from the schedule. It was registered by mistake.\n"
-        self.rabbitmq.send_message_to_exchange(
-            routing_key=str(train_id), message=message)
-        self.redis_cache.delete('trains')
+            self.master_db.delete(db_train)
+            add_event(self.master_db, train_removed(train_id))
+            self.master_db.commit()
 
-        return db_train.id
+        with CacheBatch(self.redis_cache) as cache_batch:
+            cache_batch.invalidate_list_cache('trains')
+            cache_batch.evict_entities(f"train:{train_id}")
 
+        return db_train.id
 
 def get_train_manager(
-    master_db: Session = Depends(lambda: next(get_db())[0]),
-    slave_db: Session = Depends(lambda: next(get_db())[1]),
-    rabbitmq: RabbitMQ = Depends(get_rabbitmq),
+    db_sessions: Tuple[Session, Session] = Depends(get_db),
     redis_cache: redis.RedisCluster = Depends(get_redis_client)
 ) -> TrainManager:
-    return TrainManager(master_db, slave_db, rabbitmq, redis_cache)
+    master_db, slave_db = db_sessions
+    return TrainManager(master_db, slave_db, redis_cache, get_seat_inventory(redis_cache))
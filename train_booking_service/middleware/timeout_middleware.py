@@ -6,13 +6,14 @@ import asyncio
 
 class TimeoutMiddleware:
 
-    def __init__(self, app: FastAPI, timeout_seconds: int = 3):
+    def __init__(self, app: FastAPI, timeout_seconds: int = 3, path_timeouts: dict = None):
         self.app = app
         self.timeout_seconds = timeout_seconds
+        self.path_timeouts = path_timeouts or {}
 
     async def __call__(self, request: Request, call_next):
         try:
-            async with timeout(self.timeout_seconds):
+            async with timeout(self.path_timeouts.get(request.url.path, self.timeout_seconds)):
                 response = await call_next(request)
             return response
         except asyncio.TimeoutError:
@@ -1,10 +1,19 @@
-from fastapi import APIRouter, Depends
-from fastapi.responses import JSONResponse
-from db.schemas import DbUpdateDto, TrainBaseDto, TrainInfoDto, TrainUpdateDto, BookingBaseDto, BookingInfoDto, BookingUpdateDto
+from fastapi import APIRouter, Depends, Header, Query, Request
+from fastapi.responses import JSONResponse, Response
+from db.schemas import DbUpdateDto, TrainBaseDto, TrainFilterDto, TrainInfoDto, TrainUpdateDto, BookingBaseDto, \
+    BookingBatchDto, BookingBatchResultDto, BookingFilterDto, BookingInfoDto, BookingUpdateDto
 from management.db_manager import DbManager, get_db_manager
 from management.train_manager import TrainManager, get_train_manager
 from management.booking_manager import BookingManager, get_booking_manager
-from typing import List
+from utils.train_import import read_train_rows
+from utils.local_cache import local_cache
+from utils.redis_cache import redis_tier_stats, page_response
+from utils.rabbitmq import rabbitmq
+from utils.outbox import outbox_relay
+from utils.booking_intake import booking_intake
+from utils.metrics import metrics
+from typing import List, Optional
+from datetime import datetime
 
 router = APIRouter()
 
@@ -14,6 +23,22 @@ def status():
     return JSONResponse(content={"status": "OK", "message": "Train booking service is running"})
 
 
+@router.get("/cache/stats")
+def cache_stats():
+    return {"local": local_cache.snapshot(), "redis": redis_tier_stats.snapshot()}
+
+
+@router.get("/metrics")
+async def prometheus_metrics():
+    # async, so the threadpool gauges are read from the event loop
+    return Response(content=metrics.render(), media_type="text/plain; version=0.0.4")
+
+
+@router.get("/events/stats")
+def event_stats():
+    return {**rabbitmq.snapshot(), "outbox": outbox_relay.snapshot(), "intake": booking_intake.snapshot()}
+
+
 @router.put("/db")
 def update_master_slave_db_information(db_info: DbUpdateDto, db_manager: DbManager = Depends(get_db_manager)):
     return db_manager.update_master_slave_db_information(db_info)
@@ -24,9 +49,20 @@ def register_train(train: TrainBaseDto, train_manager: TrainManager = Depends(ge
     return train_manager.create(train)
 
 
+@router.post("/trains/import")
+async def import_trains(request: Request, train_manager: TrainManager = Depends(get_train_manager)):
+    return await train_manager.bulk_import(read_train_rows(request))
+
+
 @router.get("/trains", response_model=List[TrainInfoDto])
-def get_all_trains(train_manager: TrainManager = Depends(get_train_manager)):
-    return train_manager.get_all()
+def get_all_trains(after_id: Optional[int] = None, limit: int = Query(100, ge=1, le=1000),
+                   route: Optional[str] = Query(None, max_length=100), departure_from: Optional[datetime] = None,
+                   departure_to: Optional[datetime] = None, min_seats: Optional[int] = Query(None, ge=0),
+                   if_none_match: Optional[str] = Header(None),
+                   train_manager: TrainManager = Depends(get_train_manager)):
+    page = train_manager.get_all(TrainFilterDto(after_id=after_id, limit=limit, route=route, departure_from=departure_from,
+                                                departure_to=departure_to, min_seats=min_seats))
+    return page_response(page, if_none_match)
 
 
 @router.get("/trains/{train_id}", response_model=TrainInfoDto)
@@ -49,9 +85,19 @@ def register_booking(booking: BookingBaseDto, booking_manager: BookingManager =
     return booking_manager.create(booking)
 
 
+@router.post("/bookings/batch", response_model=List[BookingBatchResultDto])
+def register_booking_batch(batch: BookingBatchDto, booking_manager: BookingManager = Depends(get_booking_manager)):
+    return booking_manager.create_batch(batch)
+
+
 @router.get("/bookings", response_model=List[BookingInfoDto])
-def get_all_bookings(booking_manager: BookingManager = Depends(get_booking_manager)):
-    return booking_manager.get_all()
+def get_all_bookings(after_id: Optional[int] = None, limit: int = Query(100, ge=1, le=1000),
+                     train_id: Optional[int] = None, user_credentials: Optional[str] = Query(None, max_length=100),
+                     if_none_match: Optional[str] = Header(None),
+                     booking_manager: BookingManager = Depends(get_booking_manager)):
+    page = booking_manager.get_all(BookingFilterDto(after_id=after_id, limit=limit, train_id=train_id,
+                                                    user_credentials=user_credentials))
+    return page_response(page, if_none_match)
 
 
 @router.get("/bookings/{booking_id}", response_model=BookingInfoDto)
@@ -0,0 +1,92 @@
+import unittest
+from unittest.mock import MagicMock
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from db.database import Base
+from db.models import Booking, Train
+from db.schemas import BookingBaseDto
+from management.booking_manager import BookingManager
+from fastapi import HTTPException
+from sqlalchemy import create_engine, func
+from sqlalchemy.orm import sessionmaker
+
+import time
+import os
+
+# Points at a disposable PostgreSQL database - the tables in it are dropped and recreated.
+STRESS_TEST_DATABASE_URL = os.getenv("STRESS_TEST_DATABASE_URL")
+STRESS_TEST_BOOKINGS = int(os.getenv("STRESS_TEST_BOOKINGS", 2000))
+STRESS_TEST_WORKERS = int(os.getenv("STRESS_TEST_WORKERS", 64))
+STRESS_TEST_SEATS = 400
+
+
+@unittest.skipUnless(STRESS_TEST_DATABASE_URL, "STRESS_TEST_DATABASE_URL is not set")
+class TestBookingConcurrency(unittest.TestCase):
+
+    def setUp(self):
+        self.engine = create_engine(STRESS_TEST_DATABASE_URL,
+                                    pool_size=STRESS_TEST_WORKERS, max_overflow=0)
+        self.SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=self.engine)
+
+        Base.metadata.drop_all(bind=self.engine)
+        Base.metadata.create_all(bind=self.engine)
+
+        with self.SessionLocal() as db:
+            train = Train(route="Chisinau-Iasi", departure_time=datetime.now(),
+                          arrival_time=datetime.now() + timedelta(hours=5), available_seats=STRESS_TEST_SEATS)
+            db.add(train)
+            db.commit()
+            self.train_id = train.id
+
+    def tearDown(self):
+        Base.metadata.drop_all(bind=self.engine)
+        self.engine.dispose()
+
+    def book(self, user_credentials: str):
+        with self.SessionLocal() as db:
+            manager = BookingManager(db, db, MagicMock())
+
+            try:
+                manager.create(BookingBaseDto(train_id=self.train_id, user_credentials=user_credentials))
+                return True
+            except HTTPException:
+                return False
+
+    def run_bookings(self, user_credentials: list):
+        started_at = time.perf_counter()
+
+        with ThreadPoolExecutor(max_workers=STRESS_TEST_WORKERS) as executor:
+            results = list(executor.map(self.book, user_credentials))
+
+        elapsed = time.perf_counter() - started_at
+        print(f"\n{len(user_credentials)} booking attempts in {elapsed:.2f}s "
+              f"({len(user_credentials) / elapsed:.0f} bookings/sec, {results.count(True)} succeeded)")
+
+        return results
+
+    def test_parallel_bookings_never_oversell(self):
+        results = self.run_bookings([f"user_{i}" for i in range(STRESS_TEST_BOOKINGS)])
+
+        with self.SessionLocal() as db:
+            available_seats = db.query(Train.available_seats).filter(
+                Train.id == self.train_id).scalar()
+            bookings_count = db.query(func.count(Booking.id)).filter(
+                Booking.train_id == self.train_id).scalar()
+
+        self.assertEqual(results.count(True), STRESS_TEST_SEATS)
+        self.assertEqual(available_seats, 0)
+        self.assertEqual(bookings_count, STRESS_TEST_SEATS)
+
+    def test_parallel_duplicate_bookings_take_one_seat(self):
+        results = self.run_bookings(["Tom Ford"] * 200)
+
+        with self.SessionLocal() as db:
+            available_seats = db.query(Train.available_seats).filter(
+                Train.id == self.train_id).scalar()
+
+        self.assertEqual(results.count(True), 1)
+        self.assertEqual(available_seats, STRESS_TEST_SEATS - 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,115 @@
+import unittest
+from unittest.mock import MagicMock, patch
+from datetime import datetime
+from db.database import Base
+from db.models import Booking, OutboxEvent, Train
+from utils.booking_intake import BookingIntake
+from utils.event_codec import decode_event
+from utils.train_events_pb2 import EventType
+from sqlalchemy import create_engine
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import sessionmaker
+from redis.exceptions import RedisError
+
+import json
+
+
+class TestBookingIntake(unittest.TestCase):
+
+    def setUp(self):
+        engine = create_engine("sqlite://")
+        Base.metadata.create_all(bind=engine)
+
+        self.db = sessionmaker(bind=engine)()
+        self.db.add(Train(id=1, route="Chisinau-Iasi", departure_time=datetime.now(),
+                          arrival_time=datetime.now(), available_seats=1))
+        self.db.commit()
+
+        self.mock_redis_cache = MagicMock()
+        self.intake = BookingIntake()
+
+    def test_batch_outcomes_are_stored_and_published_per_ticket(self):
+        requests = [{"ticket_id": "a", "train_id": 1, "user_credentials": "Tom Ford"},
+                    {"ticket_id": "b", "train_id": 1, "user_credentials": "Jo Malone"},
+                    {"ticket_id": "c", "train_id": 2, "user_credentials": "Hugo Boss"}]
+
+        tickets = self.intake.process(requests, self.db, self.mock_redis_cache)
+
+        self.assertEqual([ticket["status"] for ticket in tickets], ["confirmed", "rejected", "rejected"])
+        self.assertEqual(tickets[1]["error"], "There are no more seats left for this train")
+        self.assertEqual(self.db.query(Booking).count(), 1)
+
+        events = [decode_event(payload) for payload, in self.db.query(OutboxEvent.payload).order_by(OutboxEvent.id)]
+        outcomes = [event for event in events if event.type == EventType.BOOKING_PROCESSED]
+        self.assertEqual([(event.ticket_id, event.booking_id) for event in outcomes],
+                         [("a", tickets[0]["booking_id"]), ("b", 0), ("c", 0)])
+
+        stored = self.mock_redis_cache.pipeline.return_value.setex.call_args_list[-1].kwargs
+        self.assertEqual(stored["name"], "booking_ticket:c")
+        self.assertEqual(json.loads(stored["value"])["status"], "rejected")
+
+    def test_bookings_are_rolled_back_with_their_outcome_events(self):
+        requests = [{"ticket_id": "a", "train_id": 1, "user_credentials": "Tom Ford"}]
+
+        with patch('utils.booking_intake.add_event', side_effect=RuntimeError("outbox insert failed")):
+            self.assertRaises(RuntimeError, self.intake.process, requests, self.db, self.mock_redis_cache)
+        self.db.rollback()
+
+        self.assertEqual(self.db.query(Booking).count(), 0)
+        self.assertEqual(self.intake.process(requests, self.db, self.mock_redis_cache)[0]["status"], "confirmed")
+
+    def test_committed_batch_is_not_failed_by_the_cache(self):
+        requests = [{"ticket_id": "a", "train_id": 1, "user_credentials": "Tom Ford"}]
+
+        with patch('utils.booking_intake.BookingManager.evict_batch', side_effect=RedisError("cluster is down")):
+            tickets = self.intake.process(requests, self.db, self.mock_redis_cache)
+
+        self.assertEqual(tickets[0]["status"], "confirmed")
+        self.assertEqual(self.db.query(Booking).count(), 1)
+        self.mock_redis_cache.pipeline.return_value.setex.assert_called_once()
+
+    @patch('utils.booking_intake.get_redis_client')
+    def test_failing_request_is_isolated_and_dead_lettered(self, get_redis_client):
+        def process_in_session(requests, get_master_session):
+            if any(request["ticket_id"] == "b" for request in requests):
+                raise ValueError("A string literal cannot contain NUL (0x00) characters.")
+
+        self.intake.max_attempts = 2
+        self.intake._process_in_session = process_in_session
+        self.intake._stop_consuming.wait = MagicMock()
+        channel = MagicMock()
+        requests = {ticket_id: {"ticket_id": ticket_id, "train_id": 1, "user_credentials": "Tom Ford"}
+                    for ticket_id in "abc"}
+
+        self.intake._handle(channel, [(1, requests["a"]), (2, requests["b"]), (3, requests["c"])], None)
+
+        self.assertEqual([call.kwargs["delivery_tag"] for call in channel.basic_ack.call_args_list], [1, 3])
+        channel.basic_nack.assert_called_once_with(delivery_tag=2, requeue=True)
+
+        self.intake._handle(channel, [(4, requests["b"])], None)
+
+        self.assertEqual(channel.basic_publish.call_args.kwargs["routing_key"], "booking_requests.dead")
+        self.assertEqual(channel.basic_ack.call_args.kwargs["delivery_tag"], 4)
+        stored = get_redis_client.return_value.pipeline.return_value.setex.call_args.kwargs
+        self.assertEqual((stored["name"], json.loads(stored["value"])["status"]), ("booking_ticket:b", "rejected"))
+
+    def test_connection_failure_requeues_the_whole_batch(self):
+        self.intake._process_in_session = MagicMock(side_effect=OperationalError("SELECT 1", {}, "server closed"))
+        self.intake._stop_consuming.wait = MagicMock()
+        channel = MagicMock()
+        request = {"ticket_id": "a", "train_id": 1, "user_credentials": "Tom Ford"}
+
+        self.intake._handle(channel, [(1, request), (2, request)], None)
+
+        channel.basic_nack.assert_called_once_with(delivery_tag=2, multiple=True, requeue=True)
+        self.intake._process_in_session.assert_called_once()
+
+    def test_invalid_request_is_dropped(self):
+        self.assertIsNone(self.intake.parse(b'{"train_id": 1}'))
+        self.assertIsNone(self.intake.parse(b'not json'))
+        self.assertIsNotNone(self.intake.parse(b'{"ticket_id": "a", "train_id": 1, "user_credentials": "Tom Ford"}'))
+        self.assertEqual(self.intake.snapshot()["invalid"], 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,70 @@
+import unittest
+from unittest.mock import MagicMock
+from datetime import datetime
+from db.database import Base
+from db.models import Booking, OutboxEvent, Train
+from db.schemas import BookingBatchDto, BookingUpdateDto
+from management.booking_manager import BookingManager
+from utils.event_codec import decode_event
+from fastapi import HTTPException
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+
+class TestCreateBookingBatch(unittest.TestCase):
+
+    def setUp(self):
+        engine = create_engine("sqlite://")
+        Base.metadata.create_all(bind=engine)
+
+        self.db = sessionmaker(bind=engine)()
+        self.db.add(Train(id=1, route="Chisinau-Iasi", departure_time=datetime.now(),
+                          arrival_time=datetime.now(), available_seats=2))
+        self.db.add(Booking(train_id=1, user_credentials="Tom Ford"))
+        self.db.commit()
+
+        self.mock_redis_cache = MagicMock()
+        self.manager = BookingManager(self.db, self.db, self.mock_redis_cache)
+
+    def batch(self, user_credentials: list, all_or_nothing: bool):
+        return BookingBatchDto(bookings=[{"train_id": 1, "user_credentials": user} for user in user_credentials],
+                               all_or_nothing=all_or_nothing)
+
+    def test_create_batch_returns_partial_results(self):
+        results = self.manager.create_batch(
+            self.batch(["Jo Malone", "Tom Ford", "Coco Chanel", "Hugo Boss"], all_or_nothing=False))
+
+        self.assertIsNotNone(results[0].booking_id)
+        self.assertEqual(results[1].error, "Booking already exists for this train and user")
+        self.assertIsNotNone(results[2].booking_id)
+        self.assertEqual(results[3].error, "There are no more seats left for this train")
+
+        self.assertEqual(self.db.query(Train).first().available_seats, 0)
+        self.assertEqual(self.db.query(Booking).count(), 3)
+        event = decode_event(self.db.query(OutboxEvent.payload).scalar())
+        self.assertEqual((event.train_id, event.booked_seats, event.available_seats), (1, 2, 0))
+        # the bookings list is invalidated by bumping its version, not by deleting a shared key
+        pipeline = self.mock_redis_cache.pipeline.return_value
+        pipeline.incr.assert_called_once_with("bookings:version")
+        pipeline.execute.assert_called_once()
+
+    def test_create_batch_returns_http_exception(self):
+        self.assertRaises(HTTPException, self.manager.create_batch,
+                          self.batch(["Jo Malone", "Tom Ford"], all_or_nothing=True))
+
+        self.assertEqual(self.db.query(Train).first().available_seats, 2)
+        self.assertEqual(self.db.query(Booking).count(), 1)
+        self.assertEqual(self.db.query(OutboxEvent).count(), 0)
+
+    def test_update_to_an_existing_booking_is_rejected(self):
+        booking_id = self.manager.create_batch(self.batch(["Jo Malone"], all_or_nothing=True))[0].booking_id
+
+        with self.assertRaises(HTTPException) as raised:
+            self.manager.update(booking_id, BookingUpdateDto(user_credentials="Tom Ford"))
+
+        self.assertEqual(raised.exception.status_code, 400)
+        self.assertEqual(self.db.get(Booking, booking_id).user_credentials, "Jo Malone")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,55 @@
+import unittest
+from utils.local_cache import LocalCache
+
+
+class TestLocalCache(unittest.TestCase):
+
+    def setUp(self):
+        self.cache = LocalCache()
+        self.cache.enabled = True
+
+    def test_get_returns_value_set_for_current_generation(self):
+        self.cache.set("train:1", {"id": 1}, 10, self.cache.generation)
+
+        self.assertEqual(self.cache.get("train:1"), {"id": 1})
+        self.assertEqual(self.cache.stats.snapshot()["hits"], 1)
+
+    def test_set_skips_value_read_before_invalidation(self):
+        generation = self.cache.generation
+        self.cache.invalidate("train:1")
+        self.cache.set("train:1", {"id": 1}, 10, generation)
+
+        self.assertIsNone(self.cache.get("train:1"))
+        self.assertEqual(self.cache.stats.snapshot()["misses"], 1)
+
+    def test_invalidate_drops_keys_with_prefix(self):
+        self.cache.set("trains:list:a", [], 10, self.cache.generation)
+        self.cache.set("trains:list:b", [], 10, self.cache.generation)
+        self.cache.set("train:1", {"id": 1}, 10, self.cache.generation)
+
+        self.cache.invalidate("trains:list:*")
+
+        self.assertIsNone(self.cache.get("trains:list:a"))
+        self.assertIsNone(self.cache.get("trains:list:b"))
+        self.assertEqual(self.cache.get("train:1"), {"id": 1})
+
+    def test_set_evicts_least_recently_used_entries_over_memory_cap(self):
+        self.cache.max_bytes = 25
+        self.cache.set("train:1", {"id": 1}, 10, self.cache.generation)
+        self.cache.set("train:2", {"id": 2}, 10, self.cache.generation)
+        self.cache.get("train:1")
+        self.cache.set("train:3", {"id": 3}, 10, self.cache.generation)
+
+        self.assertIsNone(self.cache.get("train:2"))
+        self.assertEqual(self.cache.get("train:1"), {"id": 1})
+        self.assertEqual(self.cache.snapshot()["bytes"], 20)
+
+    def test_get_returns_nothing_while_disabled(self):
+        self.cache.set("train:1", {"id": 1}, 10, self.cache.generation)
+        self.cache.enabled = False
+
+        self.assertIsNone(self.cache.get("train:1"))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,112 @@
+import unittest
+from unittest.mock import MagicMock
+from db.database import Base
+from db.models import OutboxEvent
+from utils.event_codec import decode_event, render_event
+from utils.outbox import OutboxRelay
+from utils.train_events import add_event, booking_cancelled, booking_registered, train_updated
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+
+class TestOutboxRelay(unittest.TestCase):
+
+    def setUp(self):
+        engine = create_engine("sqlite://")
+        Base.metadata.create_all(bind=engine)
+
+        self.db = sessionmaker(bind=engine)()
+        for i in range(3):
+            add_event(self.db, train_updated(1, {"available_seats": (i, i + 1)}))
+        self.db.commit()
+
+        self.publisher = MagicMock()
+        self.relay = OutboxRelay(self.publisher)
+        self.relay.batch_size = 2
+        self.relay.confirm_timeout = 0.1
+
+    def confirm_on_publish(self, routing_key, message, tracker):
+        tracker.confirm()
+        return True
+
+    def published_events(self):
+        return [(call.args[0], decode_event(call.args[1]))
+                for call in self.publisher.send_message_to_exchange.call_args_list]
+
+    def test_confirmed_batch_is_deleted_in_order(self):
+        self.publisher.send_message_to_exchange.side_effect = self.confirm_on_publish
+
+        self.assertEqual(self.relay.relay(self.db), 2)
+
+        self.assertEqual([(routing_key, event.sequence, event.changes[0].new_value)
+                          for routing_key, event in self.published_events()], [("1", 1, "1"), ("1", 2, "2")])
+        self.assertEqual(self.db.query(OutboxEvent.id).scalar(), 3)
+
+    def test_unconfirmed_batch_is_kept(self):
+        self.publisher.send_message_to_exchange.return_value = True
+
+        self.assertRaises(RuntimeError, self.relay.relay, self.db)
+        self.db.rollback()
+
+        self.assertEqual(self.db.query(OutboxEvent).count(), 3)
+
+    def test_full_publish_queue_fails_the_round(self):
+        self.publisher.send_message_to_exchange.return_value = False
+
+        self.assertRaises(RuntimeError, self.relay.relay, self.db)
+        self.db.rollback()
+
+        self.assertEqual(self.publisher.send_message_to_exchange.call_count, 1)
+        self.assertEqual(self.db.query(OutboxEvent).count(), 3)
+
+    def relay_bookings(self, events: list, window: float):
+        self.db.query(OutboxEvent).delete()
+        for event in events:
+            add_event(self.db, event)
+        self.db.commit()
+
+        self.publisher.send_message_to_exchange.side_effect = self.confirm_on_publish
+        self.relay.batch_size = 500
+        self.relay.coalesce_window = window
+        self.relay.relay(self.db)
+
+        return [(routing_key, render_event(event)) for routing_key, event in self.published_events()]
+
+    def test_seat_count_updates_are_coalesced_per_train(self):
+        messages = self.relay_bookings([
+            booking_registered(1, "Jo Malone", 2),
+            booking_registered(2, "Hugo Boss", 9),
+            booking_registered(1, "Tom Ford", 1),
+            booking_registered(1, "Coco Chanel", 0),
+        ], window=0)
+
+        self.assertEqual(messages, [("1", "3 bookings were registered.\nThere are no more seats left.\n"),
+                                    ("2", "A booking was registered for Hugo Boss.\nAvailable seats: 9\n")])
+        self.assertEqual(self.published_events()[0][1].sequence, 4)
+        self.assertEqual(self.relay.snapshot()["coalesced"], 2)
+
+    def test_cancellation_ends_the_run(self):
+        messages = self.relay_bookings([
+            booking_registered(1, "Jo Malone", 2),
+            booking_registered(1, "Tom Ford", 1),
+            booking_cancelled(1, "Jo Malone", 2),
+            booking_registered(1, "Coco Chanel", 1),
+        ], window=0)
+
+        self.assertEqual(messages, [("1", "2 bookings were registered.\nAvailable seats: 1\n"),
+                                    ("1", "A booking was cancelled by Jo Malone.\nAvailable seats: 2\n"),
+                                    ("1", "A booking was registered for Coco Chanel.\nAvailable seats: 1\n")])
+
+    def test_open_run_is_held_for_the_window(self):
+        messages = self.relay_bookings([
+            booking_registered(1, "Jo Malone", 2),
+            booking_cancelled(1, "Jo Malone", 3),
+            booking_registered(1, "Tom Ford", 2),
+        ], window=60)
+
+        self.assertEqual(len(messages), 2)
+        self.assertEqual(decode_event(self.db.query(OutboxEvent.payload).scalar()).user_credentials, "Tom Ford")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,84 @@
+import unittest
+from unittest.mock import MagicMock
+from utils.rabbitmq import EVENT_PROPERTIES, PublishTracker, RabbitMQ
+from pika.spec import Basic
+
+
+class TestRabbitMQPublisher(unittest.TestCase):
+
+    def setUp(self):
+        self.publisher = RabbitMQ()
+        self.publisher._connection = MagicMock()
+        self.publisher._channel = MagicMock()
+        self.publisher._ready = True
+
+    def confirm(self, method):
+        self.publisher._on_delivery_confirmation(MagicMock(method=method))
+
+    def test_send_message_is_published_on_io_thread(self):
+        self.publisher.send_message_to_exchange("1", "A booking was registered")
+
+        self.publisher._channel.basic_publish.assert_not_called()
+        self.publisher._connection.ioloop.add_callback_threadsafe.assert_called_once_with(
+            self.publisher._publish_pending)
+
+        self.publisher._publish_pending()
+
+        self.publisher._channel.basic_publish.assert_called_once_with(
+            exchange='train_events', routing_key="1", body="A booking was registered", properties=EVENT_PROPERTIES)
+        self.assertEqual(len(self.publisher._unconfirmed), 1)
+
+    def test_multiple_ack_confirms_every_earlier_message(self):
+        for i in range(3):
+            self.publisher.send_message_to_exchange("1", f"message {i}")
+        self.publisher._publish_pending()
+
+        self.confirm(Basic.Ack(delivery_tag=2, multiple=True))
+
+        self.assertEqual(list(self.publisher._unconfirmed), [3])
+        self.assertEqual(self.publisher.stats.snapshot()["confirmed"], 2)
+
+    def test_tracker_is_confirmed_once_every_message_is_acked(self):
+        tracker = PublishTracker(2)
+        for i in range(2):
+            self.publisher.send_message_to_exchange("1", f"message {i}", tracker)
+        self.publisher._publish_pending()
+
+        self.confirm(Basic.Ack(delivery_tag=1, multiple=False))
+        self.assertFalse(tracker.wait(0))
+
+        self.confirm(Basic.Ack(delivery_tag=2, multiple=False))
+        self.assertTrue(tracker.wait(0))
+
+    def test_nacked_message_is_published_again(self):
+        self.publisher.send_message_to_exchange("1", "message")
+        self.publisher._publish_pending()
+
+        self.confirm(Basic.Nack(delivery_tag=1, multiple=False))
+
+        self.assertEqual(self.publisher._channel.basic_publish.call_count, 2)
+        self.assertEqual(self.publisher.stats.snapshot()["nacked"], 1)
+
+    def test_unconfirmed_messages_are_kept_when_connection_closes(self):
+        for i in range(2):
+            self.publisher.send_message_to_exchange("1", f"message {i}")
+        self.publisher._publish_pending()
+
+        self.publisher._on_connection_closed(MagicMock(), "connection lost")
+
+        self.assertEqual([message[1] for message in self.publisher._retry], ["message 0", "message 1"])
+        self.assertEqual(self.publisher.snapshot()["queue_depth"], 2)
+
+    def test_in_flight_messages_are_bounded(self):
+        self.publisher.max_unconfirmed = 2
+        for i in range(3):
+            self.publisher.send_message_to_exchange("1", f"message {i}")
+
+        self.publisher._publish_pending()
+
+        self.assertEqual(self.publisher._channel.basic_publish.call_count, 2)
+        self.assertEqual(self.publisher.pending(), 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,49 @@
+import unittest
+from unittest.mock import MagicMock
+from db.topology import DbTopology
+
+
+class TestReplicaSelection(unittest.TestCase):
+
+    def setUp(self):
+        self.mock_engine_registry = MagicMock()
+        self.topology = DbTopology(self.mock_engine_registry)
+        self.topology.update('master', ['replica_1', 'replica_2'])
+
+    def test_select_replica_prefers_least_loaded_replica(self):
+        self.topology.replicas['replica_1'].latency_seconds = 0.01
+        self.topology.replicas['replica_1'].outstanding = 3
+        self.topology.replicas['replica_2'].latency_seconds = 0.01
+
+        result = self.topology.select_replica()
+
+        self.assertEqual(result.dsn, 'replica_2')
+
+    def test_select_replica_skips_lagging_replica(self):
+        self.topology.replicas['replica_1'].lag_seconds = self.topology.max_replica_lag + 1
+        self.topology.replicas['replica_2'].outstanding = 10
+
+        result = self.topology.select_replica()
+
+        self.assertEqual(result.dsn, 'replica_2')
+
+    def test_get_sessions_falls_back_to_master(self):
+        for replica in self.topology.replicas.values():
+            replica.healthy = False
+
+        master_db, slave_db, replica = self.topology.get_sessions()
+
+        self.assertIsNone(replica)
+        self.mock_engine_registry.get_session.assert_called_with('master')
+
+    def test_release_decrements_outstanding_requests(self):
+        _, _, replica = self.topology.get_sessions()
+        self.assertEqual(replica.outstanding, 1)
+
+        self.topology.release(replica)
+
+        self.assertEqual(replica.outstanding, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,80 @@
+import unittest
+from unittest.mock import MagicMock, patch
+from sqlalchemy.exc import IntegrityError
+from utils.seat_inventory import SeatInventory, NO_SEATS_LEFT
+
+
+class TestSeatInventory(unittest.TestCase):
+
+    def setUp(self):
+        self.calls = []
+        self.redis_cache = MagicMock()
+        self.redis_cache.register_script.side_effect = [MagicMock(), MagicMock(), MagicMock()]
+        self.redis_cache.lock.side_effect = lambda name, **kwargs: MagicMock(
+            __enter__=lambda _: self.calls.append(('lock', name)),
+            __exit__=lambda *_: self.calls.append(('unlock', name)))
+
+        self.seat_inventory = SeatInventory(self.redis_cache)
+        self.seat_inventory.reserve_seat_script.side_effect = lambda keys, args: self.calls.append(
+            ('reserve', args[0])) or (NO_SEATS_LEFT if args[0] == "Hugo Boss" else 1)
+        self.seat_inventory.release_seat_script.side_effect = lambda keys, args: self.calls.append(
+            ('release', args[0]))
+
+    @patch('utils.seat_inventory.seat_inventory_flusher')
+    def test_failed_batch_is_taken_back_before_the_trains_are_unlocked(self, flusher):
+        results = self.seat_inventory.reserve_all([(2, "Jo Malone"), (1, "Tom Ford"), (1, "Hugo Boss")], MagicMock())
+
+        self.assertEqual(results, [1, 1, NO_SEATS_LEFT])
+        self.assertEqual(self.calls, [
+            ('lock', "seat_inventory:{1}:lock"), ('lock', "seat_inventory:{2}:lock"),
+            ('reserve', "Jo Malone"), ('reserve', "Tom Ford"), ('reserve', "Hugo Boss"),
+            ('release', "Jo Malone"), ('release', "Tom Ford"),
+            ('unlock', "seat_inventory:{2}:lock"), ('unlock', "seat_inventory:{1}:lock")])
+        flusher.mark_dirty.assert_not_called()
+
+    @patch('utils.seat_inventory.seat_inventory_flusher')
+    def test_successful_batch_is_left_to_the_flusher(self, flusher):
+        self.seat_inventory.reserve_all([(1, "Jo Malone"), (2, "Tom Ford")], MagicMock())
+
+        self.seat_inventory.release_seat_script.assert_not_called()
+        self.assertEqual(sorted(call.args[0] for call in flusher.mark_dirty.call_args_list), [1, 2])
+
+    def test_flushed_booking_ids_are_no_longer_cached_as_missing(self):
+        self.redis_cache.lrange.return_value = [b"Tom Ford"]
+        db = MagicMock()
+        db.execute.side_effect = [MagicMock(all=MagicMock(return_value=[("Tom Ford", 7)])),
+                                  MagicMock(scalar_one=MagicMock(return_value=3))]
+
+        self.seat_inventory._flush_pending(1, db)
+
+        evicted = [call.args[0] for call in self.redis_cache.pipeline.return_value.delete.call_args_list]
+        self.assertEqual(evicted, ["train:1", "booking:7"])
+
+    def test_train_stays_locked_until_the_change_is_committed(self):
+        with self.seat_inventory.evicted(1, MagicMock()):
+            self.calls.append(('commit', None))
+
+        self.assertEqual(self.calls, [('lock', "seat_inventory:{1}:lock"), ('commit', None),
+                                      ('unlock', "seat_inventory:{1}:lock")])
+
+    def test_reservations_that_no_longer_fit_are_dropped(self):
+        self.redis_cache.lrange.return_value = [b"Tom Ford", b"Jo Malone"]
+        db = MagicMock()
+        db.execute.side_effect = [IntegrityError("UPDATE trains", {}, Exception("check_available_seats_min")),
+                                  MagicMock(scalar_one_or_none=MagicMock(return_value=1)),
+                                  MagicMock(all=MagicMock(return_value=[("Tom Ford", 7)])),
+                                  MagicMock(scalar_one=MagicMock(return_value=0))]
+
+        self.assertEqual(self.seat_inventory._flush_pending(1, db), 2)
+
+        db.rollback.assert_called_once()
+        db.commit.assert_called_once()
+        self.assertEqual(db.execute.call_args_list[2].args[0].compile().params["user_credentials_m0"], "Tom Ford")
+        pipeline = self.redis_cache.pipeline.return_value
+        pipeline.ltrim.assert_called_once_with("seat_inventory:{1}:pending", 2, -1)
+        self.assertEqual([call.args[0] for call in pipeline.delete.call_args_list],
+                         ["seat_inventory:{1}:seats", "seat_inventory:{1}:users", "train:1", "booking:7"])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,86 @@
+import unittest
+from unittest.mock import MagicMock
+from datetime import datetime
+from db.database import Base
+from db.models import Train
+from db.schemas import TrainUpdateDto
+from management.train_manager import TrainManager
+from sqlalchemy import create_engine, event
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+
+import asyncio
+
+
+class TestTrainManager(unittest.TestCase):
+
+    def setUp(self):
+        # one shared connection, bulk imports run their chunks in the threadpool
+        engine = create_engine("sqlite://", poolclass=StaticPool, connect_args={"check_same_thread": False})
+        Base.metadata.create_all(bind=engine)
+
+        self.db = sessionmaker(bind=engine)()
+        self.db.add(Train(id=1, route="Chisinau-Iasi", departure_time=datetime.now(),
+                          arrival_time=datetime.now(), available_seats=2))
+        self.db.commit()
+
+        self.manager = TrainManager(self.db, self.db, MagicMock())
+        self.statements = []
+
+        # sqlite drops FOR UPDATE, so the ORM selects are compiled for postgres to see the lock
+        @event.listens_for(self.db, "do_orm_execute")
+        def record_select(orm_execute_state):
+            if orm_execute_state.is_select:
+                self.statements.append(str(orm_execute_state.statement.compile(dialect=postgresql.dialect())))
+
+        @event.listens_for(engine, "before_cursor_execute")
+        def record_write(connection, cursor, statement, parameters, context, executemany):
+            if not statement.startswith("SELECT"):
+                self.statements.append(statement)
+
+    def assert_event_written_under_row_lock(self, write: str):
+        locking_select = next(i for i, statement in enumerate(self.statements)
+                              if statement.startswith("SELECT") and statement.endswith("FOR UPDATE"))
+        outbox_insert = next(i for i, statement in enumerate(self.statements)
+                             if statement.startswith("INSERT INTO outbox_events"))
+        train_write = next(i for i, statement in enumerate(self.statements) if statement.startswith(write))
+
+        self.assertLess(locking_select, outbox_insert)
+        self.assertLess(locking_select, train_write)
+
+    def test_update_locks_the_train_before_its_event_is_written(self):
+        self.manager.update(1, TrainUpdateDto(available_seats=5))
+
+        self.assert_event_written_under_row_lock("UPDATE trains")
+
+    def test_delete_locks_the_train_before_its_event_is_written(self):
+        self.manager.delete(1)
+
+        self.assert_event_written_under_row_lock("DELETE FROM trains")
+
+    def test_evicted_train_is_refilled_from_the_master(self):
+        redis_cache = MagicMock()
+        redis_cache.get.return_value = None
+        slave_db = MagicMock()
+
+        train = TrainManager(self.db, slave_db, redis_cache).get_by_id(1)
+
+        self.assertEqual(train.available_seats, 2)
+        slave_db.query.assert_not_called()
+        self.assertEqual(redis_cache.setex.call_args.kwargs["name"], "train:1")
+
+    def test_imported_train_ids_are_no_longer_cached_as_missing(self):
+        async def rows():
+            for route in ("Chisinau-Bucuresti", "Chisinau-Odesa"):
+                yield {"route": route, "departure_time": "2026-11-01T08:00:00",
+                       "arrival_time": "2026-11-01T16:00:00", "available_seats": 100}
+
+        train_ids = asyncio.run(self.manager.bulk_import(rows()))
+
+        evicted = [call.args[0] for call in self.manager.redis_cache.pipeline.return_value.delete.call_args_list]
+        self.assertEqual(evicted, [f"train:{train_id}" for train_id in train_ids])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,256 @@
+from db.schemas import BookingBaseDto, BookingBatchDto
+from fastapi import HTTPException
+from management.booking_manager import BookingManager
+from pydantic import ValidationError
+from redis.cluster import RedisCluster
+from redis.exceptions import RedisClusterException, RedisError
+from sqlalchemy.exc import InterfaceError, OperationalError, TimeoutError as PoolTimeoutError
+from sqlalchemy.orm import Session
+from utils.redis_cache import get_redis_client
+from utils.seat_inventory import get_seat_inventory
+from utils.train_events import add_event, booking_processed
+
+import threading
+import time
+import json
+import pika
+import os
+
+# filled by the lobby service, the outcome of every ticket is kept in Redis for its status endpoint
+BOOKING_QUEUE = os.getenv('BOOKING_QUEUE', 'booking_requests')
+BOOKING_TICKET_TTL = int(os.getenv('BOOKING_TICKET_TTL', 3600))
+BOOKING_DEAD_LETTER_QUEUE = os.getenv('BOOKING_DEAD_LETTER_QUEUE', 'booking_requests.dead')
+
+# failures of the database or Redis connection, every request of the batch would fail the same way,
+# HTTPException is what get_redis_client raises while the cluster is unavailable
+TRANSIENT_ERRORS = (OperationalError, InterfaceError, PoolTimeoutError, RedisError, RedisClusterException,
+                    ConnectionError, HTTPException)
+
+
+def ticket_key(ticket_id: str):
+    return f"booking_ticket:{ticket_id}"
+
+
+class BookingIntake:
+
+    rabbit_host = os.getenv('RABBITMQ_HOST')
+    rabbit_user = os.getenv('RABBITMQ_USER')
+    rabbit_password = os.getenv('RABBITMQ_PASS')
+
+    # at most 500 bookings fit into one batch
+    batch_size = min(int(os.getenv('BOOKING_INTAKE_BATCH_SIZE', 200)), 500)
+    batch_wait = float(os.getenv('BOOKING_INTAKE_BATCH_WAIT', 0.05))
+    retry_delay = float(os.getenv('BOOKING_INTAKE_RETRY_DELAY', 2))
+    # attempts of a request that fails on its own before it is moved to the dead letter queue
+    max_attempts = int(os.getenv('BOOKING_INTAKE_MAX_ATTEMPTS', 5))
+
+    def __init__(self):
+        self._stop_consuming = threading.Event()
+        self._consumer = None
+        self._connected = False
+        self._attempts = {}
+
+        self.batches = 0
+        self.failed_batches = 0
+        self.confirmed = 0
+        self.rejected = 0
+        self.invalid = 0
+        self.dead_lettered = 0
+
+    def start(self, get_master_session):
+        if self._consumer is not None:
+            return
+
+        self._stop_consuming.clear()
+        self._consumer = threading.Thread(target=self._consume, args=(get_master_session,), daemon=True)
+        self._consumer.start()
+
+    def stop(self):
+        self._stop_consuming.set()
+        self._consumer = None
+
+    def snapshot(self):
+        return {"connected": self._connected, "batches": self.batches,
+                "failed_batches": self.failed_batches, "confirmed": self.confirmed, "rejected": self.rejected,
+                "invalid": self.invalid, "dead_lettered": self.dead_lettered}
+
+    def process(self, requests: list, db: Session, redis_client: RedisCluster):
+        # bookings of the same train are taken in one locked round by the batch path of the manager,
+        # and committed together with their outcome events, so a failed batch leaves nothing behind
+        manager = BookingManager(db, db, redis_client, get_seat_inventory(redis_client))
+        results = manager.create_batch(BookingBatchDto(bookings=[
+            BookingBaseDto(train_id=request["train_id"], user_credentials=request["user_credentials"])
+            for request in requests], all_or_nothing=False), commit=False)
+
+        tickets = []
+        for request, result in zip(requests, results):
+            add_event(db, booking_processed(result.train_id, request["ticket_id"], result.user_credentials,
+                                            result.booking_id, result.error))
+            tickets.append({"ticket_id": request["ticket_id"], "train_id": result.train_id,
+                            "user_credentials": result.user_credentials,
+                            "status": "rejected" if result.error else "confirmed",
+                            "booking_id": result.booking_id, "error": result.error})
+        db.commit()
+
+        rejected = sum(1 for ticket in tickets if ticket["error"])
+        self.batches += 1
+        self.rejected += rejected
+        self.confirmed += len(tickets) - rejected
+
+        # the bookings are committed, sending them again would only reject them as duplicates
+        try:
+            manager.evict_batch(results)
+        except Exception as err:
+            print(f"Could not evict caches of {len(tickets)} booking tickets: {err}")
+        self.store_tickets(tickets, redis_client)
+
+        return tickets
+
+    def store_tickets(self, tickets: list, redis_client: RedisCluster):
+        try:
+            pipeline = redis_client.pipeline()
+            for ticket in tickets:
+                pipeline.setex(name=ticket_key(ticket["ticket_id"]), time=BOOKING_TICKET_TTL, value=json.dumps(ticket))
+            pipeline.execute()
+        except Exception as err:
+            print(f"Could not store outcome of {len(tickets)} booking tickets: {err}")
+
+    def parse(self, body: bytes):
+        try:
+            request = json.loads(body)
+            BookingBaseDto(train_id=request["train_id"], user_credentials=request["user_credentials"])
+            if not isinstance(request["ticket_id"], str):
+                raise ValueError("ticket id is not a string")
+            return request
+        except (ValueError, KeyError, TypeError, ValidationError) as err:
+            print(f"Dropped invalid booking request: {err}")
+            self.invalid += 1
+            return None
+
+    def _consume(self, get_master_session):
+        parameters = pika.ConnectionParameters(
+            host=self.rabbit_host, credentials=pika.PlainCredentials(self.rabbit_user, self.rabbit_password))
+
+        while not self._stop_consuming.is_set():
+            connection = None
+            batch = []
+
+            def on_message(channel, method, properties, body):
+                batch.append((method.delivery_tag, self.parse(body)))
+
+            try:
+                connection = pika.BlockingConnection(parameters)
+                channel = connection.channel()
+                channel.queue_declare(queue=BOOKING_QUEUE, durable=True)
+                channel.queue_declare(queue=BOOKING_DEAD_LETTER_QUEUE, durable=True)
+                # unacknowledged requests stay in the queue, so a crashed worker loses none of them
+                channel.basic_qos(prefetch_count=self.batch_size)
+                channel.basic_consume(queue=BOOKING_QUEUE, on_message_callback=on_message)
+                self._connected = True
+                print("Booking intake worker is ready")
+
+                while not self._stop_consuming.is_set():
+                    connection.process_data_events(time_limit=self.batch_wait)
+                    if not batch:
+                        continue
+
+                    # a batch goes to the database once it is full or its first request waited batch_wait
+                    deadline = time.monotonic() + self.batch_wait
+                    while len(batch) < self.batch_size and time.monotonic() < deadline:
+                        connection.process_data_events(time_limit=max(deadline - time.monotonic(), 0))
+
+                    self._handle(channel, batch, get_master_session)
+                    batch.clear()
+
+            except Exception as err:
+                print(f"Booking intake worker failed: {err}")
+
+            finally:
+                self._connected = False
+                if connection is not None and connection.is_open:
+                    try:
+                        connection.close()
+                    except Exception:
+                        pass
+
+            self._stop_consuming.wait(self.retry_delay)
+
+    def _handle(self, channel, batch: list, get_master_session):
+        last_delivery_tag = batch[-1][0]
+        requests = [request for _, request in batch if request is not None]
+
+        if requests:
+            try:
+                self._process_in_session(requests, get_master_session)
+            except TRANSIENT_ERRORS as err:
+                print(f"Could not process {len(requests)} booking requests: {err}")
+                self.failed_batches += 1
+                channel.basic_nack(delivery_tag=last_delivery_tag, multiple=True, requeue=True)
+                self._stop_consuming.wait(self.retry_delay)
+                return
+            except Exception as err:
+                # a request the database refuses would fail its batch on every redelivery and hold up
+                # the whole queue, so the batch is retried one request at a time to single it out
+                print(f"Could not process {len(requests)} booking requests, retrying them one by one: {err}")
+                self.failed_batches += 1
+                self._handle_one_by_one(channel, batch, get_master_session)
+                return
+
+        channel.basic_ack(delivery_tag=last_delivery_tag, multiple=True)
+
+    def _handle_one_by_one(self, channel, batch: list, get_master_session):
+        for i, (delivery_tag, request) in enumerate(batch):
+            if request is None:
+                channel.basic_ack(delivery_tag=delivery_tag)
+                continue
+
+            try:
+                self._process_in_session([request], get_master_session)
+            except TRANSIENT_ERRORS as err:
+                print(f"Could not process booking request {request['ticket_id']}: {err}")
+                for remaining_delivery_tag, _ in batch[i:]:
+                    channel.basic_nack(delivery_tag=remaining_delivery_tag, requeue=True)
+                self._stop_consuming.wait(self.retry_delay)
+                return
+            except Exception as err:
+                self._retry_or_dead_letter(channel, delivery_tag, request, err)
+                continue
+
+            self._attempts.pop(request["ticket_id"], None)
+            channel.basic_ack(delivery_tag=delivery_tag)
+
+    def _retry_or_dead_letter(self, channel, delivery_tag: int, request: dict, err: Exception):
+        attempts = self._attempts.get(request["ticket_id"], 0) + 1
+
+        if attempts < self.max_attempts:
+            print(f"Could not process booking request {request['ticket_id']} (attempt {attempts}): {err}")
+            self._attempts[request["ticket_id"]] = attempts
+            channel.basic_nack(delivery_tag=delivery_tag, requeue=True)
+            return
+
+        # kept in the dead letter queue for inspection, the ticket is answered so clients stop waiting
+        print(f"Dead-lettered booking request {request['ticket_id']} after {attempts} attempts: {err}")
+        self._attempts.pop(request["ticket_id"], None)
+        self.dead_lettered += 1
+        channel.basic_publish(exchange='', routing_key=BOOKING_DEAD_LETTER_QUEUE, body=json.dumps(request),
+                              properties=pika.BasicProperties(content_type='application/json', delivery_mode=2,
+                                                              headers={"error": str(err)[:1000]}))
+        channel.basic_ack(delivery_tag=delivery_tag)
+
+        self.rejected += 1
+        try:
+            redis_client = get_redis_client()
+        except HTTPException as err:
+            print(f"Could not store outcome of booking ticket {request['ticket_id']}: {err.detail}")
+            return
+
+        self.store_tickets([{"ticket_id": request["ticket_id"], "train_id": request["train_id"],
+                             "user_credentials": request["user_credentials"], "status": "rejected",
+                             "booking_id": None, "error": "Booking request could not be processed"}], redis_client)
+
+    def _process_in_session(self, requests: list, get_master_session):
+        with get_master_session() as db:
+            self.process(requests, db, get_redis_client())
+
+
+booking_intake = BookingIntake()
@@ -0,0 +1,68 @@
+from utils.train_events_pb2 import EventType, TrainEvent
+
+EVENT_SCHEMA_VERSION = 1
+EVENT_CONTENT_TYPE = 'application/x-protobuf'
+
+# the route change is the first line of an update and is shown without a label
+TRAIN_CHANGE_LABELS = {
+    "route": "",
+    "departure_time": "Departure time: ",
+    "arrival_time": "Arrival time: ",
+    "available_seats": "Available seats: "
+}
+
+
+def encode_event(event: TrainEvent):
+    event.version = EVENT_SCHEMA_VERSION
+    return event.SerializeToString()
+
+
+def decode_event(body: bytes):
+    event = TrainEvent()
+    event.ParseFromString(body)
+    return event
+
+
+def render_event(event: TrainEvent):
+    if event.type == EventType.BOOKINGS_REGISTERED:
+        if event.user_credentials:
+            message = f"A booking was registered for {event.user_credentials}.\n"
+        else:
+            message = f"{event.booked_seats} bookings were registered.\n"
+
+        if event.available_seats == 0:
+            return message + "There are no more seats left.\n"
+        return message + f"Available seats: {event.available_seats}\n"
+
+    if event.type == EventType.BOOKING_CANCELLED:
+        return f"A booking was cancelled by {event.user_credentials}.\nAvailable seats: {event.available_seats}\n"
+
+    if event.type == EventType.TRAIN_UPDATED:
+        return "Train details were updated:\n" + "".join(
+            f"{TRAIN_CHANGE_LABELS.get(change.field, '')}{change.old_value} -> {change.new_value}\n"
+            for change in event.changes)
+
+    if event.type == EventType.TRAIN_REMOVED:
+        return "Train you were tracking was removed from the schedule. It was registered by mistake.\n"
+
+    if event.type == EventType.BOOKING_PROCESSED:
+        if event.error:
+            return f"Booking request {event.ticket_id} of {event.user_credentials} was rejected: {event.error}\n"
+        return f"Booking request {event.ticket_id} of {event.user_credentials} was confirmed.\n"
+
+    return ""
+
+
+class EventSequence:
+
+    # events are delivered at least once and sequence numbers only grow per train, so anything
+    # at or below the last seen number is a redelivery or was overtaken by a newer state
+    def __init__(self):
+        self._last_sequence = {}
+
+    def is_stale(self, event: TrainEvent):
+        if event.sequence <= self._last_sequence.get(event.train_id, 0):
+            return True
+
+        self._last_sequence[event.train_id] = event.sequence
+        return False
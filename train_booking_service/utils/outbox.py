@@ -0,0 +1,155 @@
+from db.models import OutboxEvent
+from sqlalchemy import delete, func, select
+from sqlalchemy.orm import Session
+from utils.rabbitmq import PublishTracker, RabbitMQ, rabbitmq
+from utils.event_codec import decode_event, encode_event
+from utils.train_events import bookings_registered
+from utils.train_events_pb2 import EventType
+
+import threading
+import time
+import os
+
+# every replica runs a relay, the advisory lock lets only one of them drain the table at a time
+# so the events of a train reach the exchange in the order they were committed
+OUTBOX_LOCK_ID = 720001
+
+
+class OutboxRelay:
+
+    batch_size = int(os.getenv('OUTBOX_BATCH_SIZE', 500))
+    poll_interval = float(os.getenv('OUTBOX_POLL_INTERVAL', 0.2))
+    confirm_timeout = float(os.getenv('OUTBOX_CONFIRM_TIMEOUT', 10))
+    retry_delay = float(os.getenv('OUTBOX_RETRY_DELAY', 1))
+    max_retry_delay = float(os.getenv('OUTBOX_MAX_RETRY_DELAY', 30))
+    coalesce_window = float(os.getenv('EVENT_COALESCE_WINDOW', 0.5))
+
+    def __init__(self, publisher: RabbitMQ):
+        self.publisher = publisher
+        self._stop_relaying = threading.Event()
+        self._relay = None
+        self._held_since = {}
+        self.relayed = 0
+        self.published = 0
+        self.failed_rounds = 0
+
+    def start(self, get_master_session):
+        if self._relay is not None:
+            return
+
+        self._stop_relaying.clear()
+        self._relay = threading.Thread(
+            target=self._relay_periodically, args=(get_master_session,), daemon=True)
+        self._relay.start()
+
+    def stop(self):
+        self._stop_relaying.set()
+        self._relay = None
+
+    def relay(self, db: Session):
+        if db.get_bind().dialect.name == 'postgresql' and \
+                not db.execute(select(func.pg_try_advisory_xact_lock(OUTBOX_LOCK_ID))).scalar():
+            db.rollback()
+            return 0
+
+        rows = db.execute(
+            select(OutboxEvent.id, OutboxEvent.routing_key, OutboxEvent.payload)
+            .order_by(OutboxEvent.id)
+            .limit(self.batch_size)
+        ).all()
+
+        events = []
+        for row in rows:
+            event = decode_event(row.payload)
+            event.sequence = row.id
+            events.append(event)
+
+        runs = self.coalesce(events, hold=len(rows) < self.batch_size)
+
+        if not runs:
+            db.rollback()
+            return 0
+
+        tracker = PublishTracker(len(runs))
+        for run in runs:
+            if not self.publisher.send_message_to_exchange(str(run[0].train_id), encode_event(self.merge(run)),
+                                                           tracker):
+                raise RuntimeError("publish queue is full")
+
+        # rows are deleted only once the broker confirmed all of them, a failed round is relayed
+        # again, so delivery is at least once
+        if not tracker.wait(self.confirm_timeout):
+            raise RuntimeError(f"{tracker.remaining} of {len(runs)} events were not confirmed in time")
+
+        relayed_ids = [event.sequence for run in runs for event in run]
+        db.execute(delete(OutboxEvent).where(OutboxEvent.id.in_(relayed_ids)))
+        db.commit()
+
+        self.relayed += len(relayed_ids)
+        self.published += len(runs)
+        return len(relayed_ids)
+
+    def coalesce(self, events: list, hold: bool):
+        # consecutive seat count updates of a train collapse into one event, any other event of
+        # that train ends the run, so cancellations and train changes are never reordered
+        runs = []
+        open_runs = {}
+
+        for event in events:
+            if event.type == EventType.BOOKINGS_REGISTERED:
+                if event.train_id not in open_runs:
+                    open_runs[event.train_id] = []
+                    runs.append(open_runs[event.train_id])
+                open_runs[event.train_id].append(event)
+            else:
+                open_runs.pop(event.train_id, None)
+                runs.append([event])
+
+        # a run that is still open may keep growing, so it waits in the table until the window
+        # has passed, unless the batch is full and the rest of the table has to be drained first
+        now = time.monotonic()
+        held_since = {}
+        for train_id, run in open_runs.items():
+            run_held_since = self._held_since.get(train_id, now)
+            if hold and now - run_held_since < self.coalesce_window:
+                held_since[train_id] = run_held_since
+        self._held_since = held_since
+
+        return [run for run in runs if open_runs.get(run[0].train_id) is not run
+                or run[0].train_id not in held_since]
+
+    def merge(self, run: list):
+        if len(run) == 1:
+            return run[0]
+
+        # the merged event takes the sequence number and seat count of the latest booking in the run
+        event = bookings_registered(run[-1].train_id, sum(event.booked_seats for event in run),
+                                    run[-1].available_seats)
+        event.sequence = run[-1].sequence
+        event.timestamp_ms = run[-1].timestamp_ms
+        return event
+
+    def snapshot(self):
+        return {"relayed": self.relayed, "published": self.published, "coalesced": self.relayed - self.published,
+                "failed_rounds": self.failed_rounds}
+
+    def _relay_periodically(self, get_master_session):
+        failures = 0
+        delay = self.poll_interval
+
+        while not self._stop_relaying.wait(delay):
+            try:
+                with get_master_session() as db:
+                    relayed = self.relay(db)
+
+                failures = 0
+                # a full batch means more events are waiting, so the next one is sent right away
+                delay = 0 if relayed == self.batch_size else self.poll_interval
+            except Exception as err:
+                print(f"Could not relay outbox events: {err}")
+                failures += 1
+                self.failed_rounds += 1
+                delay = min(self.retry_delay * 2 ** (failures - 1), self.max_retry_delay)
+
+
+outbox_relay = OutboxRelay(rabbitmq)
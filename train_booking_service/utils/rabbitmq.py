@@ -1,33 +1,271 @@
+from collections import deque
+from typing import Optional
+from utils.event_codec import EVENT_CONTENT_TYPE
+from utils.metrics import rabbitmq_publish_duration
+import threading
+import queue
+import time
 import pika
 import os
 
+EVENT_PROPERTIES = pika.BasicProperties(content_type=EVENT_CONTENT_TYPE)
+
+
+class PublisherStats:
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.published = 0
+        self.confirmed = 0
+        self.nacked = 0
+        self.dropped = 0
+        self.latency_total = 0.0
+        self.latency_max = 0.0
+
+    def record_published(self, count: int):
+        with self._lock:
+            self.published += count
+
+    def record_confirmed(self, latency: float):
+        rabbitmq_publish_duration.observe(latency)
+
+        with self._lock:
+            self.confirmed += 1
+            self.latency_total += latency
+            self.latency_max = max(self.latency_max, latency)
+
+    def record_nacked(self):
+        with self._lock:
+            self.nacked += 1
+
+    def record_dropped(self):
+        with self._lock:
+            self.dropped += 1
+
+    def snapshot(self):
+        with self._lock:
+            return {"published": self.published, "confirmed": self.confirmed, "nacked": self.nacked,
+                    "dropped": self.dropped, "latency_max_seconds": round(self.latency_max, 6),
+                    "latency_avg_seconds": round(self.latency_total / self.confirmed, 6) if self.confirmed else None}
+
+
+class PublishTracker:
+
+    def __init__(self, count: int):
+        self._lock = threading.Lock()
+        self._confirmed = threading.Event()
+        self.remaining = count
+
+        if count == 0:
+            self._confirmed.set()
+
+    def confirm(self):
+        with self._lock:
+            self.remaining -= 1
+            if self.remaining <= 0:
+                self._confirmed.set()
+
+    def wait(self, timeout: float):
+        return self._confirmed.wait(timeout)
+
+
 class RabbitMQ:
 
     rabbit_host = os.getenv('RABBITMQ_HOST')
     rabbit_user = os.getenv('RABBITMQ_USER')
     rabbit_password = os.getenv('RABBITMQ_PASS')
 
+    queue_size = int(os.getenv('RABBITMQ_PUBLISH_QUEUE_SIZE', 10000))
+    enqueue_timeout = float(os.getenv('RABBITMQ_ENQUEUE_TIMEOUT', 1))
+    max_unconfirmed = int(os.getenv('RABBITMQ_MAX_UNCONFIRMED', 1000))
+    reconnect_delay = float(os.getenv('RABBITMQ_RECONNECT_DELAY', 2))
+    stop_timeout = float(os.getenv('RABBITMQ_STOP_TIMEOUT', 5))
+
     def __init__(self):
-        self.connection = pika.BlockingConnection(
-            pika.ConnectionParameters(host=self.rabbit_host, credentials=pika.PlainCredentials(self.rabbit_user, self.rabbit_password)))
-        
-        self.channel = self.connection.channel()
-        self.channel.exchange_declare(exchange='train_events', exchange_type='direct')
-
-    def send_message_to_exchange(self, routing_key: str, message: str):
-        self.channel.basic_publish(
-            exchange='train_events',
-            routing_key=routing_key,
-            body=message
-        )
-        
-    def close(self):
-        self.connection.close()
+        self._messages = queue.Queue(maxsize=self.queue_size)
+        # messages that were sent but not confirmed when the connection dropped, or were nacked
+        self._retry = deque()
+        self._unconfirmed = {}
+        self._delivery_tag = 0
+
+        self._connection = None
+        self._channel = None
+        self._ready = False
+        self._drain_scheduled = False
+        self._stopping = False
+        self._publisher = None
+
+        self.stats = PublisherStats()
+
+    def send_message_to_exchange(self, routing_key: str, message: bytes, tracker: Optional[PublishTracker] = None):
+        try:
+            self._messages.put((routing_key, message, time.perf_counter(), tracker), timeout=self.enqueue_timeout)
+        except queue.Full:
+            self.stats.record_dropped()
+            print(f"Publish queue is full, dropped event for train {routing_key}")
+            return False
+
+        self._schedule_drain()
+        return True
+
+    def start(self):
+        if self._publisher is not None:
+            return
+
+        self._stopping = False
+        self._publisher = threading.Thread(target=self._run, daemon=True)
+        self._publisher.start()
+
+    def stop(self):
+        # gives the I/O thread a chance to flush what was already accepted
+        deadline = time.monotonic() + self.stop_timeout
+        while (self.pending() or self._unconfirmed) and self._ready and time.monotonic() < deadline:
+            time.sleep(0.05)
+
+        self._stopping = True
+        connection = self._connection
+        if connection is not None:
+            connection.ioloop.add_callback_threadsafe(self._close)
+
+        self._publisher = None
+
+    def pending(self):
+        return self._messages.qsize() + len(self._retry)
+
+    def snapshot(self):
+        return {**self.stats.snapshot(), "queue_depth": self.pending(), "unconfirmed": len(self._unconfirmed),
+                "connected": self._ready}
+
+    def _run(self):
+        parameters = pika.ConnectionParameters(
+            host=self.rabbit_host, credentials=pika.PlainCredentials(self.rabbit_user, self.rabbit_password))
+
+        while not self._stopping:
+            try:
+                self._connection = pika.SelectConnection(
+                    parameters, on_open_callback=self._on_connection_open,
+                    on_open_error_callback=self._on_connection_open_error,
+                    on_close_callback=self._on_connection_closed)
+                self._connection.ioloop.start()
+            except Exception as err:
+                print(f"RabbitMQ publisher failed: {err}")
+
+            self._connection = None
+
+            if not self._stopping:
+                time.sleep(self.reconnect_delay)
+
+    def _schedule_drain(self):
+        connection = self._connection
+        if not self._ready or self._drain_scheduled or connection is None:
+            return
+
+        self._drain_scheduled = True
+        try:
+            connection.ioloop.add_callback_threadsafe(self._publish_pending)
+        except Exception:
+            # the connection is going away, the queue is drained again once the channel is reopened
+            self._drain_scheduled = False
+
+    def _publish_pending(self):
+        self._drain_scheduled = False
+        published = 0
+
+        # at most max_unconfirmed messages are in flight, the rest waits in the bounded queue
+        while self._ready and len(self._unconfirmed) < self.max_unconfirmed:
+            if self._retry:
+                message = self._retry.popleft()
+            else:
+                try:
+                    message = self._messages.get_nowait()
+                except queue.Empty:
+                    break
+
+            routing_key, body, _, _ = message
+            self._channel.basic_publish(exchange='train_events', routing_key=routing_key, body=body,
+                                        properties=EVENT_PROPERTIES)
+
+            self._delivery_tag += 1
+            self._unconfirmed[self._delivery_tag] = message
+            published += 1
+
+        if published:
+            self.stats.record_published(published)
+
+    def _on_connection_open(self, connection):
+        connection.channel(on_open_callback=self._on_channel_open)
+
+    def _on_connection_open_error(self, connection, err):
+        print(f"Could not connect to RabbitMQ: {err!r}")
+        connection.ioloop.stop()
+
+    def _on_connection_closed(self, connection, reason):
+        self._ready = False
+        self._channel = None
+
+        # unconfirmed messages are sent again after reconnecting, so delivery is at least once
+        self._retry.extendleft(reversed(list(self._unconfirmed.values())))
+        self._unconfirmed.clear()
+
+        if not self._stopping:
+            print(f"RabbitMQ publisher connection closed: {reason}")
+        connection.ioloop.stop()
+
+    def _on_channel_open(self, channel):
+        self._channel = channel
+        channel.add_on_close_callback(self._on_channel_closed)
+        channel.exchange_declare(exchange='train_events', exchange_type='direct',
+                                 callback=self._on_exchange_declared)
+
+    def _on_channel_closed(self, channel, reason):
+        self._ready = False
+        if self._connection is not None and self._connection.is_open:
+            self._connection.close()
+
+    def _on_exchange_declared(self, frame):
+        self._channel.confirm_delivery(ack_nack_callback=self._on_delivery_confirmation,
+                                       callback=self._on_confirm_selected)
+
+    def _on_confirm_selected(self, frame):
+        self._delivery_tag = 0
+        self._ready = True
+        print("RabbitMQ publisher is ready")
+        self._publish_pending()
+
+    def _on_delivery_confirmation(self, frame):
+        method = frame.method
+        acked = isinstance(method, pika.spec.Basic.Ack)
+        confirmed_at = time.perf_counter()
+
+        # the broker confirms many messages at once with the multiple flag
+        if method.multiple:
+            delivery_tags = [tag for tag in self._unconfirmed if tag <= method.delivery_tag]
+        else:
+            delivery_tags = [method.delivery_tag]
+
+        for delivery_tag in delivery_tags:
+            message = self._unconfirmed.pop(delivery_tag, None)
+
+            if message is None:
+                continue
+
+            if acked:
+                self.stats.record_confirmed(confirmed_at - message[2])
+                if message[3] is not None:
+                    message[3].confirm()
+            else:
+                self.stats.record_nacked()
+                self._retry.append(message)
+
+        self._publish_pending()
+
+    def _close(self):
+        if self._connection is not None and self._connection.is_open:
+            self._connection.close()
+
+
+rabbitmq = RabbitMQ()
 
 
 def get_rabbitmq():
-    rabbitmq = RabbitMQ()
-    try:
-        yield rabbitmq
-    finally:
-        rabbitmq.close() 
+    return rabbitmq
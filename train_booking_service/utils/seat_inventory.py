@@ -0,0 +1,324 @@
+from contextlib import contextmanager, ExitStack
+from db.models import Booking, Train
+from sqlalchemy import select, update
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from utils.redis_cache import CacheBatch, get_redis_client
+from utils.train_events import add_event, booking_registered
+
+import redis
+import threading
+import os
+
+SEAT_INVENTORY_MODE = os.getenv('SEAT_INVENTORY_MODE', 'database')
+
+TRAIN_NOT_LOADED = -3
+ALREADY_BOOKED = -2
+NO_SEATS_LEFT = -1
+
+# KEYS: seats counter, booked users set, pending bookings list (all in one hash slot)
+RESERVE_SEAT_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 0 then
+    return -3
+end
+if redis.call('SISMEMBER', KEYS[2], ARGV[1]) == 1 then
+    return -2
+end
+if tonumber(redis.call('GET', KEYS[1])) <= 0 then
+    return -1
+end
+redis.call('SADD', KEYS[2], ARGV[1])
+redis.call('RPUSH', KEYS[3], ARGV[1])
+return redis.call('DECR', KEYS[1])
+"""
+
+RELEASE_SEAT_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 0 then
+    return -3
+end
+redis.call('SREM', KEYS[2], ARGV[1])
+redis.call('LREM', KEYS[3], 1, ARGV[1])
+return redis.call('INCR', KEYS[1])
+"""
+
+# ARGV: seats stored in Postgres, followed by the users already booked in Postgres
+LOAD_TRAIN_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 1 then
+    return 0
+end
+for i = 2, #ARGV do
+    redis.call('SADD', KEYS[2], ARGV[i])
+end
+redis.call('SET', KEYS[1], tonumber(ARGV[1]) - redis.call('LLEN', KEYS[3]))
+return 1
+"""
+
+
+class SeatInventory:
+
+    flush_batch_size = int(os.getenv('INVENTORY_FLUSH_BATCH', 500))
+
+    def __init__(self, redis_cache: redis.RedisCluster):
+        self.redis_cache = redis_cache
+        self.reserve_seat_script = redis_cache.register_script(RESERVE_SEAT_SCRIPT)
+        self.release_seat_script = redis_cache.register_script(RELEASE_SEAT_SCRIPT)
+        self.load_train_script = redis_cache.register_script(LOAD_TRAIN_SCRIPT)
+
+    def reserve(self, train_id: int, user_credentials: str, db: Session):
+        result = self.reserve_seat_script(keys=self._keys(train_id), args=[user_credentials])
+
+        if result == TRAIN_NOT_LOADED:
+            if not self.load(train_id, db):
+                return TRAIN_NOT_LOADED
+            result = self.reserve_seat_script(keys=self._keys(train_id), args=[user_credentials])
+
+        if result >= 0:
+            seat_inventory_flusher.mark_dirty(train_id)
+
+        return result
+
+    def reserve_all(self, bookings: list, db: Session):
+        # the flusher takes the same train locks, so none of the reservations can reach Postgres
+        # before the whole batch is known to fit, and a batch that does not is taken back entirely
+        with ExitStack() as train_locks:
+            for train_id in sorted({train_id for train_id, _ in bookings}):
+                train_locks.enter_context(self._train_lock(train_id))
+
+            results = [self._reserve(train_id, user_credentials, db) for train_id, user_credentials in bookings]
+
+            if any(result < 0 for result in results):
+                for (train_id, user_credentials), result in zip(bookings, results):
+                    if result >= 0:
+                        self.release_seat_script(keys=self._keys(train_id), args=[user_credentials])
+
+                return results
+
+        for train_id, _ in bookings:
+            seat_inventory_flusher.mark_dirty(train_id)
+
+        return results
+
+    def release(self, train_id: int, user_credentials: str):
+        # a reservation that was not flushed yet is dropped from the pending list, which must
+        # not happen while the flusher is between reading and trimming that list
+        with self._train_lock(train_id):
+            return self.release_seat_script(keys=self._keys(train_id), args=[user_credentials])
+
+    def load(self, train_id: int, db: Session):
+        with self._train_lock(train_id):
+            return self._load(train_id, db)
+
+    def flush(self, train_id: int, db: Session):
+        with self._train_lock(train_id):
+            return self._flush_pending(train_id, db)
+
+    def evict(self, train_id: int, db: Session):
+        with self._train_lock(train_id):
+            self._evict(train_id, db)
+
+    @contextmanager
+    def evicted(self, train_id: int, db: Session):
+        # the train stays locked until the caller committed its own change to it, a reservation
+        # that reloaded the counter in between would read the rows that are being changed
+        with self._train_lock(train_id):
+            self._evict(train_id, db)
+            yield
+
+    def loaded_train_ids(self):
+        train_ids = set()
+
+        for key in self.redis_cache.scan_iter(match='seat_inventory:*'):
+            key = key.decode() if isinstance(key, bytes) else key
+            train_ids.add(int(key.split('{')[1].split('}')[0]))
+
+        return train_ids
+
+    def _reserve(self, train_id: int, user_credentials: str, db: Session):
+        result = self.reserve_seat_script(keys=self._keys(train_id), args=[user_credentials])
+
+        if result == TRAIN_NOT_LOADED:
+            if not self._load(train_id, db):
+                return TRAIN_NOT_LOADED
+            result = self.reserve_seat_script(keys=self._keys(train_id), args=[user_credentials])
+
+        return result
+
+    def _load(self, train_id: int, db: Session):
+        available_seats = db.execute(
+            select(Train.available_seats).where(Train.id == train_id)).scalar_one_or_none()
+
+        if available_seats is None:
+            return False
+
+        booked_users = db.execute(
+            select(Booking.user_credentials).where(Booking.train_id == train_id)).scalars().all()
+        db.rollback()
+
+        self.load_train_script(keys=self._keys(train_id), args=[available_seats, *booked_users])
+
+        return True
+
+    def _evict(self, train_id: int, db: Session):
+        # pending bookings are persisted before the counter is dropped, the next reservation
+        # then reloads the train from Postgres
+        seats_key, users_key, pending_key = self._keys(train_id)
+        self.redis_cache.delete(seats_key)
+
+        while self._flush_pending(train_id, db):
+            pass
+
+        self.redis_cache.delete(users_key)
+
+    def _flush_pending(self, train_id: int, db: Session):
+        seats_key, users_key, pending_key = self._keys(train_id)
+        pending_users = [user.decode() for user in self.redis_cache.lrange(pending_key, 0, self.flush_batch_size - 1)]
+
+        if not pending_users:
+            return 0
+
+        counter_is_stale = False
+        try:
+            inserted_bookings = self._persist(train_id, pending_users, db)
+        except IntegrityError as err:
+            db.rollback()
+
+            # the counter ran ahead of the train row, the reservations that still fit are kept, the
+            # others dropped instead of failing every round, and the train is reloaded from Postgres
+            available_seats = db.execute(
+                select(Train.available_seats).where(Train.id == train_id).with_for_update()).scalar_one_or_none()
+            kept_users = pending_users[:available_seats or 0]
+            print(f"Dropped {len(pending_users) - len(kept_users)} reservations of train {train_id} "
+                  f"that no longer fit into it: {err.orig}")
+
+            inserted_bookings = self._persist(train_id, kept_users, db) if kept_users else []
+            counter_is_stale = True
+        db.commit()
+
+        with CacheBatch(self.redis_cache) as cache_batch:
+            cache_batch.pipeline.ltrim(pending_key, len(pending_users), -1)
+            if counter_is_stale:
+                cache_batch.pipeline.delete(seats_key)
+                cache_batch.pipeline.delete(users_key)
+            cache_batch.invalidate_list_cache('bookings')
+            cache_batch.evict_entities(f"train:{train_id}")
+            # ids of the new bookings may still be cached as missing
+            cache_batch.evict_entities(*[f"booking:{booking_id}" for _, booking_id in inserted_bookings])
+
+        return len(pending_users)
+
+    def _persist(self, train_id: int, users: list, db: Session):
+        # a batch that was persisted but not trimmed before a crash is simply skipped by the
+        # unique index on (train_id, user_credentials), so retries never double count seats
+        inserted_bookings = db.execute(
+            insert(Booking)
+            .values([{"train_id": train_id, "user_credentials": user} for user in users])
+            .on_conflict_do_nothing(index_elements=['train_id', 'user_credentials'])
+            .returning(Booking.user_credentials, Booking.id)
+        ).all()
+        inserted_users = [user_credentials for user_credentials, _ in inserted_bookings]
+
+        if inserted_users:
+            available_seats = db.execute(
+                update(Train)
+                .where(Train.id == train_id)
+                .values(available_seats=Train.available_seats - len(inserted_users))
+                .returning(Train.available_seats)
+            ).scalar_one()
+
+            # the bookings are announced in the order they were reserved, once they are persisted
+            for i, user_credentials in enumerate(inserted_users):
+                add_event(db, booking_registered(
+                    train_id, user_credentials, available_seats + len(inserted_users) - i - 1))
+
+        return inserted_bookings
+
+    def _train_lock(self, train_id: int):
+        return self.redis_cache.lock(f"seat_inventory:{{{train_id}}}:lock", timeout=30, blocking_timeout=10)
+
+    def _keys(self, train_id: int):
+        return [f"seat_inventory:{{{train_id}}}:seats",
+                f"seat_inventory:{{{train_id}}}:users",
+                f"seat_inventory:{{{train_id}}}:pending"]
+
+
+class SeatInventoryFlusher:
+
+    flush_interval = float(os.getenv('INVENTORY_FLUSH_INTERVAL', 0.5))
+    reconcile_interval = float(os.getenv('INVENTORY_RECONCILE_INTERVAL', 300))
+
+    def __init__(self):
+        self._dirty_trains = set()
+        self._lock = threading.Lock()
+        self._stop_flushing = threading.Event()
+        self._flusher = None
+
+    def mark_dirty(self, train_id: int):
+        with self._lock:
+            self._dirty_trains.add(train_id)
+
+    def start(self, get_master_session):
+        if self._flusher is not None:
+            return
+
+        self._stop_flushing.clear()
+        self._flusher = threading.Thread(
+            target=self._flush_periodically, args=(get_master_session,), daemon=True)
+        self._flusher.start()
+
+    def stop(self):
+        self._stop_flushing.set()
+        self._flusher = None
+
+    def flush(self, seat_inventory: SeatInventory, get_master_session):
+        with self._lock:
+            dirty_trains, self._dirty_trains = self._dirty_trains, set()
+
+        for train_id in dirty_trains:
+            try:
+                with get_master_session() as db:
+                    if seat_inventory.flush(train_id, db):
+                        # more than one batch may be waiting, keep the train for the next round
+                        self.mark_dirty(train_id)
+            except Exception as err:
+                print(f"Could not flush seat inventory of train {train_id}: {err}")
+                self.mark_dirty(train_id)
+
+    def reconcile(self, seat_inventory: SeatInventory, get_master_session):
+        # persists what crashed instances left behind and drops the counters, so every hot
+        # train is reloaded from Postgres on its next reservation
+        for train_id in seat_inventory.loaded_train_ids():
+            try:
+                with get_master_session() as db:
+                    seat_inventory.evict(train_id, db)
+            except Exception as err:
+                print(f"Could not reconcile seat inventory of train {train_id}: {err}")
+
+    def _flush_periodically(self, get_master_session):
+        seat_inventory = None
+        rounds_per_reconcile = max(int(self.reconcile_interval / self.flush_interval), 1)
+        rounds = 0
+
+        while not self._stop_flushing.wait(self.flush_interval):
+            try:
+                if seat_inventory is None:
+                    seat_inventory = SeatInventory(get_redis_client())
+
+                if rounds % rounds_per_reconcile == 0:
+                    self.reconcile(seat_inventory, get_master_session)
+
+                self.flush(seat_inventory, get_master_session)
+            except Exception as err:
+                print(f"Seat inventory flusher failed: {err}")
+
+            rounds += 1
+
+
+seat_inventory_flusher = SeatInventoryFlusher()
+
+
+def get_seat_inventory(redis_cache: redis.RedisCluster):
+    if SEAT_INVENTORY_MODE != 'redis':
+        return None
+
+    return SeatInventory(redis_cache)
@@ -0,0 +1,183 @@
+# Generated by the gRPC Python protocol compiler plugin. DO NOT EDIT!
+"""Client and server classes corresponding to protobuf-defined services."""
+import grpc
+import warnings
+
+from utils import service_discovery_pb2 as utils_dot_service__discovery__pb2
+
+GRPC_GENERATED_VERSION = '1.66.2'
+GRPC_VERSION = grpc.__version__
+_version_not_supported = False
+
+try:
+    from grpc._utilities import first_version_is_lower
+    _version_not_supported = first_version_is_lower(GRPC_VERSION, GRPC_GENERATED_VERSION)
+except ImportError:
+    _version_not_supported = True
+
+if _version_not_supported:
+    raise RuntimeError(
+        f'The grpc package installed is at version {GRPC_VERSION},'
+        + f' but the generated code in utils/service_discovery_pb2_grpc.py depends on'
+        + f' grpcio>={GRPC_GENERATED_VERSION}.'
+        + f' Please upgrade your grpc module to grpcio>={GRPC_GENERATED_VERSION}'
+        + f' or downgrade your generated code using grpcio-tools<={GRPC_VERSION}.'
+    )
+
+
+class ServiceDiscoveryStub(object):
+    """Missing associated documentation comment in .proto file."""
+
+    def __init__(self, channel):
+        """Constructor.
+
+        Args:
+            channel: A grpc.Channel.
+        """
+        self.Register = channel.unary_unary(
+                '/service_discovery.ServiceDiscovery/Register',
+                request_serializer=utils_dot_service__discovery__pb2.ServiceRegisterRequest.SerializeToString,
+                response_deserializer=utils_dot_service__discovery__pb2.ServiceRegisterResponse.FromString,
+                _registered_method=True)
+        self.Heartbeat = channel.unary_unary(
+                '/service_discovery.ServiceDiscovery/Heartbeat',
+                request_serializer=utils_dot_service__discovery__pb2.ServiceHeartbeatRequest.SerializeToString,
+                response_deserializer=utils_dot_service__discovery__pb2.ServiceRegisterResponse.FromString,
+                _registered_method=True)
+        self.Deregister = channel.unary_unary(
+                '/service_discovery.ServiceDiscovery/Deregister',
+                request_serializer=utils_dot_service__discovery__pb2.ServiceRegisterRequest.SerializeToString,
+                response_deserializer=utils_dot_service__discovery__pb2.ServiceRegisterResponse.FromString,
+                _registered_method=True)
+
+
+class ServiceDiscoveryServicer(object):
+    """Missing associated documentation comment in .proto file."""
+
+    def Register(self, request, context):
+        """Missing associated documentation comment in .proto file."""
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
+    def Heartbeat(self, request, context):
+        """Missing associated documentation comment in .proto file."""
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
+    def Deregister(self, request, context):
+        """Missing associated documentation comment in .proto file."""
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
+
+def add_ServiceDiscoveryServicer_to_server(servicer, server):
+    rpc_method_handlers = {
+            'Register': grpc.unary_unary_rpc_method_handler(
+                    servicer.Register,
+                    request_deserializer=utils_dot_service__discovery__pb2.ServiceRegisterRequest.FromString,
+                    response_serializer=utils_dot_service__discovery__pb2.ServiceRegisterResponse.SerializeToString,
+            ),
+            'Heartbeat': grpc.unary_unary_rpc_method_handler(
+                    servicer.Heartbeat,
+                    request_deserializer=utils_dot_service__discovery__pb2.ServiceHeartbeatRequest.FromString,
+                    response_serializer=utils_dot_service__discovery__pb2.ServiceRegisterResponse.SerializeToString,
+            ),
+            'Deregister': grpc.unary_unary_rpc_method_handler(
+                    servicer.Deregister,
+                    request_deserializer=utils_dot_service__discovery__pb2.ServiceRegisterRequest.FromString,
+                    response_serializer=utils_dot_service__discovery__pb2.ServiceRegisterResponse.SerializeToString,
+            ),
+    }
+    generic_handler = grpc.method_handlers_generic_handler(
+            'service_discovery.ServiceDiscovery', rpc_method_handlers)
+    server.add_generic_rpc_handlers((generic_handler,))
+    server.add_registered_method_handlers('service_discovery.ServiceDiscovery', rpc_method_handlers)
+
+
+ # This class is part of an EXPERIMENTAL API.
+class ServiceDiscovery(object):
+    """Missing associated documentation comment in .proto file."""
+
+    @staticmethod
+    def Register(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_unary(
+            request,
+            target,
+            '/service_discovery.ServiceDiscovery/Register',
+            utils_dot_service__discovery__pb2.ServiceRegisterRequest.SerializeToString,
+            utils_dot_service__discovery__pb2.ServiceRegisterResponse.FromString,
+            options,
+            channel_credentials,
+            insecure,
+            call_credentials,
+            compression,
+            wait_for_ready,
+            timeout,
+            metadata,
+            _registered_method=True)
+
+    @staticmethod
+    def Heartbeat(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_unary(
+            request,
+            target,
+            '/service_discovery.ServiceDiscovery/Heartbeat',
+            utils_dot_service__discovery__pb2.ServiceHeartbeatRequest.SerializeToString,
+            utils_dot_service__discovery__pb2.ServiceRegisterResponse.FromString,
+            options,
+            channel_credentials,
+            insecure,
+            call_credentials,
+            compression,
+            wait_for_ready,
+            timeout,
+            metadata,
+            _registered_method=True)
+
+    @staticmethod
+    def Deregister(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_unary(
+            request,
+            target,
+            '/service_discovery.ServiceDiscovery/Deregister',
+            utils_dot_service__discovery__pb2.ServiceRegisterRequest.SerializeToString,
+            utils_dot_service__discovery__pb2.ServiceRegisterResponse.FromString,
+            options,
+            channel_credentials,
+            insecure,
+            call_credentials,
+            compression,
+            wait_for_ready,
+            timeout,
+            metadata,
+            _registered_method=True)
@@ -0,0 +1,129 @@
+from collections import deque
+from db.database import engine_registry
+from typing import Callable
+from utils.service_discovery_pb2 import ServiceHeartbeatRequest, ServiceLoad, ServiceRegisterRequest
+from utils.service_discovery_pb2_grpc import ServiceDiscoveryStub
+
+import asyncio
+import socket
+import time
+import grpc
+import os
+
+HEARTBEAT_INTERVAL = float(os.getenv('HEARTBEAT_INTERVAL', 5))
+HEARTBEAT_TIMEOUT = float(os.getenv('HEARTBEAT_TIMEOUT', 2))
+LOAD_LATENCY_WINDOW = float(os.getenv('LOAD_LATENCY_WINDOW', 30))
+LOAD_LATENCY_SAMPLES = int(os.getenv('LOAD_LATENCY_SAMPLES', 10000))
+LOOP_LAG_INTERVAL = float(os.getenv('LOOP_LAG_INTERVAL', 0.5))
+
+
+class LoadTracker:
+
+    # only touched from the event loop, by the load middleware and the lag probe
+    def __init__(self):
+        self.in_flight = 0
+        self.loop_lag = 0.0
+        self._latencies = deque(maxlen=LOAD_LATENCY_SAMPLES)
+
+    def request_started(self):
+        self.in_flight += 1
+
+    def request_finished(self, latency: float):
+        self.in_flight -= 1
+        self._latencies.append((time.monotonic(), latency))
+
+    def latency_percentiles(self):
+        window_start = time.monotonic() - LOAD_LATENCY_WINDOW
+        while self._latencies and self._latencies[0][0] < window_start:
+            self._latencies.popleft()
+
+        if not self._latencies:
+            return 0.0, 0.0
+
+        latencies = sorted(latency for _, latency in self._latencies)
+        return latencies[int(0.5 * (len(latencies) - 1))], latencies[int(0.99 * (len(latencies) - 1))]
+
+    async def measure_loop_lag(self):
+        # a sleep that wakes up late means callbacks were queued behind blocking work on the loop
+        while True:
+            started = time.perf_counter()
+            await asyncio.sleep(LOOP_LAG_INTERVAL)
+            self.loop_lag = max(time.perf_counter() - started - LOOP_LAG_INTERVAL, 0.0)
+
+
+class ServiceRegistry:
+
+    sd_host = os.getenv('SD_HOST')
+    sd_port = os.getenv('SD_PORT')
+
+    def __init__(self, load: LoadTracker, db_pool_saturation: Callable[[], float]):
+        self.load = load
+        self.db_pool_saturation = db_pool_saturation
+
+        self.name = os.getenv('SERVICE_NAME')
+        self.address = None
+        self.port = int(os.getenv('SERVICE_PORT', 8000))
+
+        self._channel = None
+        self._stub = None
+        self._heartbeats = None
+        self._lag_probe = None
+
+    async def start(self):
+        if self.sd_host is None or self._heartbeats is not None:
+            return
+
+        self.address = socket.gethostbyname(socket.gethostname())
+
+        # one channel for the lifetime of the process, it reconnects on its own
+        self._channel = grpc.aio.insecure_channel(f"{self.sd_host}:{self.sd_port}")
+        self._stub = ServiceDiscoveryStub(self._channel)
+
+        self._lag_probe = asyncio.create_task(self.load.measure_loop_lag())
+        self._heartbeats = asyncio.create_task(self._send_heartbeats())
+
+    async def stop(self):
+        if self._heartbeats is None:
+            return
+
+        self._heartbeats.cancel()
+        self._lag_probe.cancel()
+        self._heartbeats = None
+
+        try:
+            await self._stub.Deregister(ServiceRegisterRequest(name=self.name, address=self.address, port=self.port),
+                                        timeout=HEARTBEAT_TIMEOUT)
+        except grpc.aio.AioRpcError as err:
+            print(f"Could not deregister from service discovery: {err.code()}")
+
+        await self._channel.close()
+
+    def heartbeat_request(self):
+        latency_p50, latency_p99 = self.load.latency_percentiles()
+
+        try:
+            db_pool_saturation = self.db_pool_saturation()
+        except Exception:
+            db_pool_saturation = 0.0
+
+        return ServiceHeartbeatRequest(name=self.name, address=self.address, port=self.port, load=ServiceLoad(
+            in_flight=self.load.in_flight, loop_lag_ms=self.load.loop_lag * 1000,
+            latency_p50_ms=latency_p50 * 1000, latency_p99_ms=latency_p99 * 1000,
+            db_pool_saturation=db_pool_saturation))
+
+    async def _send_heartbeats(self):
+        # the first heartbeat registers the replica, later ones keep its entry from expiring
+        while True:
+            try:
+                response = await self._stub.Heartbeat(self.heartbeat_request(), timeout=HEARTBEAT_TIMEOUT)
+                if not response.success:
+                    print(f"Service discovery rejected heartbeat: {response.message}")
+            except grpc.aio.AioRpcError as err:
+                print(f"Could not send heartbeat to service discovery: {err.code()}")
+
+            await asyncio.sleep(HEARTBEAT_INTERVAL)
+
+
+load_tracker = LoadTracker()
+
+service_registry = ServiceRegistry(load_tracker, engine_registry.pool_saturation)
@@ -0,0 +1,45 @@
+from db.models import OutboxEvent
+from sqlalchemy.orm import Session
+from utils.event_codec import encode_event
+from typing import Optional
+from utils.train_events_pb2 import EventType, TrainChange, TrainEvent
+
+import time
+
+
+def add_event(db: Session, event: TrainEvent):
+    # written in the transaction of the change itself and relayed to the exchange after the commit,
+    # the outbox id becomes the sequence number of the event
+    event.timestamp_ms = int(time.time() * 1000)
+    db.add(OutboxEvent(routing_key=str(event.train_id), payload=encode_event(event)))
+
+
+def booking_registered(train_id: int, user_credentials: str, available_seats: int):
+    return TrainEvent(type=EventType.BOOKINGS_REGISTERED, train_id=train_id, user_credentials=user_credentials,
+                      available_seats=available_seats, booked_seats=1)
+
+
+def bookings_registered(train_id: int, booked_seats: int, available_seats: int):
+    return TrainEvent(type=EventType.BOOKINGS_REGISTERED, train_id=train_id,
+                      available_seats=available_seats, booked_seats=booked_seats)
+
+
+def booking_cancelled(train_id: int, user_credentials: str, available_seats: int):
+    return TrainEvent(type=EventType.BOOKING_CANCELLED, train_id=train_id, user_credentials=user_credentials,
+                      available_seats=available_seats, booked_seats=-1)
+
+
+def train_updated(train_id: int, changes: dict):
+    return TrainEvent(type=EventType.TRAIN_UPDATED, train_id=train_id, changes=[
+        TrainChange(field=field, old_value=str(old_value), new_value=str(new_value))
+        for field, (old_value, new_value) in changes.items()])
+
+
+def train_removed(train_id: int):
+    return TrainEvent(type=EventType.TRAIN_REMOVED, train_id=train_id)
+
+
+def booking_processed(train_id: int, ticket_id: str, user_credentials: str, booking_id: Optional[int] = None,
+                      error: Optional[str] = None):
+    return TrainEvent(type=EventType.BOOKING_PROCESSED, train_id=train_id, ticket_id=ticket_id,
+                      user_credentials=user_credentials, booking_id=booking_id or 0, error=error or "")
@@ -0,0 +1,40 @@
+# -*- coding: utf-8 -*-
+# Generated by the protocol buffer compiler.  DO NOT EDIT!
+# NO CHECKED-IN PROTOBUF GENCODE
+# source: train_events.proto
+# Protobuf Python Version: 5.27.2
+"""Generated protocol buffer code."""
+from google.protobuf import descriptor as _descriptor
+from google.protobuf import descriptor_pool as _descriptor_pool
+from google.protobuf import runtime_version as _runtime_version
+from google.protobuf import symbol_database as _symbol_database
+from google.protobuf.internal import builder as _builder
+_runtime_version.ValidateProtobufRuntimeVersion(
+    _runtime_version.Domain.PUBLIC,
+    5,
+    27,
+    2,
+    '',
+    'train_events.proto'
+)
+# @@protoc_insertion_point(imports)
+
+_sym_db = _symbol_database.Default()
+
+
+
+
+DESCRIPTOR = _descriptor_pool.Default().AddSerializedFile(b'\n\x12train_events.proto\x12\x0ctrain_events\"B\n\x0bTrainChange\x12\r\n\x05\x66ield\x18\x01 \x01(\t\x12\x11\n\told_value\x18\x02 \x01(\t\x12\x11\n\tnew_value\x18\x03 \x01(\t\"\xa9\x02\n\nTrainEvent\x12\x0f\n\x07version\x18\x01 \x01(\r\x12%\n\x04type\x18\x02 \x01(\x0e\x32\x17.train_events.EventType\x12\x10\n\x08train_id\x18\x03 \x01(\x03\x12\x10\n\x08sequence\x18\x04 \x01(\x04\x12\x14\n\x0ctimestamp_ms\x18\x05 \x01(\x03\x12\x17\n\x0f\x61vailable_seats\x18\x06 \x01(\x05\x12\x14\n\x0c\x62ooked_seats\x18\x07 \x01(\x05\x12\x18\n\x10user_credentials\x18\x08 \x01(\t\x12*\n\x07\x63hanges\x18\t \x03(\x0b\x32\x19.train_events.TrainChange\x12\x11\n\tticket_id\x18\n \x01(\t\x12\x12\n\nbooking_id\x18\x0b \x01(\x03\x12\r\n\x05\x65rror\x18\x0c \x01(\t*\x94\x01\n\tEventType\x12\x1a\n\x16\x45VENT_TYPE_UNSPECIFIED\x10\x00\x12\x17\n\x13\x42OOKINGS_REGISTERED\x10\x01\x12\x15\n\x11\x42OOKING_CANCELLED\x10\x02\x12\x11\n\rTRAIN_UPDATED\x10\x03\x12\x11\n\rTRAIN_REMOVED\x10\x04\x12\x15\n\x11\x42OOKING_PROCESSED\x10\x05\x62\x06proto3')
+
+_globals = globals()
+_builder.BuildMessageAndEnumDescriptors(DESCRIPTOR, _globals)
+_builder.BuildTopDescriptorsAndMessages(DESCRIPTOR, 'train_events_pb2', _globals)
+if not _descriptor._USE_C_DESCRIPTORS:
+  DESCRIPTOR._loaded_options = None
+  _globals['_EVENTTYPE']._serialized_start=405
+  _globals['_EVENTTYPE']._serialized_end=553
+  _globals['_TRAINCHANGE']._serialized_start=36
+  _globals['_TRAINCHANGE']._serialized_end=102
+  _globals['_TRAINEVENT']._serialized_start=105
+  _globals['_TRAINEVENT']._serialized_end=402
+# @@protoc_insertion_point(module_scope)
@@ -0,0 +1,46 @@
+from fastapi import HTTPException, Request
+
+import json
+import csv
+
+
+async def read_train_rows(request: Request):
+    # rows are parsed while the body is still being received, nothing holds the whole file
+    lines = read_lines(request)
+
+    if 'csv' in request.headers.get('content-type', ''):
+        header = None
+
+        async for line in lines:
+            if not line.strip():
+                continue
+
+            values = next(csv.reader([line]))
+
+            if header is None:
+                header = [column.strip() for column in values]
+            else:
+                yield dict(zip(header, values))
+    else:
+        async for line in lines:
+            if not line.strip():
+                continue
+
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError as err:
+                raise HTTPException(status_code=400, detail=f"Invalid NDJSON row: {err}")
+
+
+async def read_lines(request: Request):
+    buffer = b''
+
+    async for chunk in request.stream():
+        buffer += chunk
+        *lines, buffer = buffer.split(b'\n')
+
+        for line in lines:
+            yield line.decode().rstrip('\r')
+
+    if buffer:
+        yield buffer.decode().rstrip('\r')